@@ -1,72 +1,169 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context
 from flask_cors import CORS, cross_origin
 import os
 import joblib
 import traceback
 import json
-from datetime import datetime
+import sqlite3
+import atexit
+import contextlib
+import csv
+import io
+import itertools
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from history_store import HistoryStore
+from history_writer import HistoryWriter
+from prediction_cache import PredictionCache
+from fast_scorer import compile_scorer
+from micro_batcher import MicroBatcher
+import pattern_engine
+from model_bundle import load_bundle, read_manifest, MANIFEST_NAME
+from artifact_store import (
+    ALT_MODEL_NAMES, ALT_VECT_NAMES, MODEL_BUNDLE_AUTOEXPORT, MODEL_BUNDLE_DIR, MODEL_PATH, VECT_PATH,
+    WARMUP_MESSAGES, WORKSPACE_ROOT, artifact_version, export_artifact_bundle, find_artifact_paths,
+)
+import artifact_store
+from artifact_watcher import ArtifactWatcher
+from campaign_index import CampaignIndex
+from sender_reputation import SenderReputation
+import url_extractor
+import explainer
+from online_learner import OnlineLearner
+from metrics import Registry, RequestTimer, Sample, SlowRequestProfiler
 
 APP_DIR = os.path.dirname(__file__)
-# Allow overriding paths via environment variables
-# Define primary and alternative model/vectorizer paths
-MODEL_PATH = os.path.join(APP_DIR, 'spam_detector_model.pkl')
-VECT_PATH = os.path.join(APP_DIR, 'tfidf_vectorizer.pkl')
-# Fallback to alternative filenames if primary not found
-ALT_MODEL_NAMES = ['model.pkl', 'spam_detector.pkl']
-ALT_VECT_NAMES = ['vectorizer.pkl', 'tfidf_vectorizer.pkl']
-
-# Also check workspace root for artifacts or a dataset
-WORKSPACE_ROOT = os.path.abspath(os.path.join(APP_DIR, '..'))
+# Model/vectorizer paths, the bundle directory (MODEL_BUNDLE_DIR) and MODEL_BUNDLE_AUTOEXPORT are
+# defined in artifact_store.py; serve.py and bulk_score.py override MODEL_BUNDLE_AUTOEXPORT here.
+# Also check workspace root for a dataset
 DATASET_PATH = os.path.join(APP_DIR, 'SPAM_SMS.csv')
+# Legacy rewrite-whole-file history; imported into the history store on first start
 HISTORY_PATH = os.path.join(APP_DIR, 'history.json')
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', os.path.join(APP_DIR, 'history.sqlite3'))
+HISTORY_MAX_ENTRIES = int(os.environ.get('HISTORY_MAX_ENTRIES', 200))
+HISTORY_COMPACT_EVERY = int(os.environ.get('HISTORY_COMPACT_EVERY', 100))
+# Largest page GET /history returns, and rows per chunk of the streamed CSV export
+HISTORY_PAGE_MAX = int(os.environ.get('HISTORY_PAGE_MAX', 1000))
+# How long /history/stats keeps per-minute and per-hour buckets
+HISTORY_STATS_MINUTES = int(os.environ.get('HISTORY_STATS_MINUTES', 24 * 60))
+HISTORY_STATS_HOURS = int(os.environ.get('HISTORY_STATS_HOURS', 30 * 24))
+HISTORY_EXPORT_CHUNK = 500
+HISTORY_LABELS = ('Spam', 'Not Spam')
+# Write-behind queue settings: history is persisted off the request path unless HISTORY_ASYNC=0
+HISTORY_ASYNC = os.environ.get('HISTORY_ASYNC', '1').lower() not in ('0', 'false')
+HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 100))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 0.5))
+HISTORY_OVERFLOW = os.environ.get('HISTORY_OVERFLOW', 'drop_oldest')
+# Prediction cache for repeated campaign texts (PREDICTION_CACHE_SIZE=0 disables it)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_MAX_BYTES = int(os.environ.get('PREDICTION_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+PREDICTION_CACHE_MASK_DIGITS = os.environ.get('PREDICTION_CACHE_MASK_DIGITS', '0').lower() in ('1', 'true')
+# Native linear scorer for LogisticRegression artifacts (FAST_SCORER=0 forces sklearn).
+# Above FAST_SCORER_MAX_BATCH messages sklearn's vectorized transform is faster.
+FAST_SCORER = os.environ.get('FAST_SCORER', '1').lower() not in ('0', 'false')
+FAST_SCORER_MAX_BATCH = int(os.environ.get('FAST_SCORER_MAX_BATCH', 64))
+# Coalesce concurrent single-message predictions into one sklearn call (MICRO_BATCH=0 disables).
+# Batches hold up to MICRO_BATCH_MAX messages; under load the batch waits up to MICRO_BATCH_WAIT_MS to fill.
+MICRO_BATCH = os.environ.get('MICRO_BATCH', '1').lower() not in ('0', 'false')
+MICRO_BATCH_MAX = int(os.environ.get('MICRO_BATCH_MAX', 64))
+MICRO_BATCH_WAIT_MS = float(os.environ.get('MICRO_BATCH_WAIT_MS', 2.0))
+# Near-duplicate campaign index (CAMPAIGN_INDEX=0 disables). With CAMPAIGN_SHORT_CIRCUIT=1 (off by default,
+# since it replaces the message's own model score), messages matching a campaign with a confident model
+# verdict reuse that verdict instead of running the model.
+CAMPAIGN_INDEX = os.environ.get('CAMPAIGN_INDEX', '1').lower() not in ('0', 'false')
+CAMPAIGN_MAX = int(os.environ.get('CAMPAIGN_MAX', 10000))
+CAMPAIGN_THRESHOLD = float(os.environ.get('CAMPAIGN_THRESHOLD', 0.6))
+CAMPAIGN_SHORT_CIRCUIT = os.environ.get('CAMPAIGN_SHORT_CIRCUIT', '0').lower() in ('1', 'true')
+# Sender reputation keyed on hashed_celphone_number (SENDER_REPUTATION=0 disables). Senders with at least
+# SENDER_FAST_PATH_MIN_COUNT messages that are nearly all spam skip text scoring (SENDER_FAST_PATH=0 disables);
+# SENDER_REPUTATION_WEIGHT > 0 blends the reputation into model probabilities as an extra log-odds feature.
+SENDER_REPUTATION = os.environ.get('SENDER_REPUTATION', '1').lower() not in ('0', 'false')
+SENDER_REPUTATION_PATH = os.environ.get('SENDER_REPUTATION_PATH', os.path.join(APP_DIR, 'sender_reputation.npz'))
+SENDER_REPUTATION_MAX = int(os.environ.get('SENDER_REPUTATION_MAX', 100000))
+SENDER_HALF_LIFE_DAYS = float(os.environ.get('SENDER_HALF_LIFE_DAYS', 30))
+SENDER_FAST_PATH = os.environ.get('SENDER_FAST_PATH', '1').lower() not in ('0', 'false')
+SENDER_FAST_PATH_MIN_COUNT = int(os.environ.get('SENDER_FAST_PATH_MIN_COUNT', 20))
+SENDER_REPUTATION_WEIGHT = float(os.environ.get('SENDER_REPUTATION_WEIGHT', 0))
+SENDER_REPUTATION_SAVE_INTERVAL = float(os.environ.get('SENDER_REPUTATION_SAVE_INTERVAL', 60))
+# serve.py turns saving off in prefork workers: each keeps its own index, and every save would
+# overwrite the others' with the last writer's view
+SENDER_REPUTATION_PERSIST = True
+# URLs found in a message, with domain blocklist hits, are added to prediction responses (URL_EXTRACTION=0
+# disables). The blocklist file is url_extractor.DOMAIN_BLOCKLIST_PATH and is re-read when it changes.
+URL_EXTRACTION = os.environ.get('URL_EXTRACTION', '1').lower() not in ('0', 'false')
+# Terms listed per direction (spam / not spam) when a prediction request asks for `explain`
+EXPLAIN_TOP_K = int(os.environ.get('EXPLAIN_TOP_K', 5))
+# Online learning (ONLINE_LEARNING=1): serve a HashingVectorizer + SGDClassifier model that learns from
+# POST /feedback in mini-batches of ONLINE_BATCH_SIZE (applied at least every ONLINE_UPDATE_INTERVAL
+# seconds) and is snapshotted to ONLINE_SNAPSHOT_PATH every ONLINE_SNAPSHOT_INTERVAL seconds.
+ONLINE_LEARNING = os.environ.get('ONLINE_LEARNING', '0').lower() in ('1', 'true')
+ONLINE_SNAPSHOT_PATH = os.environ.get('ONLINE_SNAPSHOT_PATH', os.path.join(APP_DIR, 'online_model.joblib'))
+ONLINE_BATCH_SIZE = int(os.environ.get('ONLINE_BATCH_SIZE', 32))
+ONLINE_UPDATE_INTERVAL = float(os.environ.get('ONLINE_UPDATE_INTERVAL', 1.0))
+ONLINE_SNAPSHOT_INTERVAL = float(os.environ.get('ONLINE_SNAPSHOT_INTERVAL', 300))
+ONLINE_MAX_QUEUE = int(os.environ.get('ONLINE_MAX_QUEUE', 10000))
+# Prometheus metrics on GET /metrics with per-stage request timings (METRICS=0 disables). Requests slower
+# than SLOW_REQUEST_MS are logged with their stages; a PROFILE_SAMPLE_RATE fraction of requests runs under
+# cProfile and the profiles of slow ones are written to PROFILE_DIR (newest PROFILE_MAX_FILES kept).
+METRICS = os.environ.get('METRICS', '1').lower() not in ('0', 'false')
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(APP_DIR, 'logs', 'profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+# Model hot-reload: POST /admin/reload (guarded by X-Admin-Token when ADMIN_TOKEN is set),
+# and a file watcher polling the artifacts every MODEL_WATCH_INTERVAL seconds (0 disables it).
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
 
 def save_history(entry):
-    """Save prediction history to a JSON file with error handling."""
+    """Save a single prediction to the history store."""
+    save_history_entries([entry])
+
+
+def save_history_entries(entries):
+    """Append prediction history entries (in request order) with error handling.
+
+    With HISTORY_ASYNC enabled the entries are only queued for the background
+    writer; otherwise they are written as one INSERT transaction right away.
+    """
+    if not entries:
+        return
     try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
-        
-        # Load existing history
-        history = []
-        if os.path.exists(HISTORY_PATH):
-            try:
-                with open(HISTORY_PATH, 'r') as f:
-                    history = json.load(f)
-                # Ensure history is a list
-                if not isinstance(history, list):
-                    history = []
-            except (json.JSONDecodeError, IOError) as e:
-                app.logger.error(f'Error reading history file: {str(e)}')
-                history = []
-        
-        # Add new entry and keep only the last 200 entries
-        history.insert(0, entry)
-        history = history[:200]
-        
-        # Write to a temporary file first, then rename (atomic operation)
-        temp_path = f"{HISTORY_PATH}.tmp"
-        with open(temp_path, 'w') as f:
-            json.dump(history, f, indent=2)
-        
-        # On Windows, we need to remove the destination file first if it exists
-        if os.path.exists(HISTORY_PATH):
-            os.remove(HISTORY_PATH)
-        os.rename(temp_path, HISTORY_PATH)
-        
+        if HISTORY_ASYNC:
+            history_writer.put(entries)
+        else:
+            history_store.append(entries)
     except Exception as e:
+        history_write_failures.inc(amount=len(entries))
         app.logger.error(f'Error saving history: {str(e)}')
-        # Try to create an empty history file if it doesn't exist
-        if not os.path.exists(HISTORY_PATH):
-            try:
-                with open(HISTORY_PATH, 'w') as f:
-                    json.dump([], f)
-            except Exception as e2:
-                app.logger.error(f'Failed to create history file: {str(e2)}')
 
-# Lightweight keyword fallback (used when no model/vectorizer available)
-FALLBACK_KEYWORDS = [
-    'win','free','prize','cash','reward','claim','promo','congratulations','loan','click','won','urgent','voucher','congrats'
-]
+
+def flush_history(timeout=2.0):
+    """Make queued history visible to readers before serving a history request."""
+    if HISTORY_ASYNC and not history_writer.flush(timeout):
+        app.logger.warning('Timed out waiting for history writer to flush')
+
+
+def utc_timestamp(value):
+    """Stored history timestamp form: naive UTC, microseconds always present, 'Z' suffix."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='microseconds') + 'Z'
+
+
+def make_history_entry(text, label, probability, fallback):
+    return {
+        'timestamp': utc_timestamp(datetime.utcnow()),
+        'text': text,
+        'label': label,
+        'probability': float(probability),
+        'isSpam': label.lower() == 'spam',
+        'fallback': fallback
+    }
 
 # Serve frontend static files from the workspace root when convenient so the frontend
 # can be served from the same origin as the API (avoids CSP / CORS differences when
@@ -91,122 +188,275 @@ handler.setLevel(logging.INFO)
 app.logger.addHandler(handler)
 app.logger.setLevel(logging.INFO)
 
-model = None
-vectorizer = None
+history_store = HistoryStore(
+    HISTORY_DB_PATH,
+    max_entries=HISTORY_MAX_ENTRIES,
+    compact_every=HISTORY_COMPACT_EVERY,
+    legacy_json_path=HISTORY_PATH,
+    stats_minutes=HISTORY_STATS_MINUTES,
+    stats_hours=HISTORY_STATS_HOURS,
+)
+history_writer = HistoryWriter(
+    history_store.append,
+    max_queue=HISTORY_QUEUE_SIZE,
+    batch_size=HISTORY_BATCH_SIZE,
+    flush_interval=HISTORY_FLUSH_INTERVAL,
+    overflow=HISTORY_OVERFLOW,
+    logger=app.logger,
+)
+# Drain queued history entries on interpreter shutdown
+atexit.register(history_writer.close)
+
+campaign_index = CampaignIndex(max_campaigns=CAMPAIGN_MAX, threshold=CAMPAIGN_THRESHOLD) if CAMPAIGN_INDEX else None
+sender_reputation = SenderReputation(
+    max_senders=SENDER_REPUTATION_MAX,
+    half_life_days=SENDER_HALF_LIFE_DAYS,
+    fast_path_min_count=SENDER_FAST_PATH_MIN_COUNT,
+) if SENDER_REPUTATION else None
+_reputation_saved_at = time.monotonic()
+_reputation_save_lock = threading.Lock()
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    max_bytes=PREDICTION_CACHE_MAX_BYTES,
+    ttl=PREDICTION_CACHE_TTL,
+    mask_digits=PREDICTION_CACHE_MASK_DIGITS,
+)
+
+metrics_registry = Registry()
+request_count = metrics_registry.counter(
+    'spam_requests_total', 'HTTP requests by route, method and status code', ('route', 'method', 'status'))
+request_seconds = metrics_registry.histogram(
+    'spam_request_duration_seconds', 'HTTP request latency', ('route', 'method'))
+stage_seconds = metrics_registry.histogram(
+    'spam_request_stage_seconds',
+    'Time spent in each stage of a request; score includes vectorize and predict_proba', ('route', 'stage'))
+slow_request_count = metrics_registry.counter(
+    'spam_slow_requests_total', f'Requests slower than SLOW_REQUEST_MS ({SLOW_REQUEST_MS:g} ms)', ('route',))
+prediction_count = metrics_registry.counter(
+    'spam_predictions_total', 'Scored messages by how the verdict was reached and label', ('path', 'label'))
+history_write_failures = metrics_registry.counter(
+    'spam_history_write_failures_total', 'History entries that could not be written or queued')
+artifact_load_seconds = metrics_registry.histogram(
+    'spam_artifact_load_seconds', 'Time to load model artifacts from disk', ('kind',))
+slow_profiler = SlowRequestProfiler(
+    PROFILE_DIR, threshold_ms=SLOW_REQUEST_MS, sample_rate=PROFILE_SAMPLE_RATE, max_files=PROFILE_MAX_FILES,
+    logger=app.logger,
+)
+
+# Loaded model state. Everything a prediction needs lives in one immutable ArtifactSet
+# that is replaced with a single assignment, so requests read `artifacts` once and keep
+# using the model they started with even if a reload swaps it meanwhile.
+ArtifactSet = namedtuple('ArtifactSet', 'model vectorizer version scorer source explainer')
+artifacts = None
+# Serializes reloads; predictions never take this lock
+_reload_lock = threading.Lock()
+
+
+def make_artifact_set(new_model, new_vectorizer, version, source):
+    # Compiled LinearScorer for supported linear models, or None when sklearn must be used
+    scorer = compile_scorer(new_model, new_vectorizer) if FAST_SCORER else None
+    # Term contributions for `explain` requests; None for models that aren't linear over a vocabulary
+    classes = getattr(new_model, 'classes_', ())
+    term_explainer = explainer.build_explainer(new_model, new_vectorizer, spam_class_index(new_model, len(classes)))
+    return ArtifactSet(new_model, new_vectorizer, version, scorer, source, term_explainer)
+
+
+def set_artifacts(new_model, new_vectorizer, version, source=None):
+    global artifacts
+    artifacts = make_artifact_set(new_model, new_vectorizer, version, source)
+
+
+def load_bundle_set(pkl_paths):
+    """Load the model bundle unless the .pkl pair that would otherwise be used is newer."""
+    if not os.path.exists(os.path.join(MODEL_BUNDLE_DIR, MANIFEST_NAME)):
+        return None
+    try:
+        source = read_manifest(MODEL_BUNDLE_DIR).get('metadata', {}).get('source')
+        if pkl_paths is not None and source is not None:
+            mpath, vpath = pkl_paths
+            stale = (
+                source.get('model') != os.path.abspath(mpath)
+                or source.get('vectorizer') != os.path.abspath(vpath)
+                or source.get('fingerprint') != artifact_version(mpath, vpath)
+            )
+            if stale:
+                print(f'Model bundle in {MODEL_BUNDLE_DIR} is older than {mpath}; loading .pkl artifacts instead')
+                return None
+        bundle_model, bundle_vectorizer, manifest = load_bundle(MODEL_BUNDLE_DIR)
+        print(f"Loaded model bundle {manifest['version']} from {MODEL_BUNDLE_DIR}")
+        return make_artifact_set(bundle_model, bundle_vectorizer, manifest['version'], MODEL_BUNDLE_DIR)
+    except Exception:
+        print('Error loading model bundle:')
+        traceback.print_exc()
+        return None
+
+
+def load_pkl_set(model_path, vect_path):
+    pkl_model, pkl_vectorizer = joblib.load(model_path), joblib.load(vect_path)
+    print(f"Loaded model from {model_path} and vectorizer from {vect_path}")
+    version = artifact_version(model_path, vect_path)
+    if MODEL_BUNDLE_AUTOEXPORT:
+        manifest = export_artifact_bundle(pkl_model, pkl_vectorizer, model_path, vect_path)
+        if manifest is not None:
+            # Same content-derived version the bundle reports when it is loaded next time
+            version = manifest['version']
+    return make_artifact_set(pkl_model, pkl_vectorizer, version, model_path)
+
+
+def load_artifact_set():
+    """Load artifacts from disk without installing them; returns an ArtifactSet or None."""
+    pkl_paths = find_artifact_paths()
+    # Prefer the memory-mapped bundle; .pkl files remain the import path
+    t0 = time.perf_counter()
+    loaded = load_bundle_set(pkl_paths)
+    if loaded is not None:
+        artifact_load_seconds.observe(time.perf_counter() - t0, 'bundle')
+    elif pkl_paths is not None:
+        t0 = time.perf_counter()
+        loaded = load_pkl_set(*pkl_paths)
+        artifact_load_seconds.observe(time.perf_counter() - t0, 'pkl')
+    return loaded
+
 
 def try_load_artifacts():
-    global model, vectorizer
+    global artifacts
     try:
-        # Try explicit env paths first
-        if os.path.exists(MODEL_PATH) and os.path.exists(VECT_PATH):
-            model = joblib.load(MODEL_PATH)
-            vectorizer = joblib.load(VECT_PATH)
-            print(f"Loaded model from {MODEL_PATH} and vectorizer from {VECT_PATH}")
+        loaded = load_artifact_set()
+        if loaded is not None:
+            artifacts = loaded
             return True
-
-        # Try alternative filenames in the backend folder
-        for mname in ALT_MODEL_NAMES:
-            for vname in ALT_VECT_NAMES:
-                mpath = os.path.join(APP_DIR, mname)
-                vpath = os.path.join(APP_DIR, vname)
-                if os.path.exists(mpath) and os.path.exists(vpath):
-                    model = joblib.load(mpath)
-                    vectorizer = joblib.load(vpath)
-                    print(f"Loaded model from {mpath} and vectorizer from {vpath}")
-                    return True
-
-        # Try alternative filenames in the workspace root (one level up)
-        for mname in ALT_MODEL_NAMES:
-            for vname in ALT_VECT_NAMES:
-                mpath = os.path.join(WORKSPACE_ROOT, mname)
-                vpath = os.path.join(WORKSPACE_ROOT, vname)
-                if os.path.exists(mpath) and os.path.exists(vpath):
-                    model = joblib.load(mpath)
-                    vectorizer = joblib.load(vpath)
-                    print(f"Loaded model from {mpath} and vectorizer from {vpath}")
-                    return True
     except Exception:
         print('Error loading artifacts:')
         traceback.print_exc()
     return False
 
-def train_from_dataset():
-    # Lightweight training fallback (only if dataset provided)
-    global model, vectorizer
+
+def warm_up(candidate):
+    """Score WARMUP_MESSAGES with `candidate`, raising ValueError if the output is unusable."""
+    for texts in ([WARMUP_MESSAGES[0]], WARMUP_MESSAGES):
+        scored = score_texts(candidate, texts)
+        if len(scored) != len(texts):
+            raise ValueError(f'Model returned {len(scored)} predictions for {len(texts)} messages')
+        for _, prob in scored:
+            if not 0.0 <= prob <= 1.0:
+                raise ValueError(f'Model returned invalid probability {prob!r}')
+
+
+def reload_artifacts(force=False):
+    """Load, validate and warm up artifacts from disk, then swap them in atomically.
+
+    In-flight requests finish with the ArtifactSet they captured. Returns a report
+    with the old/new versions and timings; the current model is kept on failure.
+    """
+    global artifacts
+    with _reload_lock:
+        old = artifacts
+        report = {'old_version': old.version if old else None, 'swapped': False}
+        if online_learner is not None:
+            report['error'] = 'The model is trained online (ONLINE_LEARNING=1); artifacts are not reloaded'
+            return report
+        t0 = time.perf_counter()
+        candidate = load_artifact_set()
+        report['load_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+        if candidate is None:
+            report['error'] = 'No loadable model artifacts found'
+            return report
+        report['new_version'] = candidate.version
+        report['source'] = candidate.source
+        t1 = time.perf_counter()
+        try:
+            warm_up(candidate)
+        except Exception as e:
+            report['error'] = f'Validation failed: {str(e)}'
+            return report
+        report['warmup_ms'] = round((time.perf_counter() - t1) * 1000, 3)
+        if force or old is None or candidate.version != old.version:
+            artifacts = candidate
+            report['swapped'] = True
+        app.logger.info(f'Model reload: {report}')
+        return report
+
+
+def publish_online_model(new_model, new_vectorizer, version):
+    with _reload_lock:
+        set_artifacts(new_model, new_vectorizer, version, 'online')
+
+
+online_learner = OnlineLearner(
+    publish_online_model,
+    ONLINE_SNAPSHOT_PATH,
+    batch_size=ONLINE_BATCH_SIZE,
+    update_interval=ONLINE_UPDATE_INTERVAL,
+    snapshot_interval=ONLINE_SNAPSHOT_INTERVAL,
+    max_queue=ONLINE_MAX_QUEUE,
+    logger=app.logger,
+) if ONLINE_LEARNING else None
+
+
+def prepare_online_model():
+    """Load the online model snapshot, or bootstrap one from SPAM_SMS.csv. Returns True if a model is ready.
+
+    The dataset has no labels, so bootstrap labels come from the model artifacts on
+    disk when there are any and from the rule engine otherwise.
+    """
+    try:
+        if online_learner.load():
+            print(f'Loaded online model {online_learner.version} from {ONLINE_SNAPSHOT_PATH}')
+            return True
+    except Exception:
+        print('Error loading online model snapshot:')
+        traceback.print_exc()
+    if not os.path.exists(DATASET_PATH):
+        return False
     try:
         import pandas as pd
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        from sklearn.linear_model import LogisticRegression
-        # allow dataset in backend/ or workspace root
-        dataset_candidates = [
-            os.path.join(APP_DIR, 'SPAM_SMS.csv'),
-            os.path.join(WORKSPACE_ROOT, 'SPAM_SMS.csv')
-        ]
-        dataset_file = None
-        for p in dataset_candidates:
-            if os.path.exists(p):
-                dataset_file = p
-                break
+        texts = pd.read_csv(DATASET_PATH)['text'].dropna().astype(str).tolist()
+        teacher = load_artifact_set()
+        if teacher is not None:
+            labels = [label for label, _ in score_texts(teacher, texts)]
+        else:
+            labels = [label for label, _, _ in rule_predict(texts)]
+        online_learner.bootstrap(texts, labels)
+        online_learner.save()
+        print(f"Bootstrapped online model from {len(texts)} messages labeled by "
+              f"{'model ' + teacher.version if teacher else 'the rule engine'}")
+        return True
+    except Exception:
+        print('Error bootstrapping online model:')
+        traceback.print_exc()
+        return False
+
+
+def start_online_learner():
+    """Start applying feedback in this process (call after forking)."""
+    if online_learner is not None:
+        online_learner.start()
+
+
+def stop_online_learner():
+    if online_learner is not None:
+        online_learner.stop()
+
+
+atexit.register(stop_online_learner)
+
+
+def train_from_dataset():
+    """Train with the default settings of training.py (no grid search) and serve the result."""
+    try:
+        import training
+        dataset_file = next((p for p in (DATASET_PATH, os.path.join(WORKSPACE_ROOT, 'SPAM_SMS.csv'))
+                             if os.path.exists(p)), None)
         if dataset_file is None:
             raise FileNotFoundError('SPAM_SMS.csv not found in backend/ or workspace root')
-
-        df = pd.read_csv(dataset_file)
-        # Expect columns like ['label','text'] or ['Class','Message'] — try common names
-        text_col = None
-        label_col = None
-        for c in df.columns:
-            if c.lower() in ('text','message','sms','msg','message_text'):
-                text_col = c
-            if c.lower() in ('label','class','target'):
-                label_col = c
-        if text_col is None:
-            # try the second column
-            text_col = df.columns[1]
-        if label_col is None:
-            label_col = df.columns[0]
-
-        df = df[[label_col, text_col]].dropna()
-        X = df[text_col].astype(str).values
-        y = df[label_col].astype(str).values
-
-        # Create binary labels (True for spam). If dataset labels don't contain both classes,
-        # fall back to a keyword-based labeling strategy to synthesize a second class so training
-        # can proceed. This prevents the ValueError raised when all labels are the same.
-        y_lower = [str(v).lower() for v in y]
-        y_binary = [(val == 'spam') for val in y_lower]
-        # If only one class present, try keyword heuristic using FALLBACK_KEYWORDS
-        if len(set(y_binary)) < 2:
-            print('Warning: dataset labels contain a single class. Generating labels using keyword heuristic...')
-            heur_labels = []
-            for text in X:
-                t = str(text).lower()
-                heur = any(k in t for k in FALLBACK_KEYWORDS)
-                heur_labels.append(heur)
-            y_binary = heur_labels
-
-        # If still only one class after heuristics, force a small number of positive labels
-        # to allow training. We choose every Nth sample up to 10% or max 50 samples.
-        if len(set(y_binary)) < 2:
-            print('Warning: keyword heuristic produced a single class. Injecting a few positive labels to enable training.')
-            n = len(y_binary)
-            inject = max(1, min(50, n // 10))
-            for i in range(0, n, max(1, n // inject)):
-                y_binary[i] = True
-
-        vectorizer = TfidfVectorizer(stop_words='english', max_features=20000)
-        Xv = vectorizer.fit_transform(X)
-        model = LogisticRegression(max_iter=1000)
-        model.fit(Xv, y_binary)
-
-        # Save artifacts for future runs (prefer backend paths)
-        try:
-            joblib.dump(model, os.path.join(APP_DIR, ALT_MODEL_NAMES[0]))
-            joblib.dump(vectorizer, os.path.join(APP_DIR, ALT_VECT_NAMES[0]))
-        except Exception:
-            # fallback to configured paths
-            joblib.dump(model, MODEL_PATH)
-            joblib.dump(vectorizer, VECT_PATH)
-        print(f"Trained model & vectorizer and saved to {MODEL_PATH} and {VECT_PATH}")
+        texts, labels, source = training.load_dataset(dataset_file)
+        print(f'Training on {len(texts)} messages from {dataset_file} (labels from {source})...')
+        model, vectorizer, report = training.train(texts, labels, search=False, folds=0)
+        set_artifacts(model, vectorizer, 'trained-' + datetime.utcnow().strftime('%Y%m%d%H%M%S'), 'dataset')
+        model_file, vect_file = artifact_store.save_trained_artifacts(model, vectorizer, training={
+            'dataset': dataset_file, 'label_source': source, 'best': report['best'],
+        }, export=MODEL_BUNDLE_AUTOEXPORT)
+        print(f"Trained model & vectorizer and saved to {model_file} and {vect_file}")
         return True
     except Exception:
         print('Training error:')
@@ -214,6 +464,371 @@ def train_from_dataset():
         return False
 
 
+# Upper bound on the number of messages accepted by /predict/batch in one request
+PREDICT_BATCH_MAX = int(os.environ.get('PREDICT_BATCH_MAX', 1000))
+
+
+def rule_predict(texts):
+    """Rule-based fallback used when no model/vectorizer is available.
+
+    Returns (label, probability, matched rule ids) for each text.
+    """
+    return [
+        (label, prob, score.spam_rules + score.safe_rules)
+        for label, prob, score in pattern_engine.predict_batch(texts)
+    ]
+
+
+def spam_class_index(clf, n_classes):
+    """Column of `predict_proba` output that holds the spam probability."""
+    if hasattr(clf, 'classes_'):
+        for i, c in enumerate(clf.classes_):
+            if str(c).lower() == 'spam':
+                return i
+        try:
+            return list(clf.classes_).index(1)
+        except Exception:
+            return n_classes - 1
+    return n_classes - 1
+
+
+def model_predict(arts, texts):
+    """Score `texts` with the model in `arts`, reusing cached predictions.
+
+    Cache misses (deduplicated by normalized text) go through one
+    `vectorizer.transform` and one `predict_proba` call. Returns a list of
+    (label, probability) tuples in input order.
+    """
+    if not prediction_cache.enabled:
+        return score_uncached(arts, texts)
+    version = arts.version
+    results = [None] * len(texts)
+    misses = {}
+    for i, text in enumerate(texts):
+        key = prediction_cache.key(text)
+        cached = prediction_cache.get(key, version)
+        if cached is None:
+            misses.setdefault(key, []).append(i)
+        else:
+            results[i] = cached
+    if misses:
+        scored = score_uncached(arts, [texts[idxs[0]] for idxs in misses.values()])
+        for (key, idxs), res in zip(misses.items(), scored):
+            prediction_cache.put(key, res, version)
+            for i in idxs:
+                results[i] = res
+    return results
+
+
+def score_uncached(arts, texts):
+    """score_texts, coalescing single messages from concurrent requests when that pays off."""
+    # The compiled fast scorer is per-message already; only sklearn calls benefit from batching
+    if micro_batcher is not None and len(texts) == 1 and arts.scorer is None:
+        return [micro_batcher.submit(arts, texts[0])]
+    return score_texts(arts, texts)
+
+
+def score_texts(arts, texts):
+    """Score `texts` with one `vectorizer.transform` and one `predict_proba` call.
+
+    Small batches for supported linear models use the compiled fast scorer instead.
+    """
+    t0 = time.perf_counter()
+    if arts.scorer is not None and len(texts) <= FAST_SCORER_MAX_BATCH:
+        probs = arts.scorer.spam_probabilities(texts)
+        record_stage('fast_scorer', time.perf_counter() - t0)
+        return [('Spam' if p >= 0.5 else 'Not Spam', p) for p in probs]
+    clf = arts.model
+    Xv = arts.vectorizer.transform(texts)
+    t1 = time.perf_counter()
+    record_stage('vectorize', t1 - t0)
+    try:
+        probs = clf.predict_proba(Xv)
+        record_stage('predict_proba', time.perf_counter() - t1)
+        spam_idx = spam_class_index(clf, probs.shape[1])
+        results = []
+        for p in probs[:, spam_idx]:
+            spam_prob = float(p)
+            results.append(('Spam' if spam_prob >= 0.5 else 'Not Spam', spam_prob))
+        return results
+    except Exception:
+        results = []
+        for pred in clf.predict(Xv):
+            is_spam = (str(pred).lower() == 'spam') or (pred == 1)
+            results.append(('Spam' if is_spam else 'Not Spam', 1.0))
+        return results
+
+
+def campaign_predict(arts, texts):
+    """model_predict plus campaign matching.
+
+    Returns (label, probability, campaign id, short_circuit) per text. Texts in
+    a campaign with a confident verdict take that verdict without scoring when
+    CAMPAIGN_SHORT_CIRCUIT is on; every text is then recorded in its campaign.
+    """
+    if campaign_index is None:
+        return [(label, prob, None, False) for label, prob in model_predict(arts, texts)]
+    matches = [campaign_index.query(text, arts.version) for text in texts]
+    results = [None] * len(texts)
+    todo = []
+    for i, match in enumerate(matches):
+        if CAMPAIGN_SHORT_CIRCUIT and match.verdict is not None:
+            results[i] = (*match.verdict, True)
+        else:
+            todo.append(i)
+    if todo:
+        for i, (label, prob) in zip(todo, model_predict(arts, [texts[i] for i in todo])):
+            results[i] = (label, prob, False)
+    out = []
+    for text, match, (label, prob, short) in zip(texts, matches, results):
+        # Only fresh model scores count towards a campaign's verdict
+        cid = campaign_index.add(match, text, label, prob, version=None if short else arts.version)
+        out.append((label, prob, cid, short))
+    return out
+
+
+def sender_of(item):
+    """(hashed number, carrier) from a request object using the SPAM_SMS.csv column names."""
+    if not isinstance(item, dict):
+        return None, None
+    sender = item.get('hashed_celphone_number')
+    carrier = item.get('carrier')
+    return (sender if isinstance(sender, str) and sender else None), (carrier if isinstance(carrier, str) else None)
+
+
+def predict_with_context(arts, texts, senders):
+    """Model predictions using sender reputation and campaigns, for the prediction endpoints.
+
+    `senders` holds a (hashed number, carrier) pair per text. Returns
+    (label, probability, extra response fields) per text.
+    """
+    reps = [sender_reputation.lookup(s) if sender_reputation is not None and s else None for s, _ in senders]
+    results = [None] * len(texts)
+    todo = []
+    for i, rep in enumerate(reps):
+        if SENDER_FAST_PATH and sender_reputation is not None and sender_reputation.fast_verdict(rep):
+            results[i] = ('Spam', rep['score'], {'sender': rep, 'sender_verdict': True})
+        else:
+            todo.append(i)
+    scored = campaign_predict(arts, [texts[i] for i in todo]) if todo else []
+    for i, (label, prob, campaign, short) in zip(todo, scored):
+        extra = {}
+        if campaign is not None:
+            extra['campaign'] = campaign
+            if short:
+                extra['campaign_verdict'] = True
+        rep = reps[i]
+        if rep is not None:
+            extra['sender'] = rep
+            if SENDER_REPUTATION_WEIGHT:
+                prob = SenderReputation.adjust(prob, rep, SENDER_REPUTATION_WEIGHT)
+                label = 'Spam' if prob >= 0.5 else 'Not Spam'
+        results[i] = (label, prob, extra)
+        sender, carrier = senders[i]
+        if sender and sender_reputation is not None:
+            # Fast-path verdicts are not fed back; once a sender's decayed weight drops below
+            # SENDER_FAST_PATH_MIN_COUNT its messages are scored (and observed) again
+            sender_reputation.observe(sender, label == 'Spam', carrier)
+    if todo and any(s for s, _ in senders):
+        maybe_save_reputation()
+    return results
+
+
+def save_reputation():
+    if sender_reputation is None or not SENDER_REPUTATION_PERSIST or not sender_reputation.dirty:
+        return
+    with _reputation_save_lock:
+        try:
+            sender_reputation.save(SENDER_REPUTATION_PATH)
+        except Exception as e:
+            app.logger.error(f'Error saving sender reputation: {str(e)}')
+
+
+atexit.register(save_reputation)
+
+
+def maybe_save_reputation():
+    """Persist the reputation index in the background at most every SENDER_REPUTATION_SAVE_INTERVAL seconds."""
+    global _reputation_saved_at
+    if not SENDER_REPUTATION_PERSIST:
+        return
+    now = time.monotonic()
+    if now - _reputation_saved_at >= SENDER_REPUTATION_SAVE_INTERVAL:
+        _reputation_saved_at = now
+        threading.Thread(target=save_reputation, daemon=True).start()
+
+
+def load_reputation():
+    """Load the persisted reputation index; returns False when there is none to load."""
+    if sender_reputation is None or not os.path.exists(SENDER_REPUTATION_PATH):
+        return False
+    try:
+        sender_reputation.load(SENDER_REPUTATION_PATH)
+        print(f'Loaded reputation for {len(sender_reputation)} senders from {SENDER_REPUTATION_PATH}')
+        return True
+    except Exception as e:
+        app.logger.warning(f'Could not load sender reputation: {str(e)}')
+        return False
+
+
+def record_campaigns(texts, scored):
+    """Campaign ids for rule-engine results, which never feed campaign verdicts."""
+    if campaign_index is None:
+        return [None] * len(texts)
+    return [
+        campaign_index.add(campaign_index.query(text), text, label, prob)
+        for text, (label, prob, *_) in zip(texts, scored)
+    ]
+
+
+def seed_indexes(arts):
+    """Build the campaign index, and the sender reputation unless it was persisted, from SPAM_SMS.csv.
+
+    The dataset is scored with `arts` (the rule engine when None); only model
+    scores seed sender reputation.
+    """
+    seed_reputation = sender_reputation is not None and arts is not None and not load_reputation()
+    if (campaign_index is None and not seed_reputation) or not os.path.exists(DATASET_PATH):
+        return
+    try:
+        import pandas as pd
+        df = pd.read_csv(DATASET_PATH).dropna(subset=['text'])
+        texts = df['text'].astype(str).tolist()
+        dates = df['date'].astype(str).tolist() if 'date' in df.columns else [None] * len(texts)
+        if arts is not None:
+            scored = score_texts(arts, texts)
+        else:
+            scored = [(label, prob) for label, prob, _ in rule_predict(texts)]
+        if campaign_index is not None:
+            for text, date, (label, prob) in zip(texts, dates, scored):
+                match = campaign_index.query(text)
+                campaign_index.add(match, text, label, prob, version=arts.version if arts else None, timestamp=date)
+            print(f"Campaign index seeded with {len(texts)} messages ({campaign_index.stats()['campaigns']} campaigns)")
+        if seed_reputation and 'hashed_celphone_number' in df.columns:
+            senders = df['hashed_celphone_number'].fillna('').astype(str).tolist()
+            carriers = df['carrier'].fillna('').astype(str).tolist() if 'carrier' in df.columns else [None] * len(texts)
+            for sender, carrier, date, (label, _) in zip(senders, carriers, dates, scored):
+                sender_reputation.observe(sender, label == 'Spam', carrier, date)
+            save_reputation()
+            print(f'Sender reputation seeded with {len(sender_reputation)} senders')
+    except Exception as e:
+        app.logger.warning(f'Could not seed campaign index or sender reputation: {str(e)}')
+
+
+micro_batcher = MicroBatcher(score_texts, MICRO_BATCH_MAX, MICRO_BATCH_WAIT_MS) if MICRO_BATCH else None
+
+
+def request_flag(data, name):
+    """True if an optional feature is requested in the JSON body or the query string."""
+    return bool(data.get(name)) or request.args.get(name, '').lower() in ('1', 'true')
+
+
+def explain_texts(arts, texts, extras=None):
+    """Explanation of each prediction: where the verdict came from, top terms and matched rules.
+
+    `source` is 'fallback' (rule engine), 'campaign' or 'sender' (short-circuit
+    verdicts, which list no terms since the model did not decide them) or 'model'.
+    Model explanations list the top spam / not-spam terms when the model supports
+    it, plus the log-odds `sender` adds when SENDER_REPUTATION_WEIGHT blends the
+    sender's reputation into the probability. `extras` are the extra response
+    fields of each prediction.
+    """
+    term_explainer = arts.explainer if arts is not None else None
+    out = []
+    for i, text in enumerate(texts):
+        extra = extras[i] if extras is not None else {}
+        if arts is None:
+            explanation = {'source': 'fallback'}
+        elif extra.get('sender_verdict'):
+            explanation = {'source': 'sender'}
+        elif extra.get('campaign_verdict'):
+            explanation = {'source': 'campaign'}
+        else:
+            explanation = {'source': 'model'}
+            if term_explainer is not None:
+                explanation.update(term_explainer.explain(text, EXPLAIN_TOP_K))
+            if SENDER_REPUTATION_WEIGHT and extra.get('sender') is not None:
+                shift = SenderReputation.log_odds_shift(extra['sender'], SENDER_REPUTATION_WEIGHT)
+                explanation['sender'] = round(shift, 4)
+        explanation['rules'] = explainer.matched_rules(text)
+        out.append(explanation)
+    return out
+
+
+def add_urls(out, urls):
+    """Add the `urls` found in a message (if any) to a prediction response."""
+    if urls:
+        out['urls'] = urls
+
+
+def request_stage(name):
+    """Context manager timing one stage of the current request (a no-op when metrics are off)."""
+    timer = g.get('request_timer')
+    return timer.stage(name) if timer is not None else contextlib.nullcontext()
+
+
+def record_stage(name, seconds):
+    """Add a stage measured elsewhere (e.g. inside score_texts) to the current request, if any."""
+    if has_request_context():
+        timer = g.get('request_timer')
+        if timer is not None:
+            timer.stages.append((name, seconds))
+
+
+def count_predictions(labels, extras, fallback):
+    for label, extra in zip(labels, extras):
+        if fallback:
+            path = 'fallback'
+        elif extra.get('sender_verdict'):
+            path = 'sender'
+        elif extra.get('campaign_verdict'):
+            path = 'campaign'
+        else:
+            path = 'model'
+        prediction_count.inc(path, label)
+
+
+@app.before_request
+def start_request_timer():
+    if METRICS:
+        g.request_timer = RequestTimer()
+        g.request_timer.profile = slow_profiler.start()
+
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_timer(exc):
+    timer = g.pop('request_timer', None)
+    if timer is None:
+        return
+    seconds = timer.elapsed()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_count.inc(route, request.method, str(g.get('response_status', 500)))
+    request_seconds.observe(seconds, route, request.method)
+    for name, stage_time in timer.stages:
+        stage_seconds.observe(stage_time, route, name)
+    if timer.profile is not None:
+        path = slow_profiler.finish(timer.profile, seconds, f'{request.method} {route}', timer)
+        if path:
+            app.logger.warning(f'Wrote slow request profile {path}')
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        slow_request_count.inc(route)
+        app.logger.warning(f'Slow request {request.method} {route}: {seconds * 1000:.1f} ms ({timer.describe()})')
+
+
+def internal_error_response(context):
+    tb = traceback.format_exc()
+    app.logger.error('%s:\n%s', context, tb)
+    if app.debug or os.environ.get('FLASK_DEBUG', '').lower() in ('1','true'):
+        return jsonify({'error': 'Internal server error', 'traceback': tb}), 500
+    return jsonify({'error':'Internal server error'}), 500
+
+
 @app.route('/predict', methods=['OPTIONS', 'GET', 'POST'])
 @cross_origin()
 def predict_endpoint():
@@ -228,159 +843,492 @@ def predict_endpoint():
         return jsonify({'error': 'This endpoint accepts POST with JSON {"text": "..."}. Use POST to get predictions.'}), 200
 
     # POST -> prediction logic
-    global model, vectorizer
     try:
-        data = request.get_json(force=True)
-        text = data.get('text') if isinstance(data, dict) else None
+        with request_stage('parse'):
+            data = request.get_json(force=True)
+            text = data.get('text') if isinstance(data, dict) else None
         if not text:
             return jsonify({'error':'`text` field is required.'}), 400
 
-        if model is None or vectorizer is None:
-            lower = text.lower()
-            is_spam = any(k in lower for k in FALLBACK_KEYWORDS)
-            prob = 0.9 if is_spam else 0.05
-            label = 'Spam' if is_spam else 'Not Spam'
-            out = {'label': label, 'probability': prob, 'text': text, 'fallback': True}
+        # Capture the current artifacts once; a concurrent reload can't change them mid-request
+        arts = artifacts
+        sender, carrier = sender_of(data)
+        if arts is None:
+            with request_stage('score'):
+                label, prob, rules = rule_predict([text])[0]
+                out = {'label': label, 'probability': prob, 'text': text, 'fallback': True, 'rules': rules}
+                campaign = record_campaigns([text], [(label, prob)])[0]
+                if campaign is not None:
+                    out['campaign'] = campaign
+                if sender and sender_reputation is not None:
+                    out['sender'] = sender_reputation.lookup(sender)
+            count_predictions([label], [out], True)
+            if URL_EXTRACTION:
+                with request_stage('urls'):
+                    add_urls(out, url_extractor.scan(text))
+            if request_flag(data, 'categories'):
+                with request_stage('categories'):
+                    out['categories'] = pattern_engine.tag_categories(text)
+            if request_flag(data, 'explain'):
+                with request_stage('explain'):
+                    out['explanation'] = explain_texts(None, [text])[0]
             try:
                 # Save history for fallback prediction
-                history_entry = {
-                    'timestamp': datetime.utcnow().isoformat() + 'Z',
-                    'text': text,
-                    'label': label,
-                    'probability': float(prob),
-                    'isSpam': label.lower() == 'spam',
-                    'fallback': True
-                }
-                save_history(history_entry)
-                
-                return jsonify(out)
+                with request_stage('history'):
+                    save_history(make_history_entry(text, label, prob, True))
+                with request_stage('serialize'):
+                    return jsonify(out)
             except Exception as e:
                 app.logger.error(f'Error in fallback prediction: {str(e)}')
                 return jsonify({'error': 'Error processing fallback prediction'}), 500
 
         # Process with model if available
-        Xv = vectorizer.transform([text])
-        try:
-            probs = model.predict_proba(Xv)[0]
-            spam_idx = None
-            if hasattr(model, 'classes_'):
-                for i,c in enumerate(model.classes_):
-                    if str(c).lower() == 'spam':
-                        spam_idx = i
-                        break
-            if spam_idx is None:
-                if hasattr(model, 'classes_'):
-                    try:
-                        spam_idx = list(model.classes_).index(1)
-                    except Exception:
-                        spam_idx = len(probs)-1
-                else:
-                    spam_idx = len(probs)-1
-
-            spam_prob = float(probs[spam_idx])
-            label = 'Spam' if spam_prob >= 0.5 else 'Not Spam'
-            out = {'label': label, 'probability': spam_prob, 'text': text}
-            entry = {
-                'timestamp': datetime.utcnow().isoformat() + 'Z',
-                'text': text,
-                'label': label,
-                'probability': float(spam_prob),
-                'isSpam': label.lower() == 'spam',
-                'fallback': False
-            }
-            save_history(entry)
-            return jsonify(out)
-        except Exception:
-            pred = model.predict(Xv)[0]
-            is_spam = (str(pred).lower() == 'spam') or (pred == 1)
-            label = 'Spam' if is_spam else 'Not Spam'
-            out = {'label': label, 'probability': 1.0, 'text': text}
-            entry = {
-                'timestamp': datetime.utcnow().isoformat() + 'Z',
-                'text': text,
-                'label': label,
-                'probability': 1.0,  # Explicit float for consistency
-                'isSpam': label.lower() == 'spam',
-                'fallback': False
-            }
-            save_history(entry)
+        with request_stage('score'):
+            label, spam_prob, extra = predict_with_context(arts, [text], [(sender, carrier)])[0]
+        count_predictions([label], [extra], False)
+        out = {'label': label, 'probability': spam_prob, 'text': text}
+        out.update(extra)
+        if URL_EXTRACTION:
+            with request_stage('urls'):
+                add_urls(out, url_extractor.scan(text))
+        if request_flag(data, 'categories'):
+            with request_stage('categories'):
+                out['categories'] = pattern_engine.tag_categories(text)
+        if request_flag(data, 'explain'):
+            with request_stage('explain'):
+                out['explanation'] = explain_texts(arts, [text], [extra])[0]
+        with request_stage('history'):
+            save_history(make_history_entry(text, label, spam_prob, False))
+        with request_stage('serialize'):
             return jsonify(out)
     except Exception:
-        tb = traceback.format_exc()
-        app.logger.error('Predict error:\n%s', tb)
-        if app.debug or os.environ.get('FLASK_DEBUG', '').lower() in ('1','true'):
-            return jsonify({'error': 'Internal server error', 'traceback': tb}), 500
-        return jsonify({'error':'Internal server error'}), 500
+        return internal_error_response('Predict error')
+
+
+@app.route('/predict/batch', methods=['OPTIONS', 'POST'])
+@cross_origin()
+def predict_batch_endpoint():
+    """Score many messages in one request.
+
+    Accepts JSON {"messages": [...]} where each item is either a string or an object
+    {"id": ..., "text": "..."}. All texts are scored with a single vectorizer/model
+    call, results are returned in input order (echoing `id` when given) and the
+    batch is written to history once.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+
+    try:
+        with request_stage('parse'):
+            data = request.get_json(force=True, silent=True)
+        if data is None:
+            return jsonify({'error': 'Request body must be valid JSON.'}), 400
+        messages = data.get('messages') if isinstance(data, dict) else None
+        if not isinstance(messages, list) or not messages:
+            return jsonify({'error': '`messages` must be a non-empty list.'}), 400
+        if len(messages) > PREDICT_BATCH_MAX:
+            return jsonify({'error': f'At most {PREDICT_BATCH_MAX} messages are accepted per batch.'}), 413
+
+        ids = []
+        texts = []
+        senders = []
+        for i, item in enumerate(messages):
+            if isinstance(item, dict):
+                msg_id, text = item.get('id'), item.get('text')
+            else:
+                msg_id, text = None, item
+            if not text or not isinstance(text, str):
+                return jsonify({'error': f'messages[{i}]: `text` field is required.'}), 400
+            ids.append(msg_id)
+            texts.append(text)
+            senders.append(sender_of(item))
+
+        arts = artifacts
+        fallback = arts is None
+        with request_stage('score'):
+            if fallback:
+                scored = rule_predict(texts)
+                extras = [{} if cid is None else {'campaign': cid} for cid in record_campaigns(texts, scored)]
+                if sender_reputation is not None:
+                    for extra, (sender, _) in zip(extras, senders):
+                        if sender:
+                            extra['sender'] = sender_reputation.lookup(sender)
+            else:
+                scored = predict_with_context(arts, texts, senders)
+                extras = [extra for _, _, extra in scored]
+        count_predictions([label for label, *_ in scored], extras, fallback)
+
+        categories = None
+        if request_flag(data, 'categories'):
+            with request_stage('categories'):
+                categories = pattern_engine.tag_categories_batch(texts)
+        urls = None
+        if URL_EXTRACTION:
+            with request_stage('urls'):
+                urls = url_extractor.scan_batch(texts)
+        explanations = None
+        if request_flag(data, 'explain'):
+            with request_stage('explain'):
+                explanations = explain_texts(arts, texts, extras)
+
+        results = []
+        entries = []
+        for i, (msg_id, text, (label, prob, *rest)) in enumerate(zip(ids, texts, scored)):
+            out = {'label': label, 'probability': prob, 'text': text}
+            if msg_id is not None:
+                out['id'] = msg_id
+            if fallback:
+                out['fallback'] = True
+                out['rules'] = rest[0]
+            out.update(extras[i])
+            if urls is not None:
+                add_urls(out, urls[i])
+            if categories is not None:
+                out['categories'] = categories[i]
+            if explanations is not None:
+                out['explanation'] = explanations[i]
+            results.append(out)
+            entries.append(make_history_entry(text, label, prob, fallback))
+        with request_stage('history'):
+            save_history_entries(entries)
+        with request_stage('serialize'):
+            return jsonify({'results': results, 'count': len(results)})
+    except Exception:
+        return internal_error_response('Batch predict error')
+
+
+@app.route('/campaigns', methods=['GET'])
+@cross_origin()
+def list_campaigns():
+    """Largest near-duplicate campaigns with sizes and first/last-seen times."""
+    if campaign_index is None:
+        return jsonify({'error': 'Campaign index is disabled'}), 404
+    try:
+        limit = int(request.args.get('limit', 50))
+        min_size = int(request.args.get('min_size', 2))
+    except ValueError:
+        return jsonify({'error': 'limit and min_size must be integers'}), 400
+    return jsonify({'campaigns': campaign_index.campaigns(limit, min_size), 'stats': campaign_index.stats()})
+
+
+@app.route('/senders/<sender>', methods=['GET'])
+@cross_origin()
+def sender_info(sender):
+    """Reputation of one sender by hashed_celphone_number."""
+    if sender_reputation is None:
+        return jsonify({'error': 'Sender reputation is disabled'}), 404
+    rep = sender_reputation.lookup(sender)
+    if rep is None:
+        return jsonify({'error': 'Unknown sender'}), 404
+    rep['fast_path'] = bool(SENDER_FAST_PATH and sender_reputation.fast_verdict(rep))
+    return jsonify(rep)
+
+
+@app.route('/cache/stats', methods=['GET'])
+@cross_origin()
+def cache_stats():
+    return jsonify(prediction_cache.stats())
+
+
+@metrics_registry.collector
+def component_samples():
+    """Gauges and counters read from the stats of the serving components at scrape time."""
+    arts = artifacts
+    samples = [Sample('spam_model_loaded', 'gauge', 'Whether a model is loaded (0: rule-engine fallback)',
+                      int(arts is not None))]
+    if arts is not None:
+        samples.append(Sample('spam_model_info', 'gauge', 'Version and source of the loaded model', 1, {
+            'version': arts.version,
+            'source': os.path.basename(str(arts.source)) if arts.source else '',
+            'fast_scorer': str(arts.scorer is not None).lower(),
+        }))
+    cache = prediction_cache.stats()
+    samples += [
+        Sample('spam_prediction_cache_hits_total', 'counter', 'Prediction cache hits', cache['hits']),
+        Sample('spam_prediction_cache_misses_total', 'counter', 'Prediction cache misses', cache['misses']),
+        Sample('spam_prediction_cache_evictions_total', 'counter', 'Prediction cache evictions', cache['evictions']),
+        Sample('spam_prediction_cache_entries', 'gauge', 'Cached predictions', cache['entries']),
+        Sample('spam_prediction_cache_bytes', 'gauge', 'Estimated size of the prediction cache', cache['bytes']),
+        Sample('spam_history_writer_written_total', 'counter', 'History entries written by the background writer',
+               history_writer.written),
+        Sample('spam_history_writer_dropped_total', 'counter', 'History entries dropped because the queue was full',
+               history_writer.dropped),
+        Sample('spam_history_writer_failed_total', 'counter', 'History entries the background writer failed to write',
+               history_writer.failed),
+        Sample('spam_history_writer_pending', 'gauge', 'History entries waiting to be written',
+               history_writer.pending()),
+    ]
+    if micro_batcher is not None:
+        batcher = micro_batcher.stats()
+        samples += [
+            Sample('spam_micro_batches_total', 'counter', 'Coalesced scoring batches', batcher['batches']),
+            Sample('spam_micro_batch_items_total', 'counter', 'Messages scored in coalesced batches', batcher['items']),
+        ]
+    if campaign_index is not None:
+        campaigns = campaign_index.stats()
+        samples += [
+            Sample('spam_campaigns', 'gauge', 'Campaigns in the campaign index', campaigns['campaigns']),
+            Sample('spam_campaign_lookups_total', 'counter', 'Campaign index lookups', campaigns['lookups']),
+            Sample('spam_campaign_matches_total', 'counter', 'Lookups that matched a campaign', campaigns['matches']),
+        ]
+    if sender_reputation is not None:
+        samples.append(Sample('spam_reputation_senders', 'gauge', 'Senders in the reputation index',
+                              sender_reputation.stats()['senders']))
+    blocklist = url_extractor.BLOCKLIST.stats()
+    samples += [
+        Sample('spam_blocklist_entries', 'gauge', 'Domain blocklist entries', blocklist['entries']),
+        Sample('spam_blocklist_reloads_total', 'counter', 'Domain blocklist loads', blocklist['reloads']),
+    ]
+    if online_learner is not None:
+        online = online_learner.stats()
+        samples += [
+            Sample('spam_online_updates_total', 'counter', 'Online model updates', online['updates']),
+            Sample('spam_online_examples_total', 'counter', 'Examples the online model learned from', online['examples']),
+            Sample('spam_online_queued', 'gauge', 'Feedback examples waiting for an update', online['queued']),
+            Sample('spam_online_dropped_total', 'counter', 'Feedback examples dropped because the queue was full',
+                   online['dropped']),
+        ]
+    if slow_profiler.enabled:
+        samples += [
+            Sample('spam_profiled_requests_total', 'counter', 'Requests run under the profiler', slow_profiler.profiled),
+            Sample('spam_profiles_written_total', 'counter', 'Slow request profiles written', slow_profiler.dumped),
+        ]
+    return samples
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of request, stage and component metrics."""
+    if not METRICS:
+        return jsonify({'error': 'Metrics are disabled (METRICS=0)'}), 404
+    return app.response_class(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def watched_artifact_paths():
+    """Every .pkl candidate find_artifact_paths() considers, plus the bundle manifest."""
+    paths = [MODEL_PATH, VECT_PATH, os.path.join(MODEL_BUNDLE_DIR, MANIFEST_NAME)]
+    for root in (APP_DIR, WORKSPACE_ROOT):
+        paths.extend(os.path.join(root, name) for name in ALT_MODEL_NAMES + ALT_VECT_NAMES)
+    return paths
+
+
+def reload_on_change():
+    report = reload_artifacts()
+    if 'error' in report:
+        app.logger.error(f"Watched artifacts changed but reload failed: {report['error']}")
+
+
+artifact_watcher = ArtifactWatcher(
+    watched_artifact_paths, reload_on_change, interval=MODEL_WATCH_INTERVAL or 5.0, logger=app.logger,
+)
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Reload model artifacts from disk without restarting the server."""
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        report = reload_artifacts(force=bool(data.get('force')))
+    except Exception:
+        return internal_error_response('Model reload error')
+    if 'error' in report:
+        app.logger.error(f"Model reload failed, keeping {report['old_version']}: {report['error']}")
+        return jsonify(report), 500
+    return jsonify(report)
+
+
+@app.route('/admin/blocklist/reload', methods=['POST'])
+def admin_reload_blocklist():
+    """Re-read the domain blocklist file now instead of waiting for the change check."""
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        return jsonify(url_extractor.BLOCKLIST.reload())
+    except Exception:
+        return internal_error_response('Blocklist reload error')
+
+
+def parse_feedback_label(value):
+    """'Spam' or 'Not Spam' for a corrected label given as a label name, spam/ham or a boolean."""
+    if isinstance(value, bool):
+        return 'Spam' if value else 'Not Spam'
+    if isinstance(value, str):
+        v = value.strip().lower()
+        for label in HISTORY_LABELS:
+            if v == label.lower():
+                return label
+        if v in ('spam', '1', 'true'):
+            return 'Spam'
+        if v in ('ham', 'not_spam', '0', 'false'):
+            return 'Not Spam'
+    raise ValueError(f"label must be one of {', '.join(HISTORY_LABELS)}")
+
+
+@app.route('/feedback', methods=['OPTIONS', 'POST'])
+@cross_origin()
+def feedback():
+    """Queue corrected labels for the online model.
+
+    Accepts {"text": "...", "label": "Spam"} or {"messages": [{"text", "label"}, ...]};
+    updates are applied in the background, so the response only confirms queueing.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    if online_learner is None:
+        return jsonify({'error': 'Online learning is disabled (set ONLINE_LEARNING=1)'}), 404
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object.'}), 400
+    items = data.get('messages', [data])
+    if not isinstance(items, list) or not items or len(items) > PREDICT_BATCH_MAX:
+        return jsonify({'error': f'`messages` must be a list of 1 to {PREDICT_BATCH_MAX} items.'}), 400
+    texts = []
+    labels = []
+    for i, item in enumerate(items):
+        text = item.get('text') if isinstance(item, dict) else None
+        if not text or not isinstance(text, str):
+            return jsonify({'error': f'messages[{i}]: `text` field is required.'}), 400
+        try:
+            labels.append(parse_feedback_label(item.get('label')))
+        except ValueError as e:
+            return jsonify({'error': f'messages[{i}]: {str(e)}'}), 400
+        texts.append(text)
+    accepted = online_learner.submit(texts, labels)
+    status = 202 if accepted == len(texts) else 503
+    return jsonify({'accepted': accepted, 'rejected': len(texts) - accepted, **online_learner.stats()}), status
+
+
+@app.route('/feedback/stats', methods=['GET'])
+@cross_origin()
+def feedback_stats():
+    """Version, update and queue counters of the online model."""
+    if online_learner is None:
+        return jsonify({'error': 'Online learning is disabled (set ONLINE_LEARNING=1)'}), 404
+    return jsonify(online_learner.stats())
+
+
+def parse_history_query(args):
+    """Filters for HistoryStore.page()/iter_entries() from query args; raises ValueError on bad input."""
+    filters = {}
+    for name in ('since', 'until'):
+        value = args.get(name)
+        if value:
+            # Stored timestamps are compared as strings, so bounds must use the same
+            # form; values without an offset are taken as UTC
+            if value.endswith('Z'):
+                value = value[:-1] + '+00:00'
+            filters[name] = utc_timestamp(datetime.fromisoformat(value))
+    label = args.get('label')
+    if label:
+        matches = [l for l in HISTORY_LABELS if l.lower() == label.lower()]
+        if not matches:
+            raise ValueError(f"label must be one of {', '.join(HISTORY_LABELS)}")
+        filters['label'] = matches[0]
+    fallback = args.get('fallback')
+    if fallback:
+        if fallback.lower() not in ('1', 'true', '0', 'false'):
+            raise ValueError('fallback must be true or false')
+        filters['fallback'] = fallback.lower() in ('1', 'true')
+    return filters
 
 
 @app.route('/history', methods=['GET'])
 @cross_origin()
 def get_history():
     try:
-        if not os.path.exists(HISTORY_PATH):
-            # Return empty list if file doesn't exist yet
-            return jsonify({"history": []})
-            
-        with open(HISTORY_PATH, 'r') as f:
-            try:
-                history = json.load(f)
-                # Ensure we always return a list
-                if not isinstance(history, list):
-                    app.logger.warning('History file did not contain a list, resetting')
-                    history = []
-                # Return as an object with a 'history' property containing the array
-                return jsonify({"history": history})
-            except json.JSONDecodeError as e:
-                app.logger.error(f'Invalid JSON in history file: {str(e)}')
-                return jsonify({"history": [], "error": "Invalid history data"}), 500
-    except IOError as e:
-        app.logger.error(f'Error reading history file: {str(e)}')
-        return jsonify({"history": [], "error": "Could not read history file"}), 500
+        try:
+            filters = parse_history_query(request.args)
+            limit = int(request.args.get('limit', history_store.max_entries))
+            cursor = request.args.get('cursor')
+            cursor = int(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"history": [], "error": f'Invalid query: {str(e)}'}), 400
+        limit = max(1, min(limit, HISTORY_PAGE_MAX))
+        with request_stage('flush'):
+            flush_history()
+        with request_stage('query'):
+            entries, next_cursor = history_store.page(limit, cursor, **filters)
+        # Return as an object with a 'history' property containing the array
+        with request_stage('serialize'):
+            return jsonify({"history": entries, "next_cursor": str(next_cursor) if next_cursor else None})
+    except sqlite3.Error as e:
+        app.logger.error(f'Error reading history store: {str(e)}')
+        return jsonify({"history": [], "error": "Could not read history"}), 500
     except Exception as e:
         app.logger.error(f'Unexpected error getting history: {str(e)}')
         return jsonify({"history": [], "error": "Internal server error"}), 500
 
 
+@app.route('/history/stats', methods=['GET'])
+@cross_origin()
+def history_stats():
+    """Spam rate over time, label and fallback split and probability histogram."""
+    try:
+        minutes = int(request.args.get('minutes', 60))
+        hours = int(request.args.get('hours', 24))
+    except ValueError:
+        return jsonify({"error": "minutes and hours must be integers"}), 400
+    try:
+        with request_stage('flush'):
+            flush_history()
+        with request_stage('query'):
+            stats = history_store.stats(minutes, hours)
+        with request_stage('serialize'):
+            return jsonify(stats)
+    except sqlite3.Error as e:
+        app.logger.error(f'Error reading history stats: {str(e)}')
+        return jsonify({"error": "Could not read history stats"}), 500
+
+
+def history_csv_rows(first, rest):
+    """CSV text for the history export, one chunk of rows at a time."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Message", "Is Spam", "Confidence", "Timestamp"])
+    n = 0
+    for entry in itertools.chain([first], rest):
+        writer.writerow([
+            entry.get('text', ''),
+            'Yes' if entry.get('label') == 'Spam' else 'No',
+            f"{entry.get('probability') or 0:.2%}",
+            entry.get('timestamp', '')
+        ])
+        n += 1
+        if n % HISTORY_EXPORT_CHUNK == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+
 @app.route('/download-history', methods=['GET'])
 @cross_origin()
 def download_history():
     try:
-        if not os.path.exists(HISTORY_PATH):
-            return jsonify({"error": "No history available"}), 404
-            
-        with open(HISTORY_PATH, 'r') as f:
-            history = json.load(f)
-        
-        if not history:
+        try:
+            filters = parse_history_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": f'Invalid query: {str(e)}'}), 400
+        with request_stage('flush'):
+            flush_history()
+        # Only the first chunk is timed; the rest is streamed after the handler returns
+        with request_stage('query'):
+            entries = history_store.iter_entries(HISTORY_EXPORT_CHUNK, **filters)
+            first = next(entries, None)
+        if first is None:
             return jsonify({"error": "No history available"}), 404
-        
-        # Convert to CSV
-        import csv
-        from io import StringIO
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(["Message", "Is Spam", "Confidence", "Timestamp"])
-        
-        # Write data
-        for entry in history:
-            writer.writerow([
-                entry.get('message', ''),
-                'Yes' if entry.get('label') == 'Spam' else 'No',
-                f"{entry.get('probability', 0):.2%}",
-                entry.get('timestamp', '')
-            ])
-        
-        # Create response with CSV
-        response = app.response_class(
-            response=output.getvalue(),
+
+        # Rows are written as they are read from the store, so memory use doesn't grow with history size
+        return app.response_class(
+            history_csv_rows(first, entries),
             mimetype='text/csv',
             headers={"Content-disposition": "attachment; filename=spam_detection_history.csv"}
         )
-        return response
-        
+
     except Exception as e:
         app.logger.error(f"Error downloading history: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -390,15 +1338,15 @@ def download_history():
 @cross_origin()
 def clear_history():
     try:
-        if os.path.exists(HISTORY_PATH):
-            os.remove(HISTORY_PATH)
-        # Ensure the file exists but is empty after clear
-        with open(HISTORY_PATH, 'w') as f:
-            json.dump([], f)
+        # Flush first so queued entries don't reappear after the clear
+        with request_stage('flush'):
+            flush_history()
+        with request_stage('query'):
+            history_store.clear()
         return jsonify({"status": "success", "message": "History cleared"})
-    except IOError as e:
-        app.logger.error(f'IOError clearing history: {str(e)}')
-        return jsonify({"error": "Could not clear history file"}), 500
+    except sqlite3.Error as e:
+        app.logger.error(f'Error clearing history store: {str(e)}')
+        return jsonify({"error": "Could not clear history"}), 500
     except Exception as e:
         app.logger.error(f'Unexpected error clearing history: {str(e)}')
         return jsonify({"error": "Internal server error"}), 500
@@ -422,19 +1370,34 @@ def serve_index():
     return jsonify({'ok': True, 'message': 'API running'})
 
 
-if __name__ == '__main__':
-    # Allow explicit control of debug mode via environment variable
+def prepare_artifacts():
+    """Load artifacts, training from the dataset when none exist. Returns True if a model is ready."""
+    if online_learner is not None:
+        ok = prepare_online_model()
+        seed_indexes(artifacts)
+        return ok
     ok = try_load_artifacts()
     if not ok and os.path.exists(DATASET_PATH):
         print('Artifacts not found, training from dataset...')
-        trained = train_from_dataset()
-        if not trained:
+        ok = train_from_dataset()
+        if not ok:
             print('Failed to train from dataset; server will still start but /predict will return an error until artifacts are provided.')
+    seed_indexes(artifacts)
+    return ok
 
+
+if __name__ == '__main__':
+    prepare_artifacts()
+
+    if MODEL_WATCH_INTERVAL > 0:
+        artifact_watcher.start()
+    start_online_learner()
+
+    # Allow explicit control of debug mode via environment variable
     debug_mode = os.environ.get('FLASK_DEBUG', '0') in ('1', 'true', 'True')
     if debug_mode:
         print('Starting development server (debug mode enabled)')
     else:
-        print('Starting Flask app (debug mode disabled). For production use a WSGI server like waitress.')
+        print('Starting Flask app (debug mode disabled). For production run serve.py.')
 
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=debug_mode)
@@ -0,0 +1,93 @@
+"""
+Where the serving model artifacts live, and how freshly trained ones are written.
+app.py, training.py and model_compact.py share these paths and helpers. Importing
+this module has no side effects, so offline tools can save artifacts and export
+bundles without starting the server (history store, indexes, bundle autoexport).
+"""
+import hashlib
+import logging
+import os
+
+import joblib
+
+from model_bundle import export_bundle
+
+APP_DIR = os.path.dirname(__file__)
+# Define primary and alternative model/vectorizer paths
+MODEL_PATH = os.path.join(APP_DIR, 'spam_detector_model.pkl')
+VECT_PATH = os.path.join(APP_DIR, 'tfidf_vectorizer.pkl')
+# Fallback to alternative filenames if primary not found
+ALT_MODEL_NAMES = ['model.pkl', 'spam_detector.pkl']
+ALT_VECT_NAMES = ['vectorizer.pkl', 'tfidf_vectorizer.pkl']
+# Artifacts are also looked up in the workspace root (one level up)
+WORKSPACE_ROOT = os.path.abspath(os.path.join(APP_DIR, '..'))
+# Versioned, memory-mapped bundle preferred over the .pkl files (see model_bundle.py).
+# With MODEL_BUNDLE_AUTOEXPORT, .pkl artifacts are converted into a bundle when loaded or saved.
+MODEL_BUNDLE_DIR = os.environ.get('MODEL_BUNDLE_DIR', os.path.join(APP_DIR, 'model_bundle'))
+MODEL_BUNDLE_AUTOEXPORT = os.environ.get('MODEL_BUNDLE_AUTOEXPORT', '1').lower() not in ('0', 'false')
+# Scored after every load to validate new artifacts and warm them up before they serve traffic
+WARMUP_MESSAGES = [
+    'Congratulations! You won a free GCash prize! Claim now: https://bit.ly/claim-prize',
+    "[FEX] Your parcel couldn't reach you. Please contact the branch at 9283170245.",
+    'Hi kuya, can you pick me up after lunch? Thanks!',
+    'Your Reward Points expire today. Please redeem your gift soon.',
+]
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_version(*paths):
+    """Short fingerprint of artifact files based on their path, size and mtime."""
+    h = hashlib.sha1()
+    for p in paths:
+        st = os.stat(p)
+        h.update(f'{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns};'.encode('utf-8'))
+    return h.hexdigest()[:12]
+
+
+def find_artifact_paths():
+    """First (model, vectorizer) .pkl pair that exists, in lookup priority order, or None."""
+    # Try explicit paths first
+    candidates = [(MODEL_PATH, VECT_PATH)]
+    # Then alternative filenames in the backend folder and in the workspace root
+    for folder in (APP_DIR, WORKSPACE_ROOT):
+        for mname in ALT_MODEL_NAMES:
+            for vname in ALT_VECT_NAMES:
+                candidates.append((os.path.join(folder, mname), os.path.join(folder, vname)))
+    for mpath, vpath in candidates:
+        if os.path.exists(mpath) and os.path.exists(vpath):
+            return mpath, vpath
+    return None
+
+
+def export_artifact_bundle(bundle_model, bundle_vectorizer, model_path, vect_path, training=None):
+    """Write the memory-mappable bundle for artifacts loaded from (or saved to) .pkl files."""
+    try:
+        metadata = {
+            'source': {
+                'model': os.path.abspath(model_path),
+                'vectorizer': os.path.abspath(vect_path),
+                'fingerprint': artifact_version(model_path, vect_path),
+            },
+        }
+        if training is not None:
+            metadata['training'] = training
+        manifest = export_bundle(bundle_model, bundle_vectorizer, MODEL_BUNDLE_DIR, metadata=metadata)
+        print(f"Exported model bundle {manifest['version']} to {MODEL_BUNDLE_DIR}")
+        return manifest
+    except Exception as e:
+        logger.warning(f'Could not export model bundle: {str(e)}')
+        return None
+
+
+def save_trained_artifacts(model, vectorizer, training=None, export=None):
+    """Write freshly trained artifacts as the serving .pkl pair (and bundle); returns their paths.
+
+    `export` defaults to MODEL_BUNDLE_AUTOEXPORT.
+    """
+    model_file, vect_file = MODEL_PATH, VECT_PATH
+    joblib.dump(model, model_file)
+    joblib.dump(vectorizer, vect_file)
+    if MODEL_BUNDLE_AUTOEXPORT if export is None else export:
+        export_artifact_bundle(model, vectorizer, model_file, vect_file, training=training)
+    return model_file, vect_file
@@ -0,0 +1,73 @@
+"""
+Polling watcher for model artifact files.
+Fingerprints a set of paths (size and mtime) every few seconds and calls back when
+any of them changes, so a retrained model dropped next to the server is picked up
+without a restart. Polling keeps it dependency-free and works on network mounts.
+"""
+import os
+import threading
+
+
+def fingerprint(paths):
+    """Tuple of (path, size, mtime_ns) for each existing path."""
+    out = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        out.append((path, st.st_size, st.st_mtime_ns))
+    return tuple(out)
+
+
+class ArtifactWatcher:
+    """Call `on_change()` from a daemon thread when the watched files change.
+
+    `paths` is a callable returning the paths to watch, so newly created
+    candidates are noticed too. A change must be stable for one extra poll
+    before the callback runs, which skips files that are still being written.
+    The fingerprint is taken again after the callback, so files the callback
+    itself writes (e.g. an exported bundle) do not trigger another round.
+    """
+
+    def __init__(self, paths, on_change, interval=5.0, logger=None):
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = float(interval)
+        self.logger = logger
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._last = fingerprint(self.paths())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='artifact-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            try:
+                current = fingerprint(self.paths())
+                if current == self._last:
+                    pending = None
+                    continue
+                if current != pending:
+                    # Wait one more interval for writers to finish
+                    pending = current
+                    continue
+                pending = None
+                self.on_change()
+                self._last = fingerprint(self.paths())
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f'Artifact watcher error: {str(e)}')
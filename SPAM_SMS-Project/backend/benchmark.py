@@ -0,0 +1,302 @@
+"""
+Benchmark suite for the inference and history hot paths of app.py.
+Uses SPAM_SMS.csv as the corpus and times artifact loading (in-process and in a fresh
+interpreter), per-message vectorizer.transform / predict_proba / score_texts latency,
+batch throughput, the rule-engine fallback, save_history under sustained writes and
+GET /history reads at several history sizes.
+
+Results are written as JSON (p50/p95/p99/mean in milliseconds per case, plus
+messages/s for throughput cases). With --baseline the run is compared against an
+earlier result and cases that got slower than --threshold are reported as
+regressions (exit status 1 with --fail-on-regression).
+
+Usage:
+    python benchmark.py                                  # writes benchmark_results.json
+    python benchmark.py --save-baseline                  # also stores it as the baseline
+    python benchmark.py --baseline benchmark_baseline.json --fail-on-regression
+    python benchmark.py --only predict,history --quick
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Measure the raw paths: no prediction cache or request coalescing, history kept out of the real store
+_BENCH_DIR = tempfile.mkdtemp(prefix='spam-bench-')
+os.environ.update({
+    'PREDICTION_CACHE_SIZE': '0',
+    'MICRO_BATCH': '0',
+    'HISTORY_DB_PATH': os.path.join(_BENCH_DIR, 'history.sqlite3'),
+    'SENDER_REPUTATION': '0',
+    'ONLINE_LEARNING': '0',
+})
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import app as api  # noqa: E402
+from history_store import HistoryStore  # noqa: E402
+from history_writer import HistoryWriter  # noqa: E402
+
+DEFAULT_OUTPUT = os.path.join(HERE, 'benchmark_results.json')
+DEFAULT_BASELINE = os.path.join(HERE, 'benchmark_baseline.json')
+BATCH_SIZES = (1, 8, 64, 256, 1024)
+HISTORY_SIZES = (100, 1000, 10000, 100000)
+GROUPS = ('load', 'predict', 'batch', 'fallback', 'history')
+# Compared metrics; throughput is higher-is-better, latencies lower-is-better
+COMPARED = ('p50', 'p95', 'msgs_per_s')
+
+
+def summarize(samples, per_call=None):
+    """Latency percentiles in ms for `samples` (seconds per call), and messages/s given `per_call`."""
+    ms = np.asarray(samples) * 1000.0
+    out = {
+        'n': int(len(ms)),
+        'p50': round(float(np.percentile(ms, 50)), 4),
+        'p95': round(float(np.percentile(ms, 95)), 4),
+        'p99': round(float(np.percentile(ms, 99)), 4),
+        'mean': round(float(ms.mean()), 4),
+    }
+    if per_call:
+        out['msgs_per_s'] = round(per_call * len(ms) / max(float(np.sum(samples)), 1e-12), 1)
+    return out
+
+
+def timed(fn, args_list, warmup=3):
+    """Seconds per call of fn(*args) for each args tuple, after a few warm-up calls."""
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for args in args_list:
+            t0 = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - t0)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples
+
+
+def history_entry(i, text):
+    label = 'Spam' if i % 3 else 'Not Spam'
+    return api.make_history_entry(text, label, 0.9 if label == 'Spam' else 0.1, False)
+
+
+class Suite:
+    def __init__(self, texts, repeat, quick):
+        self.texts = texts
+        self.repeat = repeat
+        self.quick = quick
+        self.results = {}
+        self.arts = None
+
+    def record(self, name, samples, per_call=None, **extra):
+        result = summarize(samples, per_call)
+        result.update(extra)
+        self.results[name] = result
+        tput = f"  {result['msgs_per_s']:>12,.0f} msg/s" if 'msgs_per_s' in result else ''
+        print(f"{name:40s} p50 {result['p50']:9.3f}ms  p95 {result['p95']:9.3f}ms  p99 {result['p99']:9.3f}ms{tput}")
+
+    def messages(self, n=None):
+        n = n or len(self.texts) * self.repeat
+        return [self.texts[i % len(self.texts)] for i in range(n)]
+
+    def load(self):
+        api.MODEL_BUNDLE_AUTOEXPORT = False
+        runs = 3 if self.quick else 10
+        pkl_paths = api.find_artifact_paths()
+        # The loaders print a line per load
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            try_load = timed(api.try_load_artifacts, [()] * runs, warmup=1)
+            pkl = timed(api.load_pkl_set, [pkl_paths] * runs, warmup=1) if pkl_paths else None
+        self.record('load.try_load_artifacts', try_load, source=api.artifacts.source if api.artifacts else None)
+        if pkl is not None:
+            self.record('load.pkl', pkl)
+        # A fresh interpreter: imports, artifact loading and nothing cached in-process
+        code = 'import time; t0 = time.perf_counter(); import app; app.try_load_artifacts(); print(time.perf_counter() - t0)'
+        env = dict(os.environ, PYTHONWARNINGS='ignore', MODEL_BUNDLE_AUTOEXPORT='0')
+        samples = []
+        for _ in range(2 if self.quick else 5):
+            out = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, capture_output=True, text=True,
+                                 check=True)
+            samples.append(float(out.stdout.strip().splitlines()[-1]))
+        self.record('load.cold_start_process', samples)
+
+    def predict(self):
+        arts = self.arts
+        msgs = [(t,) for t in self.messages()]
+        self.record('predict.transform', timed(lambda t: arts.vectorizer.transform([t]), msgs), per_call=1)
+        rows = [(arts.vectorizer.transform([t]),) for (t,) in msgs[:len(self.texts)]]
+        self.record('predict.predict_proba', timed(arts.model.predict_proba, rows * self.repeat), per_call=1)
+        self.record('predict.score_texts', timed(lambda t: api.score_texts(arts, [t]), msgs), per_call=1,
+                    fast_scorer=arts.scorer is not None)
+
+    def batch(self):
+        arts = self.arts
+        n = len(self.texts)
+        for size in BATCH_SIZES:
+            calls = max(5, min(200, n * self.repeat // size))
+            batches = [([self.texts[(i * size + j) % n] for j in range(size)],) for i in range(calls)]
+            self.record(f'batch.score_texts.{size}', timed(lambda b: api.score_texts(arts, b), batches),
+                        per_call=size)
+
+    def fallback(self):
+        msgs = [(t,) for t in self.messages()]
+        self.record('fallback.rule_predict', timed(lambda t: api.rule_predict([t]), msgs), per_call=1)
+
+    def history(self):
+        saved = (api.history_store, api.history_writer, api.HISTORY_ASYNC)
+        try:
+            writes = 500 if self.quick else 2000
+            entries = [(history_entry(i, self.texts[i % len(self.texts)]),) for i in range(writes)]
+
+            store = HistoryStore(os.path.join(_BENCH_DIR, 'writes-sync.sqlite3'), max_entries=writes)
+            api.history_store, api.HISTORY_ASYNC = store, False
+            self.record('history.save_history.sync', timed(api.save_history, entries), per_call=1)
+
+            store = HistoryStore(os.path.join(_BENCH_DIR, 'writes-async.sqlite3'), max_entries=writes)
+            writer = HistoryWriter(store.append, max_queue=writes * 2)
+            api.history_store, api.history_writer, api.HISTORY_ASYNC = store, writer, True
+            t0 = time.perf_counter()
+            samples = timed(api.save_history, entries)
+            writer.flush()
+            drained = time.perf_counter() - t0
+            writer.close()
+            self.record('history.save_history.async', samples,
+                        drained_msgs_per_s=round(len(entries) / drained, 1))
+
+            client = api.app.test_client()
+            sizes = [s for s in HISTORY_SIZES if not self.quick or s <= 10000]
+            for size in sizes:
+                store = HistoryStore(os.path.join(_BENCH_DIR, f'read-{size}.sqlite3'), max_entries=size,
+                                     compact_every=size + 1)
+                chunk = [history_entry(i, self.texts[i % len(self.texts)]) for i in range(min(size, 5000))]
+                for start in range(0, size, len(chunk)):
+                    store.append(chunk[:size - start])
+                api.history_store, api.HISTORY_ASYNC = store, False
+                calls = [()] * (50 if self.quick else 200)
+                for limit in (50, 1000):
+                    self.record(f'history.read.{size}.limit{limit}',
+                                timed(lambda: client.get(f'/history?limit={limit}'), calls))
+                self.record(f'history.read.{size}.spam_filter',
+                            timed(lambda: client.get('/history?limit=50&label=Spam'), calls))
+                self.record(f'history.stats.{size}', timed(lambda: client.get('/history/stats'), calls))
+        finally:
+            api.history_store, api.history_writer, api.HISTORY_ASYNC = saved
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """[(case, metric, baseline, current, change)] for metrics worse than `threshold` (a fraction)."""
+    regressions = []
+    print(f"\nCompared with baseline from {baseline['meta'].get('timestamp')} (commit {baseline['meta'].get('commit')}):")
+    for name, current in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        changes = []
+        for metric in COMPARED:
+            if metric not in current or metric not in base or not base[metric]:
+                continue
+            change = (current[metric] - base[metric]) / base[metric]
+            worse = -change if metric == 'msgs_per_s' else change
+            changes.append(f'{metric} {change:+.1%}')
+            if worse > threshold:
+                regressions.append((name, metric, base[metric], current[metric], change))
+        flag = '  REGRESSION' if any(r[0] == name for r in regressions) else ''
+        print(f"  {name:40s} {', '.join(changes)}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the inference and history hot paths.')
+    parser.add_argument('--dataset', default=api.DATASET_PATH)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', help=f'Compare with this result file (e.g. {os.path.basename(DEFAULT_BASELINE)})')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Also write the results to {DEFAULT_BASELINE}')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--only', help=f"Comma-separated groups: {','.join(GROUPS)}")
+    parser.add_argument('--repeat', type=int, default=2, help='Passes over the corpus for per-message cases')
+    parser.add_argument('--quick', action='store_true', help='Fewer iterations and smaller histories')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    groups = args.only.split(',') if args.only else list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+
+    texts = pd.read_csv(args.dataset)['text'].dropna().astype(str).tolist()
+    # A fixed shuffle so every run sees the same message order
+    random.Random(args.seed).shuffle(texts)
+    suite = Suite(texts, 1 if args.quick else args.repeat, args.quick)
+    api.MODEL_BUNDLE_AUTOEXPORT = False
+    suite.arts = api.load_artifact_set()
+    if suite.arts is None and set(groups) & {'predict', 'batch'}:
+        print('No model artifacts found; skipping predict and batch cases')
+        groups = [g for g in groups if g not in ('predict', 'batch')]
+
+    try:
+        for group in groups:
+            getattr(suite, group)()
+    finally:
+        shutil.rmtree(_BENCH_DIR, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'dataset': os.path.abspath(args.dataset),
+            'messages': len(texts),
+            'model_version': suite.arts.version if suite.arts else None,
+            'model_source': suite.arts.source if suite.arts else None,
+            'quick': args.quick,
+            'seed': args.seed,
+        },
+        'results': suite.results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nWrote {args.output}')
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved baseline {DEFAULT_BASELINE}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(suite.results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}')
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
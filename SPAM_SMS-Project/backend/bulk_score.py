@@ -0,0 +1,199 @@
+"""
+Offline bulk scoring for archives in the SPAM_SMS.csv format.
+Reads the input in chunks, scores them on a process pool with the same artifacts
+app.py serves (bundle first, then .pkl files; the rule engine when neither exists)
+and appends label/probability/fallback columns to every row, in input order
+(plus an explanation column, the same structure /predict returns, with --explain).
+At most `2 x workers` chunks are in flight, so memory stays bounded on any input size.
+
+A checkpoint next to the output records how far the run got; --resume continues
+from it after an interruption.
+
+Usage:
+    python bulk_score.py archive.csv scored.csv [--format jsonl] [--workers 8] [--chunksize 20000]
+    python bulk_score.py archive.csv scored.csv --resume
+    python bulk_score.py archive.csv scored.jsonl --explain
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import app as api
+
+# Seconds between rows/s progress lines on stderr
+PROGRESS_INTERVAL = 2.0
+
+# Artifacts of this process; inherited from the parent when workers are forked
+_artifacts = None
+
+
+def load_worker_artifacts(autoexport=True):
+    global _artifacts
+    if _artifacts is None:
+        api.MODEL_BUNDLE_AUTOEXPORT = autoexport
+        _artifacts = api.load_artifact_set() or False
+    return _artifacts
+
+
+def score_chunk(texts, explain=False):
+    """(labels, probabilities, fallback, explanations) for one chunk; missing texts get an empty label.
+
+    `explanations` is None unless `explain` is set.
+    """
+    # Workers started with spawn load here, once; the bundle was already exported by the parent
+    arts = load_worker_artifacts(autoexport=False)
+    present = [i for i, t in enumerate(texts) if isinstance(t, str) and t.strip()]
+    labels = [''] * len(texts)
+    probs = [None] * len(texts)
+    explanations = [None] * len(texts) if explain else None
+    if present:
+        batch = [texts[i] for i in present]
+        scored = api.score_texts(arts, batch) if arts else [r[:2] for r in api.rule_predict(batch)]
+        for i, (label, prob) in zip(present, scored):
+            labels[i] = label
+            probs[i] = prob
+        if explain:
+            for i, explanation in zip(present, api.explain_texts(arts or None, batch)):
+                explanations[i] = explanation
+    return labels, probs, not arts, explanations
+
+
+def checkpoint_path(output):
+    return f'{output}.checkpoint.json'
+
+
+def read_checkpoint(args):
+    path = checkpoint_path(args.output)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        ckpt = json.load(f)
+    expected = {'input': os.path.abspath(args.input), 'chunksize': args.chunksize, 'format': args.format,
+                'explain': args.explain}
+    for key, value in expected.items():
+        if ckpt.get(key) != value:
+            raise SystemExit(f'Checkpoint {path} was written with {key}={ckpt.get(key)!r}, not {value!r}')
+    return ckpt
+
+
+def write_checkpoint(args, rows, output_bytes):
+    path = checkpoint_path(args.output)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({
+            'input': os.path.abspath(args.input),
+            'chunksize': args.chunksize,
+            'format': args.format,
+            'explain': args.explain,
+            'rows': rows,
+            'output_bytes': output_bytes,
+        }, f)
+    os.replace(tmp, path)
+
+
+def write_chunk(out, chunk, result, fmt, header):
+    labels, probs, fallback, explanations = result
+    chunk = chunk.assign(label=labels, probability=probs, fallback=fallback)
+    if explanations is not None:
+        # Nested objects in JSON lines, one JSON document per cell in CSV
+        chunk['explanation'] = explanations if fmt == 'jsonl' else [
+            '' if e is None else json.dumps(e, ensure_ascii=False) for e in explanations]
+    if fmt == 'jsonl':
+        text = chunk.to_json(orient='records', lines=True, force_ascii=False)
+        out.write(text if text.endswith('\n') else text + '\n')
+    else:
+        chunk.to_csv(out, index=False, header=header)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score an SMS archive offline.')
+    parser.add_argument('input', help='CSV in the SPAM_SMS.csv format')
+    parser.add_argument('output', help='Output file (.csv or .jsonl)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='Default: from the output extension')
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--chunksize', type=int, default=20000, help='Rows per chunk')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Scoring processes (0 scores in this process)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint of an interrupted run')
+    parser.add_argument('--explain', action='store_true',
+                        help='Add an explanation column (top terms and matched rules, as in /predict)')
+    args = parser.parse_args()
+    if args.format is None:
+        args.format = 'jsonl' if args.output.endswith(('.jsonl', '.json')) else 'csv'
+
+    ckpt = read_checkpoint(args) if args.resume else None
+    if args.resume and ckpt is None:
+        print(f'No checkpoint for {args.output}; starting from the beginning', file=sys.stderr)
+    skip = ckpt['rows'] if ckpt else 0
+
+    # Load (and export the bundle) once here; forked workers inherit the loaded model
+    arts = load_worker_artifacts()
+    print(f"Scoring with {'model ' + arts.version if arts else 'rule engine (no model artifacts found)'}",
+          file=sys.stderr)
+
+    # Keep every column as the original text (numbers with leading zeros, empty cells)
+    reader = pd.read_csv(args.input, chunksize=args.chunksize, dtype=str, keep_default_na=False)
+    # Checkpoints fall on chunk boundaries; skip whole chunks so quoted multi-line texts can't shift rows
+    for _ in range(skip // args.chunksize):
+        next(reader)
+    mode = 'r+' if ckpt else 'w'
+    if ckpt and not os.path.exists(args.output):
+        raise SystemExit(f'Checkpoint found but {args.output} is missing; rerun without --resume')
+    out = open(args.output, mode, encoding='utf-8', newline='')
+    if ckpt:
+        # Drop anything written after the last checkpoint
+        out.truncate(ckpt['output_bytes'])
+        out.seek(ckpt['output_bytes'])
+
+    pool = ProcessPoolExecutor(args.workers) if args.workers > 0 else None
+    pending = collections.deque()
+    max_pending = 2 * max(1, args.workers)
+    rows = skip
+    started = last_report = time.monotonic()
+    header = skip == 0
+
+    def finish_oldest():
+        nonlocal rows, header, last_report
+        chunk, future = pending.popleft()
+        result = future.result() if pool else future
+        write_chunk(out, chunk, result, args.format, header)
+        header = False
+        out.flush()
+        rows += len(chunk)
+        write_checkpoint(args, rows, out.tell())
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            rate = (rows - skip) / (now - started)
+            print(f'{rows} rows scored ({rate:,.0f} rows/s)', file=sys.stderr)
+
+    try:
+        for chunk in reader:
+            if args.text_column not in chunk.columns:
+                raise SystemExit(f'Input has no {args.text_column!r} column')
+            texts = chunk[args.text_column].tolist()
+            pending.append((chunk, pool.submit(score_chunk, texts, args.explain) if pool
+                            else score_chunk(texts, args.explain)))
+            while len(pending) >= max_pending:
+                finish_oldest()
+        while pending:
+            finish_oldest()
+    finally:
+        out.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    os.remove(checkpoint_path(args.output))
+    elapsed = time.monotonic() - started
+    print(f'Done: {rows} rows in {args.output} ({(rows - skip) / max(elapsed, 1e-9):,.0f} rows/s, '
+          f'{elapsed:.1f}s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
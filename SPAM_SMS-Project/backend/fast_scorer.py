@@ -0,0 +1,182 @@
+"""
+Native linear scorer for TF-IDF + LogisticRegression artifacts.
+For these models a spam score is a sparse dot product plus a sigmoid, so the fitted
+vectorizer and classifier are compiled into NumPy lookup arrays once and single
+messages are scored without sklearn's per-call input validation.
+
+Run this file to check parity against sklearn's predict_proba on SPAM_SMS.csv:
+    python fast_scorer.py [--model spam_detector.pkl --vectorizer tfidf_vectorizer.pkl]
+"""
+import math
+import os
+
+import numpy as np
+
+
+class LinearScorer:
+    """Spam probability for a binary linear model over TF-IDF (or raw count) features."""
+
+    def __init__(self, analyzer, vocabulary, idf, coef, intercept, spam_positive=True,
+                 norm='l2', sublinear_tf=False, binary=False):
+        self.analyzer = analyzer
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        # idf x coef: contribution of one unit of raw term frequency before normalization
+        self.weights = self.idf * self.coef
+        self.intercept = float(intercept)
+        self.spam_positive = spam_positive
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+
+    def term_counts(self, text):
+        """Vocabulary indices and raw counts of the in-vocabulary tokens of `text`."""
+        counts = {}
+        vocab = self.vocabulary
+        for token in self.analyzer(text):
+            j = vocab.get(token)
+            if j is not None:
+                counts[j] = counts.get(j, 0) + 1
+        idx = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        return idx, tf
+
+    def features(self, text):
+        """Sparse TF-IDF row for `text` as (indices, normalized values)."""
+        idx, tf = self.term_counts(text)
+        if self.binary:
+            tf = np.ones_like(tf)
+        elif self.sublinear_tf:
+            tf = np.log(tf) + 1.0
+        values = tf * self.idf[idx]
+        if self.norm == 'l2':
+            n = math.sqrt(float(values @ values))
+        elif self.norm == 'l1':
+            n = float(np.abs(values).sum())
+        else:
+            n = 1.0
+        if n > 0:
+            values = values / n
+        return idx, values
+
+    def decision(self, text):
+        idx, values = self.features(text)
+        return float(values @ self.coef[idx]) + self.intercept
+
+    def spam_probability(self, text):
+        z = self.decision(text)
+        if not self.spam_positive:
+            z = -z
+        # Numerically stable sigmoid
+        if z >= 0:
+            return 1.0 / (1.0 + math.exp(-z))
+        e = math.exp(z)
+        return e / (1.0 + e)
+
+    def spam_probabilities(self, texts):
+        return [self.spam_probability(t) for t in texts]
+
+
+def compile_scorer(model, vectorizer, spam_idx=None):
+    """Build a LinearScorer from fitted sklearn artifacts, or return None if unsupported.
+
+    Supported: a binary LogisticRegression on top of a word-level TfidfVectorizer
+    (or CountVectorizer). Other models, e.g. MultinomialNB, keep using sklearn.
+    """
+    try:
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.feature_extraction.text import CountVectorizer
+    except ImportError:
+        return None
+    if not isinstance(model, LogisticRegression) or not isinstance(vectorizer, CountVectorizer):
+        return None
+    coef = getattr(model, 'coef_', None)
+    classes = getattr(model, 'classes_', None)
+    vocab = getattr(vectorizer, 'vocabulary_', None)
+    if coef is None or classes is None or vocab is None or coef.shape[0] != 1 or len(classes) != 2:
+        return None
+    if coef.shape[1] != len(vocab) or not callable(getattr(vectorizer, 'build_analyzer', None)):
+        return None
+    if spam_idx is None:
+        spam_idx = 1
+        for i, c in enumerate(classes):
+            if str(c).lower() == 'spam':
+                spam_idx = i
+    use_idf = getattr(vectorizer, 'use_idf', False) and hasattr(vectorizer, 'idf_')
+    idf = vectorizer.idf_ if use_idf else np.ones(coef.shape[1])
+    return LinearScorer(
+        analyzer=vectorizer.build_analyzer(),
+        vocabulary=vocab,
+        idf=idf,
+        coef=coef[0],
+        intercept=model.intercept_[0],
+        # predict_proba's second column is sigmoid(decision)
+        spam_positive=(spam_idx == 1),
+        norm=getattr(vectorizer, 'norm', None),
+        sublinear_tf=getattr(vectorizer, 'sublinear_tf', False),
+        binary=vectorizer.binary,
+    )
+
+
+def check_parity(model, vectorizer, texts, tol=1e-9):
+    """Max absolute difference between LinearScorer and sklearn's predict_proba."""
+    scorer = compile_scorer(model, vectorizer)
+    if scorer is None:
+        raise ValueError(f'{type(model).__name__} is not supported by the fast scorer')
+    spam_idx = 1 if scorer.spam_positive else 0
+    expected = model.predict_proba(vectorizer.transform(texts))[:, spam_idx]
+    got = np.array(scorer.spam_probabilities(texts))
+    diff = np.abs(expected - got)
+    worst = int(diff.argmax())
+    return float(diff[worst]), worst, bool(diff.max() <= tol)
+
+
+# Vectorizer settings exercised by the parity suite when no artifacts are given
+PARITY_CONFIGS = [
+    {'stop_words': 'english', 'max_features': 20000},
+    {'stop_words': 'english', 'ngram_range': (1, 2), 'max_features': 5000},
+    {'sublinear_tf': True},
+    {'binary': True, 'norm': 'l1'},
+    {'use_idf': False, 'norm': None},
+]
+# Keyword labels so reference models can be fitted on the unlabeled dataset
+_PARITY_KEYWORDS = ('win', 'free', 'prize', 'cash', 'reward', 'claim', 'promo', 'loan', 'click', 'urgent')
+
+
+def main():
+    import argparse
+    import joblib
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Check fast scorer parity with sklearn predict_proba.')
+    parser.add_argument('--dataset', default=os.path.join(here, 'SPAM_SMS.csv'))
+    parser.add_argument('--model', help='LogisticRegression pickle to check')
+    parser.add_argument('--vectorizer', help='Vectorizer pickle matching --model')
+    parser.add_argument('--tol', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    texts = pd.read_csv(args.dataset)['text'].dropna().astype(str).tolist()
+    cases = []
+    if args.model and args.vectorizer:
+        cases.append((f'{args.model} + {args.vectorizer}', joblib.load(args.model), joblib.load(args.vectorizer)))
+    else:
+        labels = [any(k in t.lower() for k in _PARITY_KEYWORDS) for t in texts]
+        for params in PARITY_CONFIGS:
+            vectorizer = TfidfVectorizer(**params)
+            model = LogisticRegression(max_iter=1000).fit(vectorizer.fit_transform(texts), labels)
+            cases.append((f'TfidfVectorizer({params})', model, vectorizer))
+
+    failed = 0
+    for name, model, vectorizer in cases:
+        diff, worst, ok = check_parity(model, vectorizer, texts, args.tol)
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: max |diff| = {diff:.3e} over {len(texts)} messages (row {worst})")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
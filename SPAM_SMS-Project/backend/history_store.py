@@ -0,0 +1,325 @@
+"""
+Append-only prediction history store for the SMS spam detection API.
+Entries live in a SQLite ring table: every write is a single INSERT, and rows beyond
+the configured cap are trimmed periodically instead of rewriting the whole history.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+# Schema revision kept in PRAGMA user_version; 1 added the stats tables
+SCHEMA_VERSION = 1
+# Probability histogram resolution
+STATS_BINS = 20
+# (name, timestamp prefix length, bucket width) for the time-bucketed counters
+STATS_RESOLUTIONS = (('minute', 16, timedelta(minutes=1)), ('hour', 13, timedelta(hours=1)))
+# Completes a bucket prefix such as '2026-01-31T09' into an ISO timestamp
+_BUCKET_SUFFIX = {'minute': ':00Z', 'hour': ':00:00Z'}
+
+
+def _probability_bin(probability):
+    try:
+        p = float(probability)
+    except (TypeError, ValueError):
+        return 0
+    return min(STATS_BINS - 1, max(0, int(p * STATS_BINS)))
+
+
+class HistoryStore:
+    """Bounded, newest-first prediction history backed by SQLite (WAL mode).
+
+    Safe to share between threads and between processes writing the same file;
+    each thread (and each forked process) gets its own connection.
+
+    Aggregates for stats() are updated in the same transaction as each insert, so
+    they are shared by every process and never require scanning the history.
+    They cover everything recorded since the last clear(), including rows the
+    retention cap has since trimmed; per-minute buckets are kept for
+    `stats_minutes` and per-hour buckets for `stats_hours`.
+    """
+
+    def __init__(self, path, max_entries=200, compact_every=100, legacy_json_path=None,
+                 stats_minutes=24 * 60, stats_hours=30 * 24):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.compact_every = max(1, int(compact_every))
+        self.stats_retention = {'minute': int(stats_minutes), 'hour': int(stats_hours)}
+        self.legacy_json_path = legacy_json_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_compact = 0
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not be reused across fork(), so key them by pid too
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS history ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' timestamp TEXT,'
+                ' label TEXT,'
+                ' probability REAL,'
+                ' fallback INTEGER,'
+                ' entry TEXT NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS history_buckets ('
+                ' resolution TEXT NOT NULL,'
+                ' bucket TEXT NOT NULL,'
+                ' total INTEGER NOT NULL,'
+                ' spam INTEGER NOT NULL,'
+                ' fallback INTEGER NOT NULL,'
+                ' PRIMARY KEY (resolution, bucket))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS history_histogram ('
+                ' bin INTEGER NOT NULL,'
+                ' label TEXT NOT NULL,'
+                ' fallback INTEGER NOT NULL,'
+                ' count INTEGER NOT NULL,'
+                ' PRIMARY KEY (bin, label, fallback))'
+            )
+        if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            # History written before the stats tables existed
+            self.rebuild_stats()
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._import_legacy_json()
+
+    def _import_legacy_json(self):
+        """One-time import of the old rewrite-whole-file history.json (newest-first list)."""
+        path = self.legacy_json_path
+        if not path or not os.path.exists(path) or self.count() > 0:
+            return
+        try:
+            with open(path, 'r') as f:
+                legacy = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return
+        if isinstance(legacy, list) and legacy:
+            # Stored oldest-first so row ids follow insertion time
+            self._insert([e for e in reversed(legacy) if isinstance(e, dict)])
+            self.compact()
+        os.replace(path, f'{path}.migrated')
+
+    def _insert(self, entries):
+        rows = [
+            (
+                e.get('timestamp'),
+                e.get('label'),
+                e.get('probability'),
+                1 if e.get('fallback') else 0,
+                json.dumps(e),
+            )
+            for e in entries
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO history (timestamp, label, probability, fallback, entry) VALUES (?, ?, ?, ?, ?)',
+                rows,
+            )
+            self._add_stats(conn, rows)
+
+    @staticmethod
+    def _add_stats(conn, rows):
+        """Fold (timestamp, label, probability, fallback, ...) rows into the aggregate tables."""
+        buckets = {}
+        histogram = {}
+        for row in rows:
+            timestamp, label, probability, fallback = row[:4]
+            spam = 1 if label == 'Spam' else 0
+            if timestamp:
+                for resolution, width, _ in STATS_RESOLUTIONS:
+                    counts = buckets.setdefault((resolution, timestamp[:width]), [0, 0, 0])
+                    counts[0] += 1
+                    counts[1] += spam
+                    counts[2] += fallback
+            key = (_probability_bin(probability), label or '', fallback)
+            histogram[key] = histogram.get(key, 0) + 1
+        conn.executemany(
+            'INSERT INTO history_buckets (resolution, bucket, total, spam, fallback) VALUES (?, ?, ?, ?, ?)'
+            ' ON CONFLICT (resolution, bucket) DO UPDATE SET total = total + excluded.total,'
+            ' spam = spam + excluded.spam, fallback = fallback + excluded.fallback',
+            [(r, b, *counts) for (r, b), counts in buckets.items()],
+        )
+        conn.executemany(
+            'INSERT INTO history_histogram (bin, label, fallback, count) VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (bin, label, fallback) DO UPDATE SET count = count + excluded.count',
+            [(*key, n) for key, n in histogram.items()],
+        )
+
+    def append(self, entries):
+        """Append entries (given in request order) in one transaction."""
+        if not entries:
+            return
+        self._insert(entries)
+        with self._lock:
+            self._writes_since_compact += len(entries)
+            due = self._writes_since_compact >= self.compact_every
+            if due:
+                self._writes_since_compact = 0
+        if due:
+            self.compact()
+
+    def compact(self):
+        """Trim rows that fell outside the retention window, and expired stats buckets."""
+        conn = self._connect()
+        now = datetime.utcnow()
+        with conn:
+            conn.execute(
+                'DELETE FROM history WHERE id <= (SELECT MAX(id) FROM history) - ?',
+                (self.max_entries,),
+            )
+            for resolution, width, step in STATS_RESOLUTIONS:
+                cutoff = (now - step * self.stats_retention[resolution]).isoformat()[:width]
+                conn.execute(
+                    'DELETE FROM history_buckets WHERE resolution = ? AND bucket < ?', (resolution, cutoff)
+                )
+
+    def recent(self, limit=None):
+        """Return up to `limit` (default: the cap) entries, newest first."""
+        limit = self.max_entries if limit is None else min(int(limit), self.max_entries)
+        rows = self._connect().execute(
+            'SELECT entry FROM history ORDER BY id DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def _where(self, before_id=None, since=None, until=None, label=None, fallback=None):
+        """SQL condition and parameters for the filters shared by page() and iter_entries()."""
+        # Rows past the cap that compaction hasn't removed yet are not part of the history
+        clauses = ['id > (SELECT MAX(id) FROM history) - ?']
+        params = [self.max_entries]
+        if before_id is not None:
+            clauses.append('id < ?')
+            params.append(int(before_id))
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        if label is not None:
+            clauses.append('label = ?')
+            params.append(label)
+        if fallback is not None:
+            clauses.append('fallback = ?')
+            params.append(1 if fallback else 0)
+        return ' AND '.join(clauses), params
+
+    def _select(self, limit, before_id=None, **filters):
+        where, params = self._where(before_id, **filters)
+        return self._connect().execute(
+            f'SELECT id, entry FROM history WHERE {where} ORDER BY id DESC LIMIT ?', params + [limit]
+        ).fetchall()
+
+    def page(self, limit, cursor=None, **filters):
+        """One page of entries, newest first, older than `cursor`.
+
+        Filters: `since`/`until` (ISO timestamps, until exclusive), `label` and
+        `fallback`. Returns (entries, next_cursor); next_cursor is None on the
+        last page and otherwise is passed back as `cursor` to continue.
+        """
+        rows = self._select(int(limit) + 1, cursor, **filters)
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [json.loads(r[1]) for r in rows[:limit]], next_cursor
+
+    def iter_entries(self, chunk_size=500, **filters):
+        """Yield every matching entry, newest first, reading `chunk_size` rows at a time."""
+        cursor = None
+        while True:
+            rows = self._select(chunk_size, cursor, **filters)
+            for _, entry in rows:
+                yield json.loads(entry)
+            if len(rows) < chunk_size:
+                return
+            cursor = rows[-1][0]
+
+    def stats(self, minutes=60, hours=24):
+        """Aggregates over the recorded predictions, read from the stats tables only.
+
+        Returns totals by label and by source (model or fallback), a probability
+        histogram and the last `minutes` per-minute and `hours` per-hour buckets
+        (oldest first, empty buckets omitted).
+        """
+        conn = self._connect()
+        by_label = {}
+        by_source = {'model': 0, 'fallback': 0}
+        histogram = [0] * STATS_BINS
+        for b, label, fallback, n in conn.execute('SELECT bin, label, fallback, count FROM history_histogram'):
+            by_label[label] = by_label.get(label, 0) + n
+            by_source['fallback' if fallback else 'model'] += n
+            histogram[b] += n
+        total = sum(histogram)
+        now = datetime.utcnow()
+        series = {}
+        for (resolution, width, step), count in zip(STATS_RESOLUTIONS, (minutes, hours)):
+            count = max(0, min(int(count), self.stats_retention[resolution]))
+            since = (now - step * (count - 1)).isoformat()[:width]
+            rows = conn.execute(
+                'SELECT bucket, total, spam, fallback FROM history_buckets'
+                ' WHERE resolution = ? AND bucket >= ? ORDER BY bucket LIMIT ?',
+                (resolution, since, count),
+            ).fetchall() if count else []
+            series[resolution] = [
+                {
+                    'start': b + _BUCKET_SUFFIX[resolution],
+                    'total': t,
+                    'spam': s,
+                    'fallback': f,
+                    'spam_rate': s / t if t else 0.0,
+                }
+                for b, t, s, f in rows
+            ]
+        return {
+            'total': total,
+            'by_label': by_label,
+            'by_source': by_source,
+            'spam_rate': by_label.get('Spam', 0) / total if total else 0.0,
+            'probability_histogram': {
+                'bin_edges': [i / STATS_BINS for i in range(STATS_BINS + 1)],
+                'counts': histogram,
+            },
+            'minutes': series['minute'],
+            'hours': series['hour'],
+        }
+
+    def rebuild_stats(self):
+        """Recompute the stats tables from the rows still in the history table."""
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM history_buckets')
+            conn.execute('DELETE FROM history_histogram')
+            cur = conn.execute('SELECT timestamp, label, probability, fallback FROM history ORDER BY id')
+            while True:
+                rows = cur.fetchmany(1000)
+                if not rows:
+                    break
+                self._add_stats(conn, rows)
+
+    def count(self):
+        n = self._connect().execute('SELECT COUNT(*) FROM history').fetchone()[0]
+        return min(n, self.max_entries)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM history')
+            conn.execute('DELETE FROM history_buckets')
+            conn.execute('DELETE FROM history_histogram')
+        with self._lock:
+            self._writes_since_compact = 0
@@ -0,0 +1,139 @@
+"""
+Write-behind queue for prediction history.
+Request handlers enqueue entries and return immediately; a background thread
+batches them and hands each batch to the history store.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+OVERFLOW_POLICIES = ('drop_oldest', 'block')
+
+
+class HistoryWriter:
+    """Bounded in-process queue drained by one writer thread.
+
+    Batches are flushed when `batch_size` entries are pending or `flush_interval`
+    seconds after the first pending entry, whichever comes first. When the queue
+    is full, `overflow='drop_oldest'` discards the oldest pending entries and
+    `overflow='block'` makes producers wait for room.
+    """
+
+    def __init__(self, sink, max_queue=10000, batch_size=100, flush_interval=0.5,
+                 overflow='drop_oldest', logger=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}')
+        self._sink = sink
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.overflow = overflow
+        self.logger = logger or logging.getLogger(__name__)
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._buf = collections.deque()
+        self._thread = None
+        self._pid = os.getpid()
+        self._closed = False
+        # Sequence numbers: entries accepted vs entries written or dropped
+        self._enqueued = 0
+        self._done = 0
+        self._flush_target = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork(); a child process starts its own writer
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+
+    def put(self, entries):
+        """Queue entries for writing; never touches disk on the caller's thread."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('HistoryWriter is closed')
+            self._ensure_started()
+            for entry in entries:
+                if len(self._buf) >= self.max_queue:
+                    if self.overflow == 'block':
+                        while len(self._buf) >= self.max_queue and not self._closed:
+                            self._cond.wait()
+                    else:
+                        self._buf.popleft()
+                        self.dropped += 1
+                        self._done += 1
+                self._buf.append(entry)
+                self._enqueued += 1
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._buf)
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call is written. Returns False on timeout."""
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                return True
+            target = self._enqueued
+            self._flush_target = max(self._flush_target, target)
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._done >= target, timeout)
+
+    def close(self, timeout=5.0):
+        """Flush pending entries and stop the writer thread (safe to call twice)."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            deadline = None
+            while True:
+                if (self._closed or len(self._buf) >= self.batch_size
+                        or (self._buf and self._flush_target > self._done)):
+                    break
+                if not self._buf:
+                    deadline = None
+                    self._cond.wait()
+                    continue
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._buf), self.batch_size)
+            batch = [self._buf.popleft() for _ in range(n)]
+            # Wake producers blocked on a full queue
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                # Only reachable once closed and drained
+                return
+            try:
+                self._sink(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                self.logger.error(f'Error writing {len(batch)} history entries: {str(e)}')
+            with self._cond:
+                self._done += len(batch)
+                self._cond.notify_all()
@@ -0,0 +1,423 @@
+"""
+Traffic replay load test for the spam detection API.
+Sends the messages of SPAM_SMS.csv to POST /predict in `date` order, spaced by
+their recorded inter-arrival times, so campaign bursts and quiet periods reach the
+server the way real traffic does. The dataset spans years, so the gaps are divided
+by a speed-up factor (or one is chosen to fit --duration), and --max-gap caps idle
+periods after the speed-up.
+
+Requests are dispatched open-loop: each is handed to a pool of --concurrency
+connections at its scheduled time whether or not earlier ones have finished, and
+latency is measured from the scheduled time, so queueing behind a slow server is
+counted. The report gives achieved vs offered throughput, latency percentiles,
+errors by kind and how much the history store grew.
+
+The server is either already running (--url) or started here with a temporary
+history database (--start app|threads|prefork).
+
+Usage:
+    python load_replay.py --start threads --duration 60 --concurrency 16
+    python load_replay.py --url http://127.0.0.1:5000 --speedup 100000 --max-gap 0.5 --loops 3
+    python load_replay.py --start prefork --workers 4 --duration 30 --output replay.json --max-p99-ms 250
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATASET = os.path.join(HERE, 'SPAM_SMS.csv')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_messages(path, limit=None):
+    """(recorded offsets in seconds from the first message, request bodies), oldest first."""
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df = df[df['text'].str.len() > 0]
+    df = df.assign(_ts=pd.to_datetime(df['date'], errors='coerce')).dropna(subset=['_ts'])
+    df = df.sort_values('_ts', kind='stable')
+    if limit:
+        df = df.head(limit)
+    offsets = (df['_ts'] - df['_ts'].iloc[0]).dt.total_seconds().to_numpy()
+    bodies = []
+    for row in df.itertuples(index=False):
+        body = {'text': row.text}
+        if getattr(row, 'hashed_celphone_number', ''):
+            body['hashed_celphone_number'] = row.hashed_celphone_number
+        if getattr(row, 'carrier', ''):
+            body['carrier'] = row.carrier
+        bodies.append(json.dumps(body).encode('utf-8'))
+    return offsets, bodies
+
+
+def replay_gaps(offsets, speedup, max_gap=None):
+    """Seconds to wait before each message at `speedup`, with idle gaps capped at `max_gap`."""
+    gaps = np.diff(offsets, prepend=offsets[0]) / speedup
+    if max_gap:
+        gaps = np.minimum(gaps, max_gap)
+    return gaps
+
+
+def speedup_for(offsets, duration, max_gap=None):
+    """Speed-up factor that makes one pass over `offsets` last `duration` seconds."""
+    lo, hi = 1e-6, 1e12
+    if replay_gaps(offsets, hi, max_gap).sum() > duration:
+        return hi
+    for _ in range(200):
+        mid = (lo * hi) ** 0.5
+        if replay_gaps(offsets, mid, max_gap).sum() > duration:
+            lo = mid
+        else:
+            hi = mid
+        if hi / lo < 1.0001:
+            break
+    return hi
+
+
+def build_schedule(offsets, speedup, max_gap=None, loops=1):
+    """Send times (seconds from the start) for `loops` passes over the dataset."""
+    gaps = replay_gaps(offsets, speedup, max_gap)
+    # The next pass starts one typical gap after the previous one ends
+    loop_gap = float(np.median(gaps[1:])) if len(gaps) > 1 else 0.0
+    times = []
+    t = 0.0
+    for n in range(loops):
+        for i, gap in enumerate(gaps):
+            t += gap if i else (loop_gap if n else 0.0)
+            times.append(t)
+    return np.asarray(times)
+
+
+class Client:
+    """One keep-alive HTTP connection per thread."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', '') or not parts.hostname:
+            raise SystemExit(f'Only http:// URLs are supported, got {base_url!r}')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        """(status, response body); raises OSError/HTTPException on connection failures."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def get_json(self, path):
+        status, body = self.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f'GET {path} returned {status}')
+        return json.loads(body)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """app.py or serve.py in a subprocess with its own history database and sender reputation."""
+
+    def __init__(self, mode, workers=None, threads=None, history_db=None, startup_timeout=180.0):
+        self.mode = mode
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.tmpdir = tempfile.mkdtemp(prefix='spam-replay-')
+        self.history_db = history_db or os.path.join(self.tmpdir, 'history.sqlite3')
+        if mode == 'app':
+            cmd = [sys.executable, 'app.py']
+        else:
+            cmd = [sys.executable, 'serve.py', '--mode', mode, '--port', str(self.port)]
+            if workers:
+                cmd += ['--workers', str(workers)]
+            if threads:
+                cmd += ['--threads', str(threads)]
+        # State the replay would otherwise leave in the real stores goes to the temporary directory too
+        env = dict(os.environ, PORT=str(self.port), HISTORY_DB_PATH=self.history_db, FLASK_DEBUG='0',
+                   SENDER_REPUTATION_PATH=os.path.join(self.tmpdir, 'sender_reputation.npz'),
+                   ONLINE_SNAPSHOT_PATH=os.path.join(self.tmpdir, 'online_model.joblib'),
+                   PYTHONUNBUFFERED='1')
+        self.log_path = os.path.join(self.tmpdir, 'server.log')
+        self._log = open(self.log_path, 'wb')
+        print(f'Starting {" ".join(cmd)} on port {self.port}')
+        self.proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        self._wait_ready(startup_timeout)
+
+    def _wait_ready(self, timeout):
+        client = Client(self.url, timeout=2.0)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                problem = f'Server exited with status {self.proc.returncode}'
+                break
+            try:
+                client.request('GET', '/')
+                return
+            except (OSError, http.client.HTTPException):
+                time.sleep(0.25)
+        else:
+            problem = f'Server did not start within {timeout:g}s'
+        tail = self.log_tail()
+        self.stop()
+        raise SystemExit(f'{problem}:\n{tail}')
+
+    def log_tail(self, lines=20):
+        self._log.flush()
+        with open(self.log_path, 'rb') as f:
+            return b''.join(f.readlines()[-lines:]).decode('utf-8', 'replace')
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGTERM)
+            try:
+                self.proc.wait(30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self._log.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def history_snapshot(client, db_path=None):
+    """Predictions recorded so far (from /history/stats, which flushes queued writes) and store size."""
+    snap = {'predictions': None, 'bytes': None}
+    try:
+        snap['predictions'] = client.get_json('/history/stats?minutes=0&hours=0')['total']
+    except Exception as e:
+        print(f'Could not read /history/stats: {e}')
+    if db_path:
+        paths = [db_path + suffix for suffix in ('', '-wal', '-shm')]
+        snap['bytes'] = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+    return snap
+
+
+def replay(client, bodies, schedule, concurrency, progress=5.0):
+    """Send bodies[i % len(bodies)] at schedule[i]; returns per-request timings and outcomes."""
+    n = len(schedule)
+    sent = np.zeros(n)
+    done = np.zeros(n)
+    outcome = [None] * n
+    work = queue.Queue()
+    max_depth = 0
+
+    def worker():
+        while True:
+            i = work.get()
+            if i is None:
+                return
+            sent[i] = time.perf_counter()
+            try:
+                status, _ = client.request('POST', '/predict', bodies[i % len(bodies)])
+                outcome[i] = str(status)
+            except Exception as e:
+                outcome[i] = type(e).__name__
+            done[i] = time.perf_counter()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    scheduled = start + schedule
+    next_report = start + progress
+    for i in range(n):
+        delay = scheduled[i] - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        work.put(i)
+        max_depth = max(max_depth, work.qsize())
+        now = time.perf_counter()
+        if progress and now >= next_report:
+            finished = sum(1 for o in outcome[:i] if o is not None)
+            print(f'  {now - start:7.1f}s  sent {i + 1}/{n}  done {finished}  queued {work.qsize()}')
+            next_report = now + progress
+    for _ in threads:
+        work.put(None)
+    for t in threads:
+        t.join()
+    return {'start': start, 'scheduled': scheduled, 'sent': sent, 'done': done, 'outcome': outcome,
+            'max_queue_depth': max_depth}
+
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000.0
+    if not len(ms):
+        return None
+    out = {f'p{p}': round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    out.update(mean=round(float(ms.mean()), 3), max=round(float(ms.max()), 3))
+    return out
+
+
+def peak_rate(times, start, window=1.0):
+    """Most events in any `window`-second bucket, per second."""
+    if not len(times):
+        return 0.0
+    buckets = np.floor((np.asarray(times) - start) / window).astype(int)
+    return float(np.bincount(buckets).max()) / window
+
+
+def report(run, before, after):
+    outcome = run['outcome']
+    ok = np.array([o == '200' for o in outcome])
+    errors = {}
+    for o in outcome:
+        if o != '200':
+            errors[o] = errors.get(o, 0) + 1
+    start, scheduled, sent, done = run['start'], run['scheduled'], run['sent'], run['done']
+    n = len(outcome)
+    span = float(scheduled[-1] - start) if n else 0.0
+    elapsed = float(done.max() - start) if n else 0.0
+    out = {
+        'requests': n,
+        'ok': int(ok.sum()),
+        'errors': n - int(ok.sum()),
+        'error_rate': round((n - int(ok.sum())) / n, 6) if n else 0.0,
+        'errors_by_kind': errors,
+        'elapsed_s': round(elapsed, 3),
+        'offered_rps': round(n / span, 2) if span else None,
+        'achieved_rps': round(int(ok.sum()) / elapsed, 2) if elapsed else None,
+        'peak_offered_rps_1s': peak_rate(scheduled, start),
+        'peak_achieved_rps_1s': peak_rate(done[ok], start),
+        # From the scheduled send time, so time spent waiting for a free connection counts
+        'latency_ms': percentiles((done - scheduled)[ok]),
+        # From the moment the request was written to a connection
+        'service_ms': percentiles((done - sent)[ok]),
+        'max_queue_depth': run['max_queue_depth'],
+    }
+    history = {'predictions_before': before['predictions'], 'predictions_after': after['predictions']}
+    if before['predictions'] is not None and after['predictions'] is not None:
+        history['predictions_recorded'] = after['predictions'] - before['predictions']
+    if before['bytes'] is not None and after['bytes'] is not None:
+        growth = after['bytes'] - before['bytes']
+        history.update(bytes_before=before['bytes'], bytes_after=after['bytes'], bytes_growth=growth)
+        if history.get('predictions_recorded'):
+            history['bytes_per_prediction'] = round(growth / history['predictions_recorded'], 1)
+    out['history'] = history
+    return out
+
+
+def print_report(result):
+    print(f"\n{result['requests']} requests in {result['elapsed_s']:.1f}s: {result['ok']} ok, "
+          f"{result['errors']} errors ({result['error_rate']:.2%})")
+    for kind, count in sorted(result['errors_by_kind'].items()):
+        print(f'  {kind}: {count}')
+    print(f"Throughput: offered {result['offered_rps']} req/s, achieved {result['achieved_rps']} req/s "
+          f"(peak 1s: offered {result['peak_offered_rps_1s']:g}, achieved {result['peak_achieved_rps_1s']:g})")
+    for name in ('latency_ms', 'service_ms'):
+        lat = result[name]
+        if lat:
+            print(f"{name:11s} " + '  '.join(f'{k} {v:.1f}' for k, v in lat.items()))
+    print(f"Max dispatch queue depth: {result['max_queue_depth']}")
+    history = result['history']
+    if 'predictions_recorded' in history:
+        print(f"History: {history['predictions_recorded']} predictions recorded", end='')
+        if 'bytes_growth' in history:
+            print(f", store grew {history['bytes_growth'] / 1024:.1f} KiB "
+                  f"({history['bytes_before']} -> {history['bytes_after']} bytes)", end='')
+        print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay SPAM_SMS.csv against the API at its recorded pace.')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of a running server')
+    target.add_argument('--start', choices=('app', 'threads', 'prefork'),
+                        help='Start app.py or serve.py in that mode with a temporary history database')
+    parser.add_argument('--dataset', default=DEFAULT_DATASET)
+    pace = parser.add_mutually_exclusive_group()
+    pace.add_argument('--speedup', type=float, help='Divide recorded inter-arrival times by this factor')
+    pace.add_argument('--duration', type=float, default=60.0,
+                      help='Pick the speed-up so one pass lasts this many seconds (default 60)')
+    parser.add_argument('--max-gap', type=float, help='Cap idle gaps at this many seconds after the speed-up')
+    parser.add_argument('--loops', type=int, default=1, help='Passes over the dataset')
+    parser.add_argument('--limit', type=int, help='Only replay the first N messages')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel connections')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--workers', type=int, help='serve.py worker processes (--start prefork)')
+    parser.add_argument('--threads', type=int, help='serve.py threads per process (--start threads/prefork)')
+    parser.add_argument('--history-db', help='History database to measure (default: the started server\'s)')
+    parser.add_argument('--output', help='Write the report as JSON here')
+    parser.add_argument('--max-error-rate', type=float, help='Exit with status 1 above this error rate')
+    parser.add_argument('--max-p99-ms', type=float, help='Exit with status 1 if p99 latency is above this')
+    args = parser.parse_args(argv)
+
+    offsets, bodies = load_messages(args.dataset, args.limit)
+    if len(bodies) < 2:
+        raise SystemExit(f'{args.dataset} needs at least two messages with a parseable date')
+    speedup = args.speedup or speedup_for(offsets, args.duration, args.max_gap)
+    schedule = build_schedule(offsets, speedup, args.max_gap, max(1, args.loops))
+    print(f'{len(bodies)} messages spanning {offsets[-1] / 86400:.1f} days; speed-up {speedup:.4g}x, '
+          f'{len(schedule)} requests over {schedule[-1]:.1f}s, concurrency {args.concurrency}')
+
+    server = None
+    try:
+        if args.start:
+            server = LocalServer(args.start, args.workers, args.threads, args.history_db)
+            url, history_db = server.url, server.history_db
+        else:
+            url, history_db = args.url, args.history_db
+        client = Client(url, args.timeout)
+        before = history_snapshot(client, history_db)
+        run = replay(client, bodies, schedule, max(1, args.concurrency))
+        after = history_snapshot(client, history_db)
+    finally:
+        if server is not None:
+            server.stop()
+
+    result = report(run, before, after)
+    result['meta'] = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'target': args.url or f'{args.start} (local)',
+        'dataset': os.path.abspath(args.dataset),
+        'messages': len(bodies),
+        'speedup': speedup,
+        'max_gap': args.max_gap,
+        'loops': args.loops,
+        'concurrency': args.concurrency,
+    }
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'Wrote {args.output}')
+
+    failed = []
+    if args.max_error_rate is not None and result['error_rate'] > args.max_error_rate:
+        failed.append(f"error rate {result['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    if args.max_p99_ms is not None and (result['latency_ms'] is None or result['latency_ms']['p99'] > args.max_p99_ms):
+        failed.append(f'p99 latency above {args.max_p99_ms:g} ms')
+    if failed:
+        print('FAILED: ' + '; '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
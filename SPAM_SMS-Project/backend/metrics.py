@@ -0,0 +1,261 @@
+"""
+In-process request metrics exposed in the Prometheus text format.
+Counters and fixed-bucket histograms are plain Python objects updated under a lock
+(about a microsecond per update), so they can stay on in production. Values
+reported by other components (cache, history writer, campaign index, ...) are read
+from their stats() by collector functions when /metrics is scraped.
+
+RequestTimer records how long each stage of one request took (parsing, scoring,
+history, serialization, ...). SlowRequestProfiler runs a sampled fraction of
+requests under cProfile and writes the profile of any that turn out slow.
+
+Metrics live in the process that served the request; with prefork workers each
+worker reports its own.
+"""
+import bisect
+import collections
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+
+# Upper bounds in seconds; covers a sub-millisecond cache hit up to a stalled request
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# One value reported by a collector: kind is 'counter' or 'gauge', labels a dict or None
+Sample = collections.namedtuple('Sample', 'name kind documentation value labels', defaults=(None,))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        return [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram (plus _sum and _count) per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def count(self, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            return sum(state[0]) if state else 0
+
+    def render(self):
+        with self._lock:
+            values = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = {'le': _number(float(bound))}
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Metrics and collector functions rendered together by render()."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register `fn()` returning Samples to read at scrape time; usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        out = []
+        for metric in self._metrics:
+            out.append(f'# HELP {metric.name} {metric.documentation}')
+            out.append(f'# TYPE {metric.name} {metric.kind}')
+            out.extend(metric.render())
+        grouped = {}
+        for fn in self._collectors:
+            for sample in fn():
+                grouped.setdefault(sample.name, []).append(sample)
+        for name, samples in grouped.items():
+            out.append(f'# HELP {name} {samples[0].documentation}')
+            out.append(f'# TYPE {name} {samples[0].kind}')
+            for s in samples:
+                labels = s.labels or {}
+                out.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(s.value)}')
+        return '\n'.join(out) + '\n'
+
+
+class RequestTimer:
+    """Wall-clock time of one request and of the named stages inside it."""
+
+    __slots__ = ('started', 'stages', 'profile')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.profile = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - t0))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def describe(self):
+        return ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in self.stages)
+
+
+class SlowRequestProfiler:
+    """Profile a `sample_rate` fraction of requests; keep the profiles of slow ones.
+
+    Each slow sampled request leaves `<time>-<ms>ms-<request>-<pid>.prof` (load with pstats or
+    snakeviz) and a `.txt` summary in `directory`; only the newest `max_files`
+    pairs are kept.
+    """
+
+    def __init__(self, directory, threshold_ms=1000.0, sample_rate=0.0, max_files=50, logger=None):
+        self.directory = directory
+        self.threshold = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.max_files = int(max_files)
+        self.logger = logger
+        self.profiled = 0
+        self.dumped = 0
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 and self.threshold > 0
+
+    def start(self):
+        """A running cProfile.Profile if this request is sampled, else None."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread
+            return None
+        self.profiled += 1
+        return profile
+
+    def finish(self, profile, seconds, name, timer=None):
+        """Stop `profile` and write it out if the request took at least the threshold."""
+        profile.disable()
+        if seconds < self.threshold:
+            return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            safe = ''.join(c if c.isalnum() else '_' for c in name).strip('_') or 'request'
+            base = os.path.join(self.directory, f'{stamp}-{int(seconds * 1000)}ms-{safe}-{os.getpid()}')
+            profile.dump_stats(base + '.prof')
+            text = io.StringIO()
+            text.write(f'{name} took {seconds * 1000:.1f} ms\n')
+            if timer is not None:
+                text.write(f'stages: {timer.describe()}\n')
+            text.write('\n')
+            stats = pstats.Stats(profile, stream=text)
+            stats.sort_stats('cumulative').print_stats(40)
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            self.dumped += 1
+            self._prune()
+            return base + '.prof'
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f'Could not write slow request profile: {str(e)}')
+            return None
+
+    def _prune(self):
+        profiles = sorted(f for f in os.listdir(self.directory) if f.endswith('.prof'))
+        for old in profiles[:max(0, len(profiles) - self.max_files)]:
+            for ext in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, old[:-len('.prof')] + ext))
+                except OSError:
+                    pass
@@ -0,0 +1,122 @@
+"""
+Adaptive request coalescing for single-message predictions.
+Concurrent /predict calls each scoring one row pay the vectorizer and predict_proba
+overhead once per message. MicroBatcher queues them instead: one caller at a time
+(the leader) takes everything queued so far, scores it as one batch and hands each
+waiting caller its result. While a batch is being scored new arrivals pile up and
+form the next batch, so batching grows with load on its own. Under sustained load
+the leader also waits up to a short window for the batch to fill; a lone request
+at low traffic is scored straight away.
+"""
+import threading
+import time
+
+
+class _Slot:
+    __slots__ = ('key', 'item', 'event', 'result', 'error', 'lead')
+
+    def __init__(self, key, item):
+        self.key = key
+        self.item = item
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.lead = False
+
+
+class MicroBatcher:
+    """Coalesce concurrent `submit(key, item)` calls into `score_fn(key, items)` batches.
+
+    Items are only batched with others that share the same `key` (e.g. the model
+    they must be scored with). `score_fn` returns one result per item, in order.
+    """
+
+    # Weight of the newest batch size in the moving average that drives the window
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, score_fn, max_batch=64, max_wait_ms=2.0):
+        self.score_fn = score_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._cv = threading.Condition()
+        self._pending = []
+        self._leading = False
+        self._avg_batch = 1.0
+        self.batches = 0
+        self.items = 0
+
+    def window(self):
+        """Seconds the leader waits for a batch to fill; 0 unless recent batches held several items."""
+        return self.max_wait * min(1.0, self._avg_batch - 1.0) if self._avg_batch > 1.0 else 0.0
+
+    def submit(self, key, item):
+        """Score `item` as part of a batch and return its result (or raise its error)."""
+        slot = _Slot(key, item)
+        with self._cv:
+            self._pending.append(slot)
+            if self._leading:
+                self._cv.notify()
+            else:
+                self._leading = slot.lead = True
+        if not slot.lead:
+            slot.event.wait()
+            if slot.lead:
+                # Promoted by the previous leader to score the next batch
+                self._lead()
+        else:
+            self._lead()
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _lead(self):
+        with self._cv:
+            wait = self.window()
+            if wait > 0 and len(self._pending) < self.max_batch:
+                deadline = time.monotonic() + wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cv.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            self._avg_batch += self.EWMA_ALPHA * (len(batch) - self._avg_batch)
+            self.batches += 1
+            self.items += len(batch)
+        try:
+            self._score(batch)
+        finally:
+            with self._cv:
+                if self._pending:
+                    nxt = self._pending[0]
+                    nxt.lead = True
+                    nxt.event.set()
+                else:
+                    self._leading = False
+            for slot in batch:
+                if not slot.lead:
+                    slot.event.set()
+
+    def _score(self, batch):
+        groups = {}
+        for slot in batch:
+            groups.setdefault(id(slot.key), []).append(slot)
+        for slots in groups.values():
+            try:
+                results = self.score_fn(slots[0].key, [s.item for s in slots])
+                for slot, result in zip(slots, results):
+                    slot.result = result
+            except Exception as e:
+                for slot in slots:
+                    slot.error = e
+
+    def stats(self):
+        with self._cv:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch': self._avg_batch,
+                'window_ms': self.window() * 1000.0,
+                'pending': len(self._pending),
+            }
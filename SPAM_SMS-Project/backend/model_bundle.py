@@ -0,0 +1,274 @@
+"""
+Versioned, memory-mappable model bundle.
+A bundle is a directory holding the vectorizer vocabulary and idf, the classifier
+weights as .npy arrays and a manifest.json with checksums and training metadata.
+Loading it maps the arrays instead of unpickling, so workers start quickly and
+forked processes share the same pages.
+
+Usage:
+    python model_bundle.py export --model spam_detector_model.pkl --vectorizer tfidf_vectorizer.pkl
+    python model_bundle.py info [model_bundle]
+    python model_bundle.py check            # export/load round trip of several vectorizer configs
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+VOCAB_NAME = 'vocab.txt'
+# TfidfVectorizer parameters that are plain data and can round-trip through JSON
+VECTORIZER_PARAMS = (
+    'lowercase', 'strip_accents', 'token_pattern', 'ngram_range', 'stop_words', 'analyzer',
+    'max_df', 'min_df', 'max_features', 'binary', 'norm', 'use_idf', 'smooth_idf', 'sublinear_tf',
+)
+
+
+class BundleError(Exception):
+    """Raised when a bundle can't be written or fails validation on load."""
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _model_arrays(model):
+    """(kind, {array name: ndarray}) for a supported fitted classifier."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import MultinomialNB
+    if isinstance(model, LogisticRegression):
+        return 'logistic_regression', {'coef': model.coef_, 'intercept': model.intercept_}
+    if isinstance(model, MultinomialNB):
+        return 'multinomial_nb', {
+            'feature_log_prob': model.feature_log_prob_,
+            'class_log_prior': model.class_log_prior_,
+        }
+    raise BundleError(f'Unsupported model type for bundling: {type(model).__name__}')
+
+
+def _vectorizer_params(vectorizer):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    if not isinstance(vectorizer, TfidfVectorizer):
+        raise BundleError(f'Unsupported vectorizer type for bundling: {type(vectorizer).__name__}')
+    params = vectorizer.get_params()
+    if callable(params.get('analyzer')) or params.get('tokenizer') or params.get('preprocessor'):
+        raise BundleError('Vectorizers with custom analyzer/tokenizer/preprocessor callables cannot be bundled')
+    out = {k: params[k] for k in VECTORIZER_PARAMS}
+    if isinstance(out['stop_words'], (set, frozenset, tuple)):
+        out['stop_words'] = sorted(out['stop_words'])
+    out['ngram_range'] = list(out['ngram_range'])
+    return out
+
+
+def export_bundle(model, vectorizer, out_dir, metadata=None, dtype=np.float64):
+    """Write `model` and `vectorizer` as a bundle in `out_dir` and return its manifest.
+
+    The directory is written next to its final location and swapped in at the
+    end, so a reader never sees a half-written bundle.
+    """
+    kind, arrays = _model_arrays(model)
+    params = _vectorizer_params(vectorizer)
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, idx in vectorizer.vocabulary_.items():
+        terms[idx] = term
+    if any(t is None or '\n' in t for t in terms):
+        raise BundleError('Vocabulary indices are not contiguous or contain newlines')
+    if getattr(vectorizer, 'use_idf', False):
+        arrays['idf'] = vectorizer.idf_
+
+    out_dir = os.path.abspath(out_dir)
+    parent = os.path.dirname(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.bundle-', dir=parent)
+    try:
+        files = {}
+        with open(os.path.join(tmp_dir, VOCAB_NAME), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(terms))
+        files[VOCAB_NAME] = {'sha256': _sha256(os.path.join(tmp_dir, VOCAB_NAME)), 'terms': len(terms)}
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr, dtype=dtype)
+            path = os.path.join(tmp_dir, f'{name}.npy')
+            np.save(path, arr)
+            files[f'{name}.npy'] = {'sha256': _sha256(path), 'dtype': str(arr.dtype), 'shape': list(arr.shape)}
+        classes = [c.item() if hasattr(c, 'item') else c for c in model.classes_]
+        # Settings that change predictions without changing any array (norm, sublinear_tf, ...) count too
+        version = hashlib.sha256(json.dumps({
+            'files': {k: v['sha256'] for k, v in sorted(files.items())},
+            'model_kind': kind,
+            'classes': classes,
+            'vectorizer': params,
+        }, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'version': version,
+            'created': datetime.utcnow().isoformat() + 'Z',
+            'model_kind': kind,
+            'classes': classes,
+            'vectorizer': params,
+            'files': files,
+            'metadata': metadata or {},
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(out_dir):
+            old_dir = f'{out_dir}.old'
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(out_dir, old_dir)
+            os.replace(tmp_dir, out_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, out_dir)
+        return manifest
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def read_manifest(bundle_dir):
+    with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format_version')!r}")
+    return manifest
+
+
+def load_bundle(bundle_dir, mmap=True, verify=True):
+    """Rebuild (model, vectorizer, manifest) from a bundle directory.
+
+    Arrays are memory-mapped read-only when `mmap` is set; `verify` checks every
+    file against the manifest checksums first.
+    """
+    from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import MultinomialNB
+
+    manifest = read_manifest(bundle_dir)
+    files = manifest['files']
+    if verify:
+        for name, info in files.items():
+            if _sha256(os.path.join(bundle_dir, name)) != info['sha256']:
+                raise BundleError(f'Checksum mismatch for {name} in {bundle_dir}')
+
+    def array(name):
+        return np.load(os.path.join(bundle_dir, f'{name}.npy'), mmap_mode='r' if mmap else None)
+
+    params = dict(manifest['vectorizer'])
+    params['ngram_range'] = tuple(params['ngram_range'])
+    vectorizer = TfidfVectorizer(**params)
+    with open(os.path.join(bundle_dir, VOCAB_NAME), encoding='utf-8') as f:
+        terms = f.read().split('\n')
+    vectorizer.vocabulary_ = dict(zip(terms, range(len(terms))))
+    vectorizer.fixed_vocabulary_ = False
+    # TfidfVectorizer.transform goes through a fitted TfidfTransformer, with or without idf
+    tfidf = TfidfTransformer(norm=params['norm'], use_idf=params['use_idf'], smooth_idf=params['smooth_idf'],
+                             sublinear_tf=params['sublinear_tf'])
+    tfidf.n_features_in_ = len(terms)
+    if params['use_idf']:
+        tfidf.idf_ = array('idf')
+    vectorizer._tfidf = tfidf
+
+    classes = np.array(manifest['classes'])
+    kind = manifest['model_kind']
+    if kind == 'logistic_regression':
+        model = LogisticRegression()
+        model.coef_ = array('coef')
+        model.intercept_ = array('intercept')
+    elif kind == 'multinomial_nb':
+        model = MultinomialNB()
+        model.feature_log_prob_ = array('feature_log_prob')
+        model.class_log_prior_ = array('class_log_prior')
+    else:
+        raise BundleError(f'Unknown model kind {kind!r}')
+    model.classes_ = classes
+    model.n_features_in_ = len(terms)
+    return model, vectorizer, manifest
+
+
+# Vectorizer configurations whose export/load round trip `check` verifies
+ROUNDTRIP_CONFIGS = [
+    {},
+    {'sublinear_tf': True},
+    {'ngram_range': (1, 2), 'stop_words': 'english'},
+    {'use_idf': False},
+    {'use_idf': False, 'norm': None},
+    {'binary': True, 'norm': 'l1'},
+]
+# Keyword labels so models can be fitted on the unlabeled dataset
+_CHECK_KEYWORDS = ('win', 'free', 'prize', 'cash', 'reward', 'claim', 'promo', 'loan', 'click', 'urgent')
+
+
+def check_roundtrip(model, vectorizer, texts):
+    """Max |predict_proba difference| on `texts` between a model and its exported and reloaded bundle."""
+    tmp_dir = tempfile.mkdtemp(prefix='.bundle-check-')
+    try:
+        export_bundle(model, vectorizer, os.path.join(tmp_dir, 'bundle'))
+        loaded_model, loaded_vectorizer, _ = load_bundle(os.path.join(tmp_dir, 'bundle'), mmap=False)
+        expected = model.predict_proba(vectorizer.transform(texts))
+        actual = loaded_model.predict_proba(loaded_vectorizer.transform(texts))
+        return float(np.abs(expected - actual).max())
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    import argparse
+    import joblib
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Export or inspect a model bundle.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='Convert .pkl artifacts into a bundle')
+    exp.add_argument('--model', default=os.path.join(here, 'spam_detector_model.pkl'))
+    exp.add_argument('--vectorizer', default=os.path.join(here, 'tfidf_vectorizer.pkl'))
+    exp.add_argument('--out', default=os.path.join(here, 'model_bundle'))
+    info = sub.add_parser('info', help='Verify a bundle and print its manifest')
+    info.add_argument('bundle', nargs='?', default=os.path.join(here, 'model_bundle'))
+    check = sub.add_parser('check', help='Round-trip models with each ROUNDTRIP_CONFIGS vectorizer through a bundle')
+    check.add_argument('--dataset', default=os.path.join(here, 'SPAM_SMS.csv'))
+    check.add_argument('--tol', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.naive_bayes import MultinomialNB
+
+        texts = pd.read_csv(args.dataset)['text'].dropna().astype(str).tolist()
+        labels = ['spam' if any(k in t.lower() for k in _CHECK_KEYWORDS) else 'safe' for t in texts]
+        failed = 0
+        for params in ROUNDTRIP_CONFIGS:
+            for model in (LogisticRegression(max_iter=1000), MultinomialNB()):
+                vectorizer = TfidfVectorizer(**params)
+                model.fit(vectorizer.fit_transform(texts), labels)
+                diff = check_roundtrip(model, vectorizer, texts)
+                ok = diff <= args.tol
+                failed += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {type(model).__name__} + TfidfVectorizer({params}): "
+                      f"max |diff| = {diff:.3e}")
+        raise SystemExit(1 if failed else 0)
+
+    if args.command == 'export':
+        manifest = export_bundle(
+            joblib.load(args.model), joblib.load(args.vectorizer), args.out,
+            metadata={'source': {'model': os.path.abspath(args.model), 'vectorizer': os.path.abspath(args.vectorizer)}},
+        )
+        print(f"Exported {manifest['model_kind']} bundle {manifest['version']} to {args.out}")
+    else:
+        _, _, manifest = load_bundle(args.bundle)
+        print(json.dumps({k: v for k, v in manifest.items() if k != 'files'}, indent=2))
+        for name, meta in manifest['files'].items():
+            print(f"  {name}: {meta.get('shape', meta.get('terms'))} sha256={meta['sha256'][:12]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Compact export of the serving model: a model bundle with a pruned vocabulary and
+float32 weights.
+Terms whose weight magnitude (the logistic regression coefficient, or the spam vs
+not-spam log-probability difference for Multinomial NB) is below --threshold barely
+move a score, so they are dropped from the vocabulary, idf and weight arrays. The
+rebuilt vectorizer carries only the kept terms (no `stop_words_` set), and every
+array is stored as float32.
+
+Dropping terms also changes the TF-IDF normalization of the remaining ones, so
+the effect is measured before anything is written. A copy of the model is fitted
+on a training split, pruned the same way, and both are scored on the held-out
+split. The report also covers agreement with the full serving model on the whole
+dataset, and the on-disk size, load time and resident memory of both bundles. The
+export is refused when accuracy drops by more than --max-accuracy-drop.
+
+Usage:
+    python model_compact.py                         # writes model_compact/
+    python model_compact.py --threshold 0.2 --install
+    MODEL_BUNDLE_DIR=model_compact python serve.py  # serve the compact bundle
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.naive_bayes import MultinomialNB
+
+import training
+from model_bundle import VECTORIZER_PARAMS, export_bundle
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT = os.path.join(HERE, 'model_compact')
+DEFAULT_THRESHOLD = 0.1
+
+# Loads a bundle in a fresh interpreter and reports its load time and resident memory
+_MEASURE = r'''
+import json, resource, sys, time
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+import sklearn.linear_model, sklearn.naive_bayes, sklearn.feature_extraction.text
+from model_bundle import load_bundle
+before = rss()
+t0 = time.perf_counter()
+model, vectorizer, _ = load_bundle(sys.argv[1])
+load = time.perf_counter() - t0
+model.predict_proba(vectorizer.transform(sys.argv[2:]))
+print(json.dumps({'load_ms': load * 1000, 'rss_bytes': rss() - before}))
+'''
+
+
+def term_weights(model):
+    """Per-term effect on the spam log-odds of a fitted binary model."""
+    if isinstance(model, LogisticRegression):
+        if model.coef_.shape[0] != 1:
+            raise ValueError('Only binary logistic regression models can be pruned')
+        return np.asarray(model.coef_[0], dtype=np.float64)
+    if isinstance(model, MultinomialNB):
+        if model.feature_log_prob_.shape[0] != 2:
+            raise ValueError('Only binary Multinomial NB models can be pruned')
+        return np.asarray(model.feature_log_prob_[1] - model.feature_log_prob_[0], dtype=np.float64)
+    raise ValueError(f'Unsupported model type for pruning: {type(model).__name__}')
+
+
+def prune(model, vectorizer, threshold, dtype=np.float32):
+    """(model, vectorizer) keeping only terms with |weight| >= threshold, arrays cast to `dtype`."""
+    keep = np.flatnonzero(np.abs(term_weights(model)) >= threshold)
+    if not len(keep):
+        raise ValueError(f'No term has a weight of at least {threshold}')
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, idx in vectorizer.vocabulary_.items():
+        terms[idx] = term
+
+    params = {k: v for k, v in vectorizer.get_params().items() if k in VECTORIZER_PARAMS}
+    small_vectorizer = TfidfVectorizer(**params)
+    small_vectorizer.vocabulary_ = {terms[j]: i for i, j in enumerate(keep.tolist())}
+    small_vectorizer.fixed_vocabulary_ = False
+    if getattr(vectorizer, 'use_idf', False):
+        small_vectorizer.idf_ = np.asarray(vectorizer.idf_, dtype=dtype)[keep]
+
+    if isinstance(model, LogisticRegression):
+        small_model = LogisticRegression(**model.get_params())
+        small_model.coef_ = np.ascontiguousarray(model.coef_[:, keep], dtype=dtype)
+        small_model.intercept_ = np.asarray(model.intercept_, dtype=dtype)
+    else:
+        small_model = MultinomialNB(**model.get_params())
+        small_model.feature_log_prob_ = np.ascontiguousarray(model.feature_log_prob_[:, keep], dtype=dtype)
+        small_model.class_log_prior_ = np.asarray(model.class_log_prior_, dtype=dtype)
+    small_model.classes_ = model.classes_
+    small_model.n_features_in_ = len(keep)
+    return small_model, small_vectorizer
+
+
+def spam_probabilities(model, vectorizer, texts):
+    probs = model.predict_proba(vectorizer.transform(texts))
+    spam_idx = next((i for i, c in enumerate(model.classes_) if str(c).lower() == 'spam'), probs.shape[1] - 1)
+    return probs[:, spam_idx]
+
+
+def compare(full, small, texts):
+    """Agreement and largest probability difference between two (model, vectorizer) pairs."""
+    p_full = spam_probabilities(*full, texts)
+    p_small = spam_probabilities(*small, texts)
+    return {
+        'messages': len(texts),
+        'agreement': float(np.mean((p_full >= 0.5) == (p_small >= 0.5))),
+        'max_probability_diff': float(np.max(np.abs(p_full - p_small))),
+    }
+
+
+def evaluate(model, vectorizer, threshold, texts, labels, test_size=0.2, seed=42):
+    """Accuracy of a copy of the model fitted on a training split, before and after pruning."""
+    train_x, test_x, train_y, test_y = train_test_split(
+        texts, labels, test_size=test_size, stratify=labels, random_state=seed)
+    full_vectorizer = clone(vectorizer)
+    full_model = clone(model).fit(full_vectorizer.fit_transform(train_x), train_y)
+    small_model, small_vectorizer = prune(full_model, full_vectorizer, threshold)
+    out = {'train_examples': len(train_x), 'test_examples': len(test_x),
+           'terms_full': len(full_vectorizer.vocabulary_), 'terms_compact': len(small_vectorizer.vocabulary_)}
+    for name, (m, v) in (('full', (full_model, full_vectorizer)), ('compact', (small_model, small_vectorizer))):
+        pred = m.predict(v.transform(test_x))
+        out[f'accuracy_{name}'] = float(accuracy_score(test_y, pred))
+        out[f'f1_macro_{name}'] = float(f1_score(test_y, pred, average='macro'))
+    out['accuracy_change'] = out['accuracy_compact'] - out['accuracy_full']
+    out.update(compare((full_model, full_vectorizer), (small_model, small_vectorizer), test_x))
+    return out
+
+
+def bundle_size(bundle_dir):
+    return sum(os.path.getsize(os.path.join(bundle_dir, f)) for f in os.listdir(bundle_dir))
+
+
+def measure_bundle(bundle_dir, texts, repeat=3):
+    """Best-of-`repeat` load time and resident memory growth of loading `bundle_dir` in a new process."""
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', _MEASURE, bundle_dir, *texts], cwd=HERE,
+                              capture_output=True, text=True, check=True)
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        'bytes': bundle_size(bundle_dir),
+        'load_ms': round(min(r['load_ms'] for r in runs), 3),
+        'rss_bytes': min(r['rss_bytes'] for r in runs),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a pruned float32 model bundle.')
+    parser.add_argument('--model', help='Model .pkl (default: the one the server would load)')
+    parser.add_argument('--vectorizer', help='Vectorizer .pkl matching --model')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Drop terms whose |weight| is below this (default {DEFAULT_THRESHOLD})')
+    parser.add_argument('--dataset', default=training.DEFAULT_DATASET)
+    parser.add_argument('--labels', choices=('auto', 'column', 'rules', 'keywords'), default='auto',
+                        help='Label source for the held-out evaluation (as in training.py)')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                        help='Refuse to export if held-out accuracy falls by more than this')
+    parser.add_argument('--force', action='store_true', help='Export even if accuracy falls too much')
+    parser.add_argument('--out', default=DEFAULT_OUT, help='Bundle directory to write')
+    parser.add_argument('--install', action='store_true', help="Write to the server's MODEL_BUNDLE_DIR instead")
+    parser.add_argument('--report', help='Also write the report as JSON here')
+    parser.add_argument('--dry-run', action='store_true', help='Evaluate and report without writing a bundle')
+    args = parser.parse_args(argv)
+
+    import joblib
+    import artifact_store
+
+    if bool(args.model) != bool(args.vectorizer):
+        parser.error('--model and --vectorizer must be given together')
+    paths = (args.model, args.vectorizer) if args.model else artifact_store.find_artifact_paths()
+    if paths is None:
+        raise SystemExit('No model artifacts found; train one with training.py first')
+    model_path, vect_path = paths
+    model, vectorizer = joblib.load(model_path), joblib.load(vect_path)
+    texts, labels, source = training.load_dataset(args.dataset, args.labels)
+    print(f'Loaded {type(model).__name__} with {len(vectorizer.vocabulary_)} terms from {model_path}; '
+          f'{len(texts)} messages, labels from {source}')
+
+    report = {'source': {'model': os.path.abspath(model_path), 'vectorizer': os.path.abspath(vect_path)},
+              'threshold': args.threshold, 'dtype': 'float32', 'label_source': source}
+    report['held_out'] = held_out = evaluate(model, vectorizer, args.threshold, texts, labels,
+                                             args.test_size, args.seed)
+    print(f"Held-out ({held_out['test_examples']} messages): {held_out['terms_full']} -> "
+          f"{held_out['terms_compact']} terms, accuracy {held_out['accuracy_full']:.4f} -> "
+          f"{held_out['accuracy_compact']:.4f} ({held_out['accuracy_change']:+.4f}), "
+          f"agreement {held_out['agreement']:.4f}")
+
+    small_model, small_vectorizer = prune(model, vectorizer, args.threshold)
+    report['terms_full'] = len(vectorizer.vocabulary_)
+    report['terms_compact'] = len(small_vectorizer.vocabulary_)
+    report['fidelity'] = compare((model, vectorizer), (small_model, small_vectorizer), texts)
+    print(f"Serving model: {report['terms_full']} -> {report['terms_compact']} terms, "
+          f"agreement with the full model {report['fidelity']['agreement']:.4f} on the dataset, "
+          f"max probability diff {report['fidelity']['max_probability_diff']:.4f}")
+
+    out_dir = artifact_store.MODEL_BUNDLE_DIR if args.install else args.out
+    metadata = {
+        'source': {
+            'model': os.path.abspath(model_path),
+            'vectorizer': os.path.abspath(vect_path),
+            'fingerprint': artifact_store.artifact_version(model_path, vect_path),
+        },
+        'compact': {k: report[k] for k in ('threshold', 'dtype', 'terms_full', 'terms_compact', 'held_out')},
+    }
+    tmp = tempfile.mkdtemp(prefix='spam-compact-')
+    try:
+        full_dir, small_dir = os.path.join(tmp, 'full'), os.path.join(tmp, 'compact')
+        export_bundle(model, vectorizer, full_dir)
+        export_bundle(small_model, small_vectorizer, small_dir, metadata=metadata, dtype=np.float32)
+        report['footprint'] = {'full': measure_bundle(full_dir, artifact_store.WARMUP_MESSAGES),
+                               'compact': measure_bundle(small_dir, artifact_store.WARMUP_MESSAGES)}
+        for name in ('full', 'compact'):
+            f = report['footprint'][name]
+            print(f"{name:8s} bundle {f['bytes'] / 1024:8.1f} KiB   load {f['load_ms']:7.2f} ms   "
+                  f"resident {f['rss_bytes'] / 1024:8.1f} KiB")
+
+        refused = -held_out['accuracy_change'] > args.max_accuracy_drop and not args.force
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+        if refused:
+            print(f"Not exporting: held-out accuracy fell by {-held_out['accuracy_change']:.4f} "
+                  f"(--max-accuracy-drop {args.max_accuracy_drop}); lower --threshold or pass --force")
+            return 1
+        if args.dry_run:
+            return 0
+        export_bundle(small_model, small_vectorizer, out_dir, metadata=metadata, dtype=np.float32)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f'Wrote compact bundle to {out_dir}')
+    if not args.install:
+        print(f'Serve it with MODEL_BUNDLE_DIR={out_dir}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
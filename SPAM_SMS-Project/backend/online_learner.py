@@ -0,0 +1,202 @@
+"""
+Online learning mode: a stateless HashingVectorizer feeding an SGDClassifier that is
+updated with partial_fit as labeled feedback arrives.
+There is no vocabulary to fit or pickle, so the model can start from a bootstrap set
+and keep learning from analyst corrections without ever being retrained from scratch.
+
+Feedback is queued and applied in mini-batches by a background thread. After each
+update a copy of the classifier is handed to `on_update`, so predictions keep using
+an immutable model while the next batch is being learned. Snapshots (the classifier
+plus the vectorizer parameters) are written every `snapshot_interval` seconds when
+the model changed.
+"""
+import collections
+import copy
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+CLASSES = np.array(['Not Spam', 'Spam'])
+VECTORIZER_PARAMS = {
+    'n_features': 2 ** 18,
+    'ngram_range': (1, 2),
+    'alternate_sign': False,
+    'norm': 'l2',
+    'lowercase': True,
+}
+SNAPSHOT_FORMAT = 1
+
+
+def make_vectorizer(params=None):
+    return HashingVectorizer(**(params or VECTORIZER_PARAMS))
+
+
+def make_classifier():
+    # log_loss keeps predict_proba available for spam probabilities
+    return SGDClassifier(loss='log_loss', alpha=1e-5, random_state=0)
+
+
+class OnlineLearner:
+    """SGD spam classifier over hashed features, updated from a feedback queue.
+
+    `on_update(model, vectorizer, version)` receives a private copy of the model
+    after the bootstrap fit, a snapshot load and every mini-batch update.
+    """
+
+    def __init__(self, on_update, snapshot_path, batch_size=32, update_interval=1.0,
+                 snapshot_interval=300.0, max_queue=10000, logger=None):
+        self.on_update = on_update
+        self.snapshot_path = snapshot_path
+        self.batch_size = max(1, int(batch_size))
+        self.update_interval = update_interval
+        self.snapshot_interval = snapshot_interval
+        self.max_queue = int(max_queue)
+        self.logger = logger
+        self.vectorizer = make_vectorizer()
+        self.model = None
+        self.updates = 0
+        self.examples = 0
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._cv = threading.Condition()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._stop = False
+        self._thread = None
+
+    @property
+    def version(self):
+        return f'online-{self.updates}'
+
+    def _publish(self):
+        self.on_update(copy.deepcopy(self.model), self.vectorizer, self.version)
+
+    def bootstrap(self, texts, labels, epochs=5):
+        """Fit a fresh model on labeled `texts` ('Spam'/'Not Spam') and publish it."""
+        X = self.vectorizer.transform(texts)
+        y = np.asarray(labels)
+        model = make_classifier()
+        for _ in range(epochs):
+            model.partial_fit(X, y, classes=CLASSES)
+        self.model = model
+        self.examples += len(texts)
+        self._dirty = True
+        self._publish()
+
+    def load(self, path=None):
+        """Load a snapshot written by save(); returns False when there is none."""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return False
+        snap = joblib.load(path)
+        if snap.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f'Unsupported online model snapshot format {snap.get("format")!r}')
+        self.vectorizer = make_vectorizer(snap['vectorizer_params'])
+        self.model = snap['model']
+        self.updates = snap['updates']
+        self.examples = snap['examples']
+        self._dirty = False
+        self._publish()
+        return True
+
+    def save(self, path=None):
+        """Write a snapshot atomically if the model changed since the last one."""
+        path = path or self.snapshot_path
+        with self._cv:
+            if self.model is None or not self._dirty:
+                return False
+            snap = {
+                'format': SNAPSHOT_FORMAT,
+                'model': copy.deepcopy(self.model),
+                'vectorizer_params': self.vectorizer.get_params(),
+                'updates': self.updates,
+                'examples': self.examples,
+                'saved_at': time.time(),
+            }
+            self._dirty = False
+        tmp = f'{path}.tmp'
+        joblib.dump(snap, tmp)
+        os.replace(tmp, path)
+        self._saved_at = time.monotonic()
+        return True
+
+    def submit(self, texts, labels):
+        """Queue labeled examples for the next update; returns how many were accepted."""
+        with self._cv:
+            room = self.max_queue - len(self._queue)
+            accepted = min(room, len(texts))
+            self._queue.extend(zip(texts[:accepted], labels[:accepted]))
+            self.dropped += len(texts) - accepted
+            if len(self._queue) >= self.batch_size:
+                self._cv.notify()
+        return accepted
+
+    def start(self):
+        if self._thread is None:
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name='online-learner', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Apply what is queued, stop the thread and write a final snapshot."""
+        thread = self._thread
+        if thread is not None:
+            with self._cv:
+                self._stop = True
+                self._cv.notify()
+            thread.join()
+            self._thread = None
+        self.save()
+
+    def _run(self):
+        while True:
+            with self._cv:
+                if not self._stop and len(self._queue) < self.batch_size:
+                    self._cv.wait(self.update_interval)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+                stop = self._stop and not self._queue
+            if batch:
+                try:
+                    self.update(batch)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f'Online update failed: {str(e)}')
+            if self.snapshot_interval and time.monotonic() - self._saved_at >= self.snapshot_interval:
+                try:
+                    self.save()
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f'Could not save online model snapshot: {str(e)}')
+            if stop:
+                return
+
+    def update(self, batch):
+        """One partial_fit step on [(text, label), ...], then publish the new model."""
+        texts = [t for t, _ in batch]
+        y = np.asarray([label for _, label in batch])
+        X = self.vectorizer.transform(texts)
+        with self._cv:
+            if self.model is None:
+                self.model = make_classifier()
+            self.model.partial_fit(X, y, classes=CLASSES)
+            self.updates += 1
+            self.examples += len(batch)
+            self._dirty = True
+        self._publish()
+
+    def stats(self):
+        with self._cv:
+            return {
+                'version': self.version,
+                'updates': self.updates,
+                'examples': self.examples,
+                'queued': len(self._queue),
+                'dropped': self.dropped,
+                'n_features': self.vectorizer.n_features,
+                'snapshot': self.snapshot_path,
+            }
@@ -0,0 +1,574 @@
+"""
+Compiled matcher for the rule lists in spam_patterns.py.
+The SPAM_INDICATORS and SAFE_INDICATORS rules are compiled once at import time into
+one regex per group: literal alternatives of each rule are merged into a character
+trie, and every rule is a named group inside a zero-width lookahead. One pass over a
+message therefore finds every rule that matches, including rules whose matches
+overlap (e.g. `CLAIM NOW!` is both act_now and prize), and yields the weighted spam
+and safe scores with the IDs of the matched rules. Rules listed in DETECTORS are
+evaluated by a function instead of their regex (the suspicious URL rule uses
+url_extractor's linear scan and reloadable domain blocklist).
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import spam_patterns
+import url_extractor
+
+_META = set('.^$*+?{}[]|()')
+
+Rule = namedtuple('Rule', 'id group weight pattern')
+PatternScore = namedtuple('PatternScore', 'spam_score safe_score spam_rules safe_rules partial')
+CategoryMatch = namedtuple('CategoryMatch', 'categories start end')
+
+# (rule id, weight) for each entry of spam_patterns.SPAM_INDICATORS, in order
+SPAM_RULES = [
+    ('spam.currency_amount', 1.0),
+    ('spam.urgency', 1.0),
+    ('spam.financial_offer', 1.0),
+    ('spam.call_to_action', 1.5),
+    ('spam.act_now', 1.0),
+    ('spam.suspicious_url', 2.0),
+    ('spam.commercial', 0.75),
+    ('spam.prize', 1.5),
+]
+# (rule id, weight) for each entry of spam_patterns.SAFE_INDICATORS, in order
+SAFE_RULES = [
+    ('safe.greeting', 0.75),
+    ('safe.notification', 1.0),
+    ('safe.personal_phrase', 0.75),
+    ('safe.personal_transaction', 0.5),
+]
+# Rules matched by a function of the message instead of their spam_patterns regex
+DETECTORS = {
+    'spam.suspicious_url': url_extractor.suspicious,
+}
+# Score margin (spam - safe) at which the fallback probability crosses 0.5
+SPAM_MARGIN = 0.5
+# Slope of the logistic mapping from score margin to probability
+SCORE_SCALE = 2.0
+
+# Matching budget per message and scan, so one hostile SMS can't stall a worker.
+# Only the first PATTERN_MAX_CHARS characters are scanned (a 10-part concatenated
+# SMS is ~1530), and a scan stops early once PATTERN_TIME_BUDGET_MS is spent. The
+# time budget is best-effort: it is checked between matches (or rules), so one slow
+# regex search can overrun it and is bounded only by the character limit.
+PATTERN_MAX_CHARS = int(os.environ.get('PATTERN_MAX_CHARS', 2000))
+PATTERN_TIME_BUDGET_MS = float(os.environ.get('PATTERN_TIME_BUDGET_MS', 10))
+# How often scans were cut short by each limit
+SCAN_LIMIT_COUNTS = {'truncated': 0, 'over_budget': 0}
+_scan_limit_lock = threading.Lock()
+
+
+def _count_scan_limit(kind):
+    with _scan_limit_lock:
+        SCAN_LIMIT_COUNTS[kind] += 1
+
+
+def scan_limit_stats():
+    """Copy of SCAN_LIMIT_COUNTS."""
+    with _scan_limit_lock:
+        return dict(SCAN_LIMIT_COUNTS)
+
+
+def truncate(text):
+    """`text` cut to PATTERN_MAX_CHARS, and whether it was cut."""
+    if len(text) <= PATTERN_MAX_CHARS:
+        return text, False
+    _count_scan_limit('truncated')
+    return text[:PATTERN_MAX_CHARS], True
+
+
+def bounded_finditer(regex, text):
+    """Matches of `regex` within the scanning budget, and whether the scan was partial.
+
+    The budget is best-effort: the deadline is checked between matches, so a
+    single slow search step can overrun it and is bounded only by truncating the
+    input to PATTERN_MAX_CHARS.
+    """
+    text, partial = truncate(text)
+    deadline = time.perf_counter() + PATTERN_TIME_BUDGET_MS / 1000.0
+    matches = []
+    for m in regex.finditer(text):
+        matches.append(m)
+        if time.perf_counter() > deadline:
+            _count_scan_limit('over_budget')
+            partial = True
+            break
+    return matches, partial
+
+
+def _closing_paren(pattern, start):
+    """Index of the parenthesis closing the group that opens at `start`."""
+    depth = 0
+    in_class = False
+    i = start
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 2
+            continue
+        if in_class:
+            if c == ']':
+                in_class = False
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError(f'Unbalanced parentheses in pattern: {pattern[:60]}...')
+
+
+def split_alternatives(body):
+    """Split a regex on its top-level `|` (outside groups and character classes)."""
+    parts = []
+    depth = 0
+    in_class = False
+    last = 0
+    i = 0
+    while i < len(body):
+        c = body[i]
+        if c == '\\':
+            i += 2
+            continue
+        if in_class:
+            if c == ']':
+                in_class = False
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            parts.append(body[last:i])
+            last = i + 1
+        i += 1
+    parts.append(body[last:])
+    return parts
+
+
+def unwrap_alternation(pattern):
+    """Split `(?i)\\b(?:a|b|c)tail` into ('\\b', ['a', 'b', 'c'], 'tail').
+
+    Returns None when the pattern does not start with a (word-boundary and)
+    non-capturing alternation group.
+    """
+    if pattern.startswith('(?i)'):
+        pattern = pattern[4:]
+    lead = '\\b' if pattern.startswith('\\b') else ''
+    rest = pattern[len(lead):]
+    if not rest.startswith('(?:'):
+        return None
+    end = _closing_paren(rest, 0)
+    return lead, split_alternatives(rest[3:end]), rest[end + 1:]
+
+
+def literal_text(branch):
+    """The plain string a branch matches, or None if it uses any regex syntax."""
+    out = []
+    i = 0
+    while i < len(branch):
+        c = branch[i]
+        if c == '\\':
+            if i + 1 >= len(branch) or branch[i + 1].isalnum():
+                # \b, \s, \d ... are not literals
+                return None
+            out.append(branch[i + 1])
+            i += 2
+            continue
+        if c in _META:
+            return None
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+
+def branch_atoms(branch):
+    """Split a branch into trie atoms, or None if it uses syntax a trie can't hold.
+
+    Atoms are escaped literal characters (optionally followed by `?`) and the
+    fragments `\\s*`, `\\s+` and `\\b`, which covers the word-sequence branches
+    (e.g. `free\\s*delivery`, `pre-?selling`) that make up most rule lists.
+    """
+    atoms = []
+    i = 0
+    while i < len(branch):
+        c = branch[i]
+        if c == '\\':
+            nxt = branch[i + 1] if i + 1 < len(branch) else ''
+            if nxt == 's' and branch[i + 2:i + 3] in ('*', '+'):
+                atoms.append(branch[i:i + 3])
+                i += 3
+                continue
+            if nxt == 'b':
+                atoms.append('\\b')
+                i += 2
+                continue
+            if not nxt or nxt.isalnum():
+                return None
+            atom = re.escape(nxt)
+            i += 2
+        elif c in _META:
+            return None
+        else:
+            atom = re.escape(c)
+            i += 1
+        if branch[i:i + 1] == '?':
+            atom += '?'
+            i += 1
+        atoms.append(atom)
+    return tuple(atoms)
+
+
+def trie_pattern(sequences, tags=None):
+    """Regex matching exactly `sequences` (tuples of atoms), with shared prefixes factored out.
+
+    When `tags` is given, an empty named group `(?P<tag>)` marks the end of each
+    sequence so `match.lastgroup` tells which one matched. Longer continuations
+    are always tried before a sequence ends, so the longest match wins.
+    """
+    trie = {}
+    for n, seq in enumerate(sequences):
+        node = trie
+        for atom in seq:
+            node = node.setdefault(atom, {})
+        node[''] = tags[n] if tags else True
+
+    def build(node):
+        end = node.get('')
+        branches = [atom + build(child) for atom, child in sorted(node.items()) if atom != '']
+        if tags and end is not None:
+            branches.append(f'(?P<{end}>)')
+            end = None
+        if not branches:
+            return ''
+        if len(branches) == 1 and end is None:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if end is not None else body
+
+    return build(trie)
+
+
+def _exact_case(branch):
+    """All-caps acronyms (CBD, FAR, PEZA) only match in upper case; `far` is not `FAR`."""
+    text = literal_text(branch)
+    return text is not None and len(text) > 1 and text.isupper()
+
+
+def _branch_key(branch):
+    """Dedup key for a branch: ('trie', atoms), ('exact', atoms) or ('raw', branch)."""
+    atoms = branch_atoms(branch)
+    if atoms is None:
+        return ('raw', branch)
+    if _exact_case(branch):
+        return ('exact', atoms)
+    return ('trie', tuple(a.lower() for a in atoms))
+
+
+def alternation_pattern(branches):
+    """Deduplicated alternation of `branches` with trie-able branches merged.
+
+    Atoms are compared lowercased since patterns are compiled case-insensitively;
+    all-caps acronyms are kept as exact-case alternatives.
+    """
+    keys = list(dict.fromkeys(_branch_key(b) for b in branches))
+    exact = [k[1] for k in keys if k[0] == 'exact']
+    sequences = [k[1] for k in keys if k[0] == 'trie']
+    parts = []
+    if exact:
+        parts.append('(?-i:' + trie_pattern(exact) + ')')
+    if sequences:
+        parts.append(trie_pattern(sequences))
+    parts.extend(k[1] for k in keys if k[0] == 'raw')
+    return '|'.join(parts)
+
+
+def optimize_pattern(pattern):
+    """Rewrite a spam_patterns rule into an equivalent, trie-merged regex source."""
+    parts = unwrap_alternation(pattern)
+    if parts is None:
+        return pattern[4:] if pattern.startswith('(?i)') else pattern
+    lead, branches, tail = parts
+    return f'{lead}(?:{alternation_pattern(branches)}){tail}'
+
+
+def _build_rules(group, names, patterns):
+    if len(names) != len(patterns):
+        raise ValueError(f'{group}: {len(patterns)} patterns but {len(names)} rule names')
+    return [Rule(rule_id, group, weight, pattern) for (rule_id, weight), pattern in zip(names, patterns)]
+
+
+class PatternEngine:
+    """Weighted spam/safe rules compiled into one case-insensitive regex per group.
+
+    Each rule is a named group inside a zero-width lookahead, so matches of
+    different rules may overlap. `detectors` maps rule ids to functions
+    `text -> bool` that replace the rule's regex.
+    """
+
+    def __init__(self, rules, detectors=None):
+        self.rules = list(rules)
+        detectors = detectors or {}
+        self._detected = [(n, detectors[r.id]) for n, r in enumerate(self.rules) if r.id in detectors]
+        self._groups = []
+        for group in dict.fromkeys(r.group for r in self.rules):
+            members = [(n, r) for n, r in enumerate(self.rules) if r.group == group and r.id not in detectors]
+            if not members:
+                continue
+            lookaheads = [f'(?=(?P<r{n}>{optimize_pattern(r.pattern)}))' for n, r in members]
+            # `find` stops at every position where some rule starts; `at` then reports all rules starting there
+            find = re.compile('|'.join(lookaheads), re.IGNORECASE)
+            at = re.compile('?'.join(lookaheads) + '?', re.IGNORECASE)
+            self._groups.append((find, at, len(members)))
+
+    def _scan_group(self, find, at, size, text, found, deadline):
+        """Add the indices of the rules of one group that match `text` to `found`; False if over budget."""
+        hits = 0
+        for m in find.finditer(text):
+            for name, value in at.match(text, m.start()).groupdict().items():
+                n = int(name[1:])
+                if value is not None and n not in found:
+                    found.add(n)
+                    hits += 1
+            if hits == size:
+                return True
+            if time.perf_counter() > deadline:
+                return False
+        return True
+
+    def matched_rules(self, text):
+        """Rules matched by `text`, in rule order, and whether the scan was partial.
+
+        A rule matches when its regex matches starting at some position of the
+        message, exactly as if its spam_patterns regex were searched on its own;
+        each group is scanned in one pass, ending early once all its rules matched.
+        """
+        text, partial = truncate(text)
+        deadline = time.perf_counter() + PATTERN_TIME_BUDGET_MS / 1000.0
+        found = set()
+        for find, at, size in self._groups:
+            if not self._scan_group(find, at, size, text, found, deadline):
+                _count_scan_limit('over_budget')
+                partial = True
+                break
+        else:
+            for n, detect in self._detected:
+                if detect(text):
+                    found.add(n)
+        return [self.rules[n] for n in sorted(found)], partial
+
+    def scan(self, text):
+        spam_score = safe_score = 0.0
+        spam_rules = []
+        safe_rules = []
+        rules, partial = self.matched_rules(text)
+        for rule in rules:
+            if rule.group == 'spam':
+                spam_score += rule.weight
+                spam_rules.append(rule.id)
+            else:
+                safe_score += rule.weight
+                safe_rules.append(rule.id)
+        return PatternScore(spam_score, safe_score, spam_rules, safe_rules, partial)
+
+    def scan_batch(self, texts):
+        return [self.scan(t) for t in texts]
+
+    def predict(self, text):
+        """Rule-based (label, probability, PatternScore) used when no model is loaded."""
+        score = self.scan(text)
+        z = SCORE_SCALE * (score.spam_score - score.safe_score - SPAM_MARGIN)
+        prob = 1.0 / (1.0 + math.exp(-z))
+        return ('Spam' if prob >= 0.5 else 'Not Spam'), prob, score
+
+    def predict_batch(self, texts):
+        return [self.predict(t) for t in texts]
+
+
+class CategoryTagger:
+    """Multi-label tagger for MESSAGE_CATEGORIES that scans each message once.
+
+    The alternatives of every category are deduplicated and merged into one
+    trie-shaped regex. Each distinct term ends in an empty named group, so a
+    match maps straight to every category that lists the term (e.g. `update`
+    is both phishing and scam) and the longest term at a position wins.
+    """
+
+    def __init__(self, categories):
+        self.category_names = list(categories)
+        term_categories = {}
+        for category, patterns in categories.items():
+            for pattern in patterns:
+                parts = unwrap_alternation(pattern)
+                if parts is None or parts[0] != '\\b' or parts[2] != '\\b':
+                    # Not a \\b(?:...)\\b term list; keep the pattern as one opaque term
+                    branches = [pattern[4:] if pattern.startswith('(?i)') else pattern]
+                else:
+                    branches = parts[1]
+                for branch in branches:
+                    term_categories.setdefault(_branch_key(branch), []).append(category)
+        self.term_count = len(term_categories)
+
+        implied = self._nested_term_categories(term_categories)
+
+        self._tag_categories = {}
+        groups = {'trie': ([], []), 'exact': ([], []), 'raw': ([], [])}
+        for n, (key, cats) in enumerate(term_categories.items()):
+            tag = f't{n}'
+            cats = set(cats) | implied.get(key, set())
+            self._tag_categories[tag] = tuple(c for c in self.category_names if c in cats)
+            groups[key[0]][0].append(key[1])
+            groups[key[0]][1].append(tag)
+        parts = []
+        if groups['exact'][0]:
+            parts.append('(?-i:' + trie_pattern(*groups['exact']) + ')')
+        if groups['trie'][0]:
+            parts.append(trie_pattern(*groups['trie']))
+        parts.extend(f'(?:{branch})(?P<{tag}>)' for branch, tag in zip(*groups['raw']))
+        self.regex = re.compile('\\b(?:' + '|'.join(parts) + ')\\b', re.IGNORECASE)
+
+    @staticmethod
+    def _nested_term_categories(term_categories):
+        """Categories of shorter terms nested inside longer ones.
+
+        Only the longest term at a position is reported by the scan, so e.g.
+        `credit card` (phishing) also carries `credit` (financial).
+        """
+        samples = {}
+        for key in term_categories:
+            if key[0] != 'raw':
+                atoms = [a[:-1] if a.endswith('?') and not a.startswith('\\s') else a for a in key[1]]
+                text = ''.join(' ' if a.startswith('\\s') else '' if a == '\\b' else a.replace('\\', '') for a in atoms)
+                samples[key] = text.lower()
+        implied = {}
+        for outer, outer_text in samples.items():
+            for inner, inner_text in samples.items():
+                if inner is outer or inner_text not in outer_text or inner_text == outer_text:
+                    continue
+                inner_regex = re.compile('\\b' + ''.join(inner[1]) + '\\b', 0 if inner[0] == 'exact' else re.IGNORECASE)
+                if inner_regex.search(outer_text):
+                    implied.setdefault(outer, set()).update(term_categories[inner])
+        return implied
+
+    def matches(self, text):
+        """All category term matches in `text` as CategoryMatch(categories, start, end)."""
+        matches, _ = bounded_finditer(self.regex, text)
+        return [CategoryMatch(self._tag_categories[m.lastgroup], m.start(), m.end()) for m in matches]
+
+    def tag(self, text):
+        """{category: [[start, end], ...]} for every category found in `text`."""
+        found = {}
+        for match in self.matches(text):
+            for category in match.categories:
+                found.setdefault(category, []).append([match.start, match.end])
+        return {c: found[c] for c in self.category_names if c in found}
+
+    def tag_batch(self, texts):
+        return [self.tag(t) for t in texts]
+
+
+ENGINE = PatternEngine(
+    _build_rules('spam', SPAM_RULES, spam_patterns.SPAM_INDICATORS)
+    + _build_rules('safe', SAFE_RULES, spam_patterns.SAFE_INDICATORS),
+    DETECTORS,
+)
+
+scan = ENGINE.scan
+scan_batch = ENGINE.scan_batch
+predict = ENGINE.predict
+predict_batch = ENGINE.predict_batch
+
+TAGGER = CategoryTagger(spam_patterns.MESSAGE_CATEGORIES)
+
+tag_categories = TAGGER.tag
+tag_categories_batch = TAGGER.tag_batch
+
+
+def reference_scan(text, rules=None, detectors=None):
+    """PatternScore from searching each rule's original spam_patterns regex on its own."""
+    rules = ENGINE.rules if rules is None else rules
+    detectors = DETECTORS if detectors is None else detectors
+    text = text[:PATTERN_MAX_CHARS]
+    spam_score = safe_score = 0.0
+    spam_rules = []
+    safe_rules = []
+    for rule in rules:
+        detect = detectors.get(rule.id)
+        if not (detect(text) if detect else re.search(rule.pattern, text)):
+            continue
+        if rule.group == 'spam':
+            spam_score += rule.weight
+            spam_rules.append(rule.id)
+        else:
+            safe_score += rule.weight
+            safe_rules.append(rule.id)
+    return PatternScore(spam_score, safe_score, spam_rules, safe_rules, False)
+
+
+def _check(dataset):
+    """Compare the compiled engine with per-rule evaluation on `dataset`; True if they agree."""
+    import pandas as pd
+
+    texts = pd.read_csv(dataset)['text'].dropna().astype(str).tolist()
+    mismatches = 0
+    for text in texts:
+        got = scan(text)
+        want = reference_scan(text)
+        if got[:4] != want[:4]:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f'MISMATCH {text[:60]!r}: engine {got[:4]} != per-rule {want[:4]}')
+    print(f'{len(texts)} messages, {mismatches} mismatches between the engine and per-rule evaluation')
+    return mismatches == 0
+
+
+def _benchmark(dataset, repeat):
+    """Messages/second for rule scoring and category tagging on `dataset`."""
+    import pandas as pd
+
+    texts = pd.read_csv(dataset)['text'].dropna().astype(str).tolist()
+    naive = {
+        c: [re.compile(p, re.IGNORECASE) for p in patterns]
+        for c, patterns in spam_patterns.MESSAGE_CATEGORIES.items()
+    }
+
+    def naive_tag(text):
+        return {c: [[m.start(), m.end()] for r in regexes for m in r.finditer(text)] for c, regexes in naive.items()}
+
+    cases = [
+        ('rule scoring (compiled)', scan),
+        ('category tagging (compiled, one scan)', tag_categories),
+        ('category tagging (one regex per category)', naive_tag),
+    ]
+    print(f'{len(texts)} messages, {repeat} passes, {TAGGER.term_count} distinct category terms')
+    for name, fn in cases:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                fn(text)
+        elapsed = time.perf_counter() - start
+        print(f'{name:45s} {len(texts) * repeat / elapsed:10.0f} msg/s')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark (or check) the compiled spam pattern engine.')
+    parser.add_argument('--dataset', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SPAM_SMS.csv'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--check', action='store_true',
+                        help='only check that rule scores match evaluating each rule on its own')
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if _check(args.dataset) else 1)
+    _benchmark(args.dataset, args.repeat)
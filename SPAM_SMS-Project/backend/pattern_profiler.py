@@ -0,0 +1,134 @@
+"""
+Regex performance profiler for the rules in spam_patterns.py.
+Times every SPAM_INDICATORS, SAFE_INDICATORS and MESSAGE_CATEGORIES pattern on the
+dataset (per-message percentiles) and on generated adversarial inputs of growing
+length, and flags patterns whose matching cost grows worse than linearly.
+
+Usage:
+    python pattern_profiler.py [--dataset SPAM_SMS.csv] [--json report.json]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+import pattern_engine
+import spam_patterns
+
+# Input lengths for the growth test; the largest is twice the runtime scan limit
+GROWTH_SIZES = (500, 1000, 2000, 4000)
+# log-log slope above which a pattern is reported as super-linear
+SUPERLINEAR_SLOPE = 1.4
+# Ignore slopes measured on timings too small to be meaningful
+MIN_FLAG_SECONDS = 0.0005
+_GENERIC_SEEDS = ('www.', 'http://', 'php', '₱', 'free', 'ph-', 'a')
+
+
+def all_patterns():
+    """(pattern id, source) for every pattern in spam_patterns."""
+    out = [(r.id, r.pattern) for r in pattern_engine.ENGINE.rules]
+    for category, patterns in spam_patterns.MESSAGE_CATEGORIES.items():
+        for i, p in enumerate(patterns):
+            out.append((f'category.{category}[{i}]', p))
+    return out
+
+
+def pattern_seeds(pattern, limit=3):
+    """A few literal strings the pattern's alternatives match, used to build adversarial input."""
+    parts = pattern_engine.unwrap_alternation(pattern)
+    seeds = []
+    if parts is not None:
+        for branch in parts[1]:
+            text = pattern_engine.literal_text(branch)
+            if text:
+                seeds.append(text)
+            if len(seeds) >= limit:
+                break
+    return seeds
+
+
+def adversarial_inputs(seed, n):
+    """Inputs of length ~n that stress repeated prefixes, long runs and whitespace chains."""
+    reps = max(1, n // max(1, len(seed)))
+    return {
+        f'{seed!r} repeated': (seed * reps)[:n],
+        f'{seed!r} + spaces': (seed + ' ') * max(1, reps // 2),
+        f'{seed!r} + long run': seed + 'a' * n,
+        f'{seed!r} + whitespace chain': seed + ' \t' * (n // 2) + '!',
+    }
+
+
+def _time(fn, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def growth_slope(regex, make_input, sizes=GROWTH_SIZES):
+    """(log-log slope of scan time vs input length, seconds at the largest size)."""
+    times = [_time(lambda s=make_input(n): list(regex.finditer(s))) for n in sizes]
+    slope = float(np.polyfit(np.log(sizes), np.log(np.maximum(times, 1e-9)), 1)[0])
+    return slope, times[-1]
+
+
+def profile_dataset(regex, texts):
+    """Per-message scan time percentiles in microseconds."""
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        for _ in regex.finditer(text):
+            pass
+        samples.append((time.perf_counter() - start) * 1e6)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50_us': float(p50), 'p95_us': float(p95), 'p99_us': float(p99), 'max_us': float(max(samples))}
+
+
+def profile_pattern(pattern_id, source, texts):
+    regex = re.compile(source, re.IGNORECASE)
+    report = {'id': pattern_id, 'dataset': profile_dataset(regex, texts)}
+    worst = {'input': None, 'slope': 0.0, 'seconds_at_max': 0.0}
+    for seed in pattern_seeds(source) + list(_GENERIC_SEEDS):
+        for name in adversarial_inputs(seed, 1):
+            slope, seconds = growth_slope(regex, lambda n, seed=seed, name=name: adversarial_inputs(seed, n)[name])
+            if seconds >= MIN_FLAG_SECONDS and slope > worst['slope']:
+                worst = {'input': name, 'slope': slope, 'seconds_at_max': seconds}
+    report['adversarial'] = worst
+    report['superlinear'] = worst['slope'] > SUPERLINEAR_SLOPE
+    return report
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Profile spam_patterns regexes.')
+    parser.add_argument('--dataset', default=os.path.join(here, 'SPAM_SMS.csv'))
+    parser.add_argument('--json', help='Also write the full report to this file')
+    args = parser.parse_args()
+
+    import pandas as pd
+    texts = pd.read_csv(args.dataset)['text'].dropna().astype(str).tolist()
+
+    reports = [profile_pattern(pid, source, texts) for pid, source in all_patterns()]
+    print(f"{'pattern':34s} {'p50us':>7s} {'p95us':>7s} {'p99us':>7s} {'maxus':>8s}  {'slope':>5s}  worst adversarial input")
+    for r in reports:
+        d, a = r['dataset'], r['adversarial']
+        flag = '  SUPER-LINEAR' if r['superlinear'] else ''
+        print(f"{r['id']:34s} {d['p50_us']:7.1f} {d['p95_us']:7.1f} {d['p99_us']:7.1f} {d['max_us']:8.1f}  "
+              f"{a['slope']:5.2f}  {a['input'] or '-'}{flag}")
+    flagged = [r['id'] for r in reports if r['superlinear']]
+    print(f'\n{len(flagged)} of {len(reports)} patterns grow super-linearly: {", ".join(flagged) or "none"}')
+    print(f'Runtime guard: first {pattern_engine.PATTERN_MAX_CHARS} chars scanned, '
+          f'{pattern_engine.PATTERN_TIME_BUDGET_MS:g} ms budget per scan')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'patterns': reports, 'superlinear': flagged}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Content-addressed LRU/TTL cache for model predictions.
+Spam campaigns resend the same template to thousands of numbers, so predictions
+are keyed by a hash of the normalized message text and reused until they expire,
+fall out of the LRU, or the model artifacts change.
+"""
+import collections
+import hashlib
+import re
+import sys
+import threading
+import time
+
+DIGIT_RUN = re.compile(r'\d+')
+# Rough per-entry bookkeeping cost of the OrderedDict node and stored tuple
+_ENTRY_OVERHEAD = 160
+
+
+def normalize_text(text, mask_digits=False):
+    """Lowercase and collapse whitespace; optionally mask digit runs.
+
+    Without masking this matches what a lowercasing TF-IDF tokenizer sees, so two
+    texts with the same normalized form always get the same prediction. Masking
+    digits also merges messages that differ only in tracking codes or phone
+    numbers, trading a little fidelity for a much higher hit rate.
+    """
+    normalized = ' '.join(text.lower().split())
+    if mask_digits:
+        normalized = DIGIT_RUN.sub('0', normalized)
+    return normalized
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with TTL expiry, an entry cap and a memory cap.
+
+    Every lookup carries the version of the artifacts that produced the value;
+    when the version changes the whole cache is dropped.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=32 * 1024 * 1024, ttl=3600, mask_digits=False):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self.mask_digits = mask_digits
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def key(self, text):
+        return hashlib.blake2b(normalize_text(text, self.mask_digits).encode('utf-8'), digest_size=16).digest()
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key, version):
+        """Return the cached value for `key` or None."""
+        with self._lock:
+            self._check_version(version)
+            item = self._data.get(key)
+            if item is not None:
+                value, expires, size = item
+                if expires >= time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self._bytes -= size
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version):
+        size = sys.getsizeof(key) + sys.getsizeof(value) + _ENTRY_OVERHEAD
+        with self._lock:
+            self._check_version(version)
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'mask_digits': self.mask_digits,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version': self._version,
+            }
@@ -0,0 +1,232 @@
+"""
+Sender reputation index keyed on hashed_celphone_number.
+Keeps per-sender message counts, spam counts, a recency-decayed spam ratio and the
+carrier in parallel NumPy arrays (a few dozen bytes per sender), persists them as
+one .npz file and reloads it without unpickling.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Pseudo-counts pulling the smoothed ratio of senders with few messages towards 0.5
+PRIOR_WEIGHT = 2.0
+_UNKNOWN_CARRIER = ''
+
+
+def parse_timestamp(value):
+    """Epoch seconds for an ISO/dataset timestamp string, or now when missing or unparseable."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value:
+        try:
+            return datetime.fromisoformat(str(value).rstrip('Z')).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+def _logit(p):
+    p = min(max(p, 1e-6), 1 - 1e-6)
+    return math.log(p / (1 - p))
+
+
+class SenderReputation:
+    """Thread-safe reputation index for up to `max_senders` senders.
+
+    The spam ratio is recency-weighted: every message's weight halves each
+    `half_life_days`, so a sender that turns spammy (or stops) shifts quickly.
+    When full, the least recently seen tenth of the senders is evicted.
+    """
+
+    def __init__(self, max_senders=100000, half_life_days=30.0, fast_path_min_count=20,
+                 fast_path_min_ratio=0.95):
+        self.max_senders = int(max_senders)
+        self.tau = half_life_days * 86400.0 / math.log(2)
+        self.fast_path_min_count = fast_path_min_count
+        self.fast_path_min_ratio = fast_path_min_ratio
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._free = []
+        self._carriers = [_UNKNOWN_CARRIER]
+        self._carrier_ids = {_UNKNOWN_CARRIER: 0}
+        self._alloc(1024)
+        self.dirty = False
+
+    def _alloc(self, capacity):
+        def grow(arr, dtype):
+            out = np.zeros(capacity, dtype=dtype)
+            if arr is not None:
+                out[:len(arr)] = arr
+            return out
+        self.keys = grow(getattr(self, 'keys', None), object)
+        self.count = grow(getattr(self, 'count', None), np.int32)
+        self.spam = grow(getattr(self, 'spam', None), np.int32)
+        # Decayed spam and total weights as of `last_seen`
+        self.dspam = grow(getattr(self, 'dspam', None), np.float32)
+        self.dtotal = grow(getattr(self, 'dtotal', None), np.float32)
+        self.last_seen = grow(getattr(self, 'last_seen', None), np.float64)
+        self.carrier = grow(getattr(self, 'carrier', None), np.int16)
+        used = len(self._slots) + len(self._free)
+        self._free.extend(range(capacity - 1, used - 1, -1))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _carrier_id(self, carrier):
+        carrier = carrier or _UNKNOWN_CARRIER
+        cid = self._carrier_ids.get(carrier)
+        if cid is None:
+            cid = self._carrier_ids[carrier] = len(self._carriers)
+            self._carriers.append(carrier)
+        return cid
+
+    def _slot(self, sender):
+        slot = self._slots.get(sender)
+        if slot is None:
+            if len(self._slots) >= self.max_senders:
+                self._evict()
+            if not self._free:
+                self._alloc(min(2 * len(self.count), max(self.max_senders, 1024)))
+            slot = self._free.pop()
+            self._slots[sender] = slot
+            self.keys[slot] = sender
+            self.count[slot] = self.spam[slot] = 0
+            self.dspam[slot] = self.dtotal[slot] = 0.0
+            self.last_seen[slot] = 0.0
+            self.carrier[slot] = 0
+        return slot
+
+    def _evict(self):
+        slots = np.fromiter(self._slots.values(), dtype=np.intp, count=len(self._slots))
+        n = max(1, len(slots) // 10)
+        oldest = slots[np.argpartition(self.last_seen[slots], n - 1)[:n]]
+        for slot in oldest.tolist():
+            del self._slots[self.keys[slot]]
+            self.keys[slot] = None
+            self._free.append(slot)
+
+    def observe(self, sender, is_spam, carrier=None, timestamp=None):
+        """Record one scored message from `sender`."""
+        if not sender:
+            return
+        ts = parse_timestamp(timestamp)
+        with self._lock:
+            slot = self._slot(sender)
+            last = self.last_seen[slot]
+            if last:
+                # Decay earlier evidence to this message's time (never re-weight for out-of-order inputs)
+                decay = math.exp(-max(0.0, ts - last) / self.tau)
+                self.dspam[slot] *= decay
+                self.dtotal[slot] *= decay
+            self.dspam[slot] += 1.0 if is_spam else 0.0
+            self.dtotal[slot] += 1.0
+            self.count[slot] += 1
+            self.spam[slot] += 1 if is_spam else 0
+            self.last_seen[slot] = max(last, ts)
+            if carrier:
+                self.carrier[slot] = self._carrier_id(carrier)
+            self.dirty = True
+
+    def _record(self, slot, now):
+        count = int(self.count[slot])
+        # Decay the evidence from `last_seen` to `now`, so a sender that went quiet loses weight
+        decay = math.exp(-max(0.0, now - self.last_seen[slot]) / self.tau)
+        dspam = float(self.dspam[slot]) * decay
+        dtotal = float(self.dtotal[slot]) * decay
+        return {
+            'count': count,
+            'spam_ratio': int(self.spam[slot]) / count if count else 0.0,
+            'score': dspam / dtotal if dtotal else 0.0,
+            'weight': dtotal,
+            'smoothed_score': (dspam + 0.5 * PRIOR_WEIGHT) / (dtotal + PRIOR_WEIGHT),
+            'carrier': self._carriers[self.carrier[slot]] or None,
+            'last_seen': datetime.utcfromtimestamp(self.last_seen[slot]).isoformat() + 'Z',
+        }
+
+    def lookup(self, sender, now=None):
+        """Reputation of `sender` as of `now` (default: current time) as a dict, or None if unknown.
+
+        `weight` is the sender's message count decayed to `now`; `score` and
+        `smoothed_score` are computed from the decayed counts.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            slot = self._slots.get(sender)
+            return None if slot is None else self._record(slot, now)
+
+    def fast_verdict(self, reputation):
+        """'Spam' for senders with a long, recent, almost-all-spam record, else None.
+
+        The decayed `weight` must reach `fast_path_min_count`. Fast-path messages are
+        not observed, so a sender stays on the fast path only while recently
+        rescored messages keep that weight up; otherwise its next message is
+        scored in full.
+        """
+        if (reputation is not None
+                and reputation['weight'] >= self.fast_path_min_count
+                and reputation['spam_ratio'] >= self.fast_path_min_ratio
+                and reputation['score'] >= self.fast_path_min_ratio):
+            return 'Spam'
+        return None
+
+    @staticmethod
+    def log_odds_shift(reputation, weight):
+        """What adjust() adds to the log-odds of a text spam probability."""
+        if not weight or reputation is None:
+            return 0.0
+        return weight * _logit(reputation['smoothed_score'])
+
+    @staticmethod
+    def adjust(probability, reputation, weight):
+        """Blend a text spam probability with the sender's reputation as an extra log-odds feature."""
+        if not weight or reputation is None:
+            return probability
+        z = _logit(probability) + SenderReputation.log_odds_shift(reputation, weight)
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def save(self, path):
+        """Write the index to `path` (.npz) atomically."""
+        with self._lock:
+            slots = np.fromiter(self._slots.values(), dtype=np.intp, count=len(self._slots))
+            data = {
+                'keys': np.array([self.keys[s] for s in slots.tolist()], dtype=str),
+                'count': self.count[slots],
+                'spam': self.spam[slots],
+                'dspam': self.dspam[slots],
+                'dtotal': self.dtotal[slots],
+                'last_seen': self.last_seen[slots],
+                'carrier': self.carrier[slots],
+                'carriers': np.array(self._carriers, dtype=str),
+            }
+            self.dirty = False
+        tmp = f'{path}.tmp.npz'
+        np.savez(tmp, **data)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Replace the index contents with a file written by save()."""
+        with np.load(path, allow_pickle=False) as f:
+            data = {k: f[k] for k in f.files}
+        with self._lock:
+            n = len(data['keys'])
+            self._slots = {}
+            self._free = []
+            for name in ('keys', 'count', 'spam', 'dspam', 'dtotal', 'last_seen', 'carrier'):
+                setattr(self, name, None)
+            self._alloc(max(1024, n))
+            self.keys[:n] = data['keys'].tolist()
+            for name in ('count', 'spam', 'dspam', 'dtotal', 'last_seen', 'carrier'):
+                getattr(self, name)[:n] = data[name]
+            self._slots = dict(zip(self.keys[:n].tolist(), range(n)))
+            self._free = list(range(len(self.count) - 1, n - 1, -1))
+            self._carriers = data['carriers'].tolist() or [_UNKNOWN_CARRIER]
+            self._carrier_ids = {c: i for i, c in enumerate(self._carriers)}
+            self.dirty = False
+
+    def stats(self):
+        with self._lock:
+            return {'senders': len(self._slots), 'max_senders': self.max_senders, 'carriers': len(self._carriers) - 1}
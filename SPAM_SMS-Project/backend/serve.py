@@ -0,0 +1,248 @@
+"""
+Production entry point for the spam detection API.
+Artifacts are loaded once, then the app is served by waitress in one of two modes:
+
+- threads: a single process with a waitress thread pool (works everywhere).
+- prefork: the parent binds the port and forks WEB_WORKERS processes that each run
+  waitress on the shared socket. Model arrays loaded before the fork (memory-mapped
+  from the bundle) are shared copy-on-write, so workers add little memory and
+  throughput scales with cores. POSIX only; falls back to threads elsewhere.
+
+SIGTERM/SIGINT stop accepting connections and let in-flight requests finish for up
+to GRACEFUL_TIMEOUT seconds. In prefork mode SIGHUP reloads the model in every
+worker, and the parent respawns workers that die. Online learning needs a single
+process, so ONLINE_LEARNING=1 always uses threads mode; prefork workers keep sender
+reputation in memory and do not save it.
+
+Usage:
+    python serve.py [--mode prefork] [--workers 4] [--threads 4] [--port 5000]
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import _thread
+
+from waitress import create_server
+
+import app as api
+
+SERVE_MODE = os.environ.get('SERVE_MODE', 'threads')
+WEB_HOST = os.environ.get('HOST', '0.0.0.0')
+WEB_PORT = int(os.environ.get('PORT', 5000))
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+# Request threads per process; in threads mode this is the whole pool
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+# Kernel listen backlog (connections waiting to be accepted)
+WEB_BACKLOG = int(os.environ.get('WEB_BACKLOG', 1024))
+# Open connections per process before waitress stops accepting more
+WEB_CONNECTION_LIMIT = int(os.environ.get('WEB_CONNECTION_LIMIT', 100))
+GRACEFUL_TIMEOUT = float(os.environ.get('GRACEFUL_TIMEOUT', 30))
+# Workers that die within this many seconds of starting are not respawned in a tight loop
+RESPAWN_DELAY = 1.0
+# Signals the prefork parent handles; forked workers start with the default handlers
+FORK_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP) if hasattr(signal, 'SIGHUP') else ()
+
+
+def make_server(args, sock=None):
+    options = dict(
+        threads=args.threads,
+        backlog=args.backlog,
+        connection_limit=args.connection_limit,
+        ident='spam-sms',
+    )
+    if sock is not None:
+        return create_server(api.app, sockets=[sock], **options)
+    return create_server(api.app, host=args.host, port=args.port, **options)
+
+
+def busy(server):
+    """True while any connection has a request in progress or unsent output."""
+    try:
+        channels = list(server.active_channels.values())
+    except RuntimeError:
+        # Dict changed size while copying; treat as busy and check again
+        return True
+    dispatcher = server.task_dispatcher
+    return bool(dispatcher.queue) or any(ch.requests or ch.total_outbufs_len for ch in channels)
+
+
+def drain_and_stop(server, timeout):
+    """Stop accepting, wait up to `timeout` for in-flight requests, then end server.run()."""
+    server.accepting = False
+    deadline = time.monotonic() + timeout
+    while busy(server) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if busy(server):
+        api.app.logger.warning(f'Shutting down with requests still in flight after {timeout:g}s')
+    # server.run() catches KeyboardInterrupt and shuts the thread pool down
+    _thread.interrupt_main()
+
+
+def run_server(server, timeout):
+    """Run `server` in this process until SIGTERM/SIGINT, then drain gracefully."""
+    stopping = threading.Event()
+
+    def on_stop(signum, frame):
+        if not stopping.is_set():
+            stopping.set()
+            # drain_and_stop ends the server with a SIGINT, and a second Ctrl+C stops immediately
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            threading.Thread(target=drain_and_stop, args=(server, timeout), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    try:
+        server.run()
+    finally:
+        # Writes queued by the last requests still reach the history store
+        api.history_writer.close()
+        api.save_reputation()
+        api.stop_online_learner()
+
+
+def serve_threads(args):
+    server = make_server(args)
+    print(f'Serving on http://{args.host}:{server.effective_port} '
+          f'(threads mode, {args.threads} threads, pid {os.getpid()})')
+    if api.MODEL_WATCH_INTERVAL > 0:
+        api.artifact_watcher.start()
+    api.start_online_learner()
+    run_server(server, args.graceful_timeout)
+
+
+def worker_main(sock, args):
+    """Body of a forked worker; never returns."""
+    code = 0
+    try:
+        # Locks may have been held by parent threads at fork time
+        api._reload_lock = threading.Lock()
+        # The parent exports the bundle once; workers only read it
+        api.MODEL_BUNDLE_AUTOEXPORT = False
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=api.reload_on_change, daemon=True).start())
+        # Reputation is kept per worker and not saved; the parent's copy from startup stays on disk
+        api.SENDER_REPUTATION_PERSIST = False
+        run_server(make_server(args, sock), args.graceful_timeout)
+    except Exception:
+        api.app.logger.exception(f'Worker {os.getpid()} crashed')
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def serve_prefork(args):
+    sock = bind_socket(args.host, args.port, args.backlog)
+    # Objects allocated so far (model, vocabulary, compiled patterns) move to a
+    # permanent generation so the collector never touches, and so copies, their pages
+    gc.freeze()
+    workers = {}
+    stopping = threading.Event()
+
+    def spawn():
+        # Block stop/reload signals across the fork: a signal landing in the child before it
+        # resets the handlers would run the parent's on_stop/on_reload on its copy of `workers`
+        signal.pthread_sigmask(signal.SIG_BLOCK, FORK_SIGNALS)
+        try:
+            pid = os.fork()
+        except BaseException:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, FORK_SIGNALS)
+            raise
+        if pid == 0:
+            for signum in FORK_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, FORK_SIGNALS)
+            worker_main(sock, args)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, FORK_SIGNALS)
+        workers[pid] = time.monotonic()
+
+    def signal_workers(signum):
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def on_stop(signum, frame):
+        stopping.set()
+        signal_workers(signal.SIGTERM)
+
+    def on_reload():
+        # Reload here first (exporting a fresh bundle once), then let every worker load it
+        api.reload_on_change()
+        signal_workers(signal.SIGHUP)
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=on_reload, daemon=True).start())
+
+    for _ in range(args.workers):
+        spawn()
+    print(f'Serving on http://{args.host}:{sock.getsockname()[1]} '
+          f'(prefork mode, {args.workers} workers x {args.threads} threads, parent pid {os.getpid()})')
+    if api.MODEL_WATCH_INTERVAL > 0:
+        api.artifact_watcher.on_change = on_reload
+        api.artifact_watcher.start()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if started is None or stopping.is_set():
+            continue
+        api.app.logger.error(f'Worker {pid} exited with status {status}; respawning')
+        if time.monotonic() - started < RESPAWN_DELAY:
+            time.sleep(RESPAWN_DELAY)
+        if not stopping.is_set():
+            spawn()
+    api.artifact_watcher.stop()
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the spam detection API with waitress.')
+    parser.add_argument('--mode', choices=('threads', 'prefork'), default=SERVE_MODE)
+    parser.add_argument('--host', default=WEB_HOST)
+    parser.add_argument('--port', type=int, default=WEB_PORT)
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS, help='Worker processes (prefork mode)')
+    parser.add_argument('--threads', type=int, default=WEB_THREADS, help='Request threads per process')
+    parser.add_argument('--backlog', type=int, default=WEB_BACKLOG)
+    parser.add_argument('--connection-limit', type=int, default=WEB_CONNECTION_LIMIT)
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT)
+    args = parser.parse_args()
+
+    api.prepare_artifacts()
+    if args.mode == 'prefork' and not hasattr(os, 'fork'):
+        print('prefork mode needs os.fork(); falling back to threads mode')
+        args.mode = 'threads'
+    if args.mode == 'prefork' and api.ONLINE_LEARNING:
+        # Workers would each learn from part of the feedback and overwrite one snapshot
+        print('Online learning runs in a single process; falling back to threads mode')
+        args.mode = 'threads'
+    if args.mode == 'prefork':
+        serve_prefork(args)
+    else:
+        serve_threads(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,39 +30,17 @@ SPAM_INDICATORS = [
 
 # Safe message indicators
 SAFE_INDICATORS = [
-    # Personal communications
-    r'(?i)\b(?:hi\b|hello\b|hey\b|thanks\b|thank you\b|please\b|mom\b|dad\b|ate\b|kuya\b|sir\b|ma\'am\b)\b',
+    # Common in personal messages
+    r'(?i)\b(?:hi\b|hello\b|hey\b|thanks\b|thank you\b|please\b|mom\b|dad\b|ate\b|kuya\b|sir\b|ma\'am\b|miss\b|mister\b|mr\.?\b|mrs\.?\b|ms\.?\b|dr\.?\b|prof\.?\b|atty\.?\b)\b',
     
     # Common in legitimate notifications
-    r'(?i)\b(?:your\s+order|delivered|received|payment\s+of|receipt|confirmation|reference\s+number|tracking\s+number)\b',
+    r'(?i)\b(?:your\s+order|delivered|received|payment\s+of|receipt|confirmation|reference\s+number|tracking\s+number|order\s+number|transaction\s+id|transaction\s+number|transaction\s+reference)\b',
     
     # Common personal phrases
-    r'(?i)\b(?:can you\b|could you\b|would you\b|will you\b|let me know\b|get back to you\b|talk to you\b)\b'
-]
-
-# Categories for better classification
-MESSAGE_CATEGORIES = {
-    'financial': [
-        r'\b(?:loan|credit|debt|refinance|mortgage|payday|investment|stock|trading|bitcoin|crypto|forex|binary|option|trading|stock|share|market|fund|money|cash|dollar|euro|pound|peso|php|usd|gbp|eur|income|revenue|profit|rich|wealth|million|billion)\b'
-    ],
-    'phishing': [
-        r'\b(?:verify|confirm|update|account|login|password|username|id|pin|ssn|social security|credit card|bank account|gcash|paymaya|bpi|bdo|metrobank|security code|verification code|otp|one time password)\b'
-    ],
-    'scam': [
-        r'\b(?:scam|fraud|fake|phishing|hack|hacked|compromise|stolen|breach|leak|leaked|exposed|expose|steal|stealing|stole|stolen|hijack|hijacked|malware|virus|trojan|ransomware|spyware|adware|keylogger|rootkit|backdoor|exploit|vulnerability|patch|update|upgrade|security|privacy|secure|protect|protection|safe|safety|trust|trusted|verified|legit|legitimate|official|real|genuine|authentic|authorized|certified|licensed|registered|guaranteed|warranty|warrantied|money back|refund|return|exchange|replacement)\b'
-    ]
-}
-
-# Safe message indicators
-SAFE_INDICATORS = [
-    # Common in personal messages
-    r'\b(?:hi\b|hello\b|hey\b|thanks\b|thank you\b|please\b|can you\b|could you\b|would you\b|will you\b|mom\b|dad\b|ate\b|kuya\b|sir\b|ma\'am\b|miss\b|mister\b|mr\.?\b|mrs\.?\b|ms\.?\b|dr\.?\b|prof\.?\b|atty\.?\b)\b',
-    
-    # Common in legitimate notifications
-    r'\b(?:your\s+order|delivered|received|payment\s+of|receipt|confirmation|reference\s+number|tracking\s+number|order\s+number|transaction\s+id|transaction\s+number|transaction\s+reference)\b',
+    r'(?i)\b(?:can you\b|could you\b|would you\b|will you\b|let me know\b|get back to you\b|talk to you\b)\b',
     
     # Common in personal transactions
-    r'\b(?:lunch|dinner|breakfast|merienda|snack|food|eat|restaurant|cafe|karinderya|carinderia|kainan|tambayan|tambay|grocery|groceries|shopping|market|palengke|mall|department store|supermarket|convenience store|sari-sari store|tindahan|bakery|bakeshop|baker|baker\'s|bakeries|bakerys|bakeryshop|bakeryshops|bakery shop|bakery shops|bakery store|bakery stores|bakery outlet|bakery outlets|bakery house|bakery houses|bakery cafe|bakery cafes|bakery restaurant|bakery restaurants|bakery bakeshop|bakery bakeshops|bakery and cafe|bakery and cafes|bakery and restaurant|bakery and restaurants|bakery and bakeshop|bakery and bakeshops|bakery, cafe|bakery, cafes|bakery, restaurant|bakery, restaurants|bakery, bakeshop|bakery, bakeshops|bakery & cafe|bakery & cafes|bakery & restaurant|bakery & restaurants|bakery & bakeshop|bakery & bakeshops|bakery/cafe|bakery/restaurant|bakery/bakeshop|bakery\s*[&, ]\s*cafe|bakery\s*[&, ]\s*restaurant|bakery\s*[&, ]\s*bakeshop)\b'
+    r'(?i)\b(?:lunch|dinner|breakfast|merienda|snack|food|eat|restaurant|cafe|karinderya|carinderia|kainan|tambayan|tambay|grocery|groceries|shopping|market|palengke|mall|department store|supermarket|convenience store|sari-sari store|tindahan|bakery|bakeshop|baker|baker\'s|bakeries|bakerys|bakeryshop|bakeryshops|bakery shop|bakery shops|bakery store|bakery stores|bakery outlet|bakery outlets|bakery house|bakery houses|bakery cafe|bakery cafes|bakery restaurant|bakery restaurants|bakery bakeshop|bakery bakeshops|bakery and cafe|bakery and cafes|bakery and restaurant|bakery and restaurants|bakery and bakeshop|bakery and bakeshops|bakery, cafe|bakery, cafes|bakery, restaurant|bakery, restaurants|bakery, bakeshop|bakery, bakeshops|bakery & cafe|bakery & cafes|bakery & restaurant|bakery & restaurants|bakery & bakeshop|bakery & bakeshops|bakery/cafe|bakery/restaurant|bakery/bakeshop|bakery\s*[&, ]\s*cafe|bakery\s*[&, ]\s*restaurant|bakery\s*[&, ]\s*bakeshop)\b'
 ]
 
 # Categories for better classification
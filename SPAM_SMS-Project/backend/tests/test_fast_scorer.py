@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import MultinomialNB
+
+import fast_scorer
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SPAM_SMS.csv')
+TOL = 1e-9
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    texts = pd.read_csv(DATASET)['text'].dropna().astype(str).tolist()
+    labels = [any(k in t.lower() for k in fast_scorer._PARITY_KEYWORDS) for t in texts]
+    return texts, labels
+
+
+@pytest.mark.parametrize('params', fast_scorer.PARITY_CONFIGS, ids=str)
+def test_parity_with_predict_proba(dataset, params):
+    texts, labels = dataset
+    vectorizer = TfidfVectorizer(**params)
+    model = LogisticRegression(max_iter=1000).fit(vectorizer.fit_transform(texts), labels)
+    diff, worst, ok = fast_scorer.check_parity(model, vectorizer, texts, TOL)
+    assert ok and diff <= TOL, f'max |diff| {diff:.3e} at row {worst}'
+
+
+def test_multinomial_nb_falls_back_to_sklearn(dataset):
+    texts, labels = dataset
+    vectorizer = TfidfVectorizer()
+    model = MultinomialNB().fit(vectorizer.fit_transform(texts), labels)
+    assert fast_scorer.compile_scorer(model, vectorizer) is None
+    with pytest.raises(ValueError):
+        fast_scorer.check_parity(model, vectorizer, texts)
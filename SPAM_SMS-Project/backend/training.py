@@ -0,0 +1,243 @@
+"""
+Training pipeline for the serving model.
+Reads the dataset once, tokenizes it into a term-count matrix that is cached on disk
+as .npz (keyed by a hash of the texts and the tokenizer settings), then runs a
+cross-validated grid over TF-IDF weighting and classifier settings in parallel and
+writes the best model as the .pkl artifacts (and model bundle) app.py serves.
+Repeat runs on the same data reuse the cached matrices instead of re-tokenizing.
+
+IDF weights are fit inside each CV fold, so only the vocabulary is shared across folds.
+
+Usage:
+    python training.py [--dataset SPAM_SMS.csv] [--jobs -1] [--folds 5]
+    python training.py --quick          # default settings only, no grid search
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATASET = os.path.join(HERE, 'SPAM_SMS.csv')
+FEATURE_CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', os.path.join(HERE, 'feature_cache'))
+CACHE_FORMAT = 1
+
+TEXT_COLUMNS = ('text', 'message', 'sms', 'msg', 'message_text', 'v2')
+LABEL_COLUMNS = ('label', 'class', 'target', 'v1')
+SPAM_VALUES = ('spam', '1', 'true', 'yes')
+# Keyword heuristic for synthesizing labels on an unlabeled dataset (--labels keywords)
+FALLBACK_KEYWORDS = [
+    'win', 'free', 'prize', 'cash', 'reward', 'claim', 'promo', 'congratulations', 'loan', 'click', 'won',
+    'urgent', 'voucher', 'congrats',
+]
+
+# Tokenizer settings; each combination is one cached count matrix
+DEFAULT_TOKENIZER = {'stop_words': 'english', 'ngram_range': (1, 1), 'min_df': 1, 'max_features': 20000}
+TOKENIZER_GRID = {
+    'stop_words': ['english'],
+    'ngram_range': [(1, 1), (1, 2)],
+    'min_df': [1, 2],
+    'max_features': [20000],
+}
+# TF-IDF and classifier settings searched on top of every count matrix
+DEFAULT_MODEL = {'tfidf__sublinear_tf': False, 'clf': LogisticRegression(max_iter=1000), 'clf__C': 1.0}
+MODEL_GRID = [
+    {'tfidf__sublinear_tf': [False, True], 'clf': [LogisticRegression(max_iter=1000)], 'clf__C': [0.3, 1.0, 3.0, 10.0]},
+    {'tfidf__sublinear_tf': [False, True], 'clf': [MultinomialNB()], 'clf__alpha': [0.03, 0.1, 0.3, 1.0]},
+]
+
+
+def find_column(df, names, fallback):
+    for c in df.columns:
+        if c.lower() in names:
+            return c
+    return fallback
+
+
+def load_dataset(path, labels='auto'):
+    """(texts, labels as 'Spam'/'Not Spam', label source) from a CSV.
+
+    `labels` is 'auto' (the label column when it has both classes, else the rule
+    engine), 'column', 'rules' or 'keywords'.
+    """
+    try:
+        df = pd.read_csv(path)
+    except UnicodeDecodeError:
+        # The UCI SMS Spam Collection (v1/v2 columns) ships as latin-1
+        df = pd.read_csv(path, encoding='latin-1')
+    text_col = find_column(df, TEXT_COLUMNS, df.columns[1] if len(df.columns) > 1 else df.columns[0])
+    label_col = find_column(df, LABEL_COLUMNS, None)
+    df = df.dropna(subset=[text_col])
+    texts = df[text_col].astype(str).tolist()
+
+    if labels in ('auto', 'column') and label_col is not None:
+        y = ['Spam' if str(v).strip().lower() in SPAM_VALUES else 'Not Spam' for v in df[label_col]]
+        if len(set(y)) == 2 or labels == 'column':
+            return texts, y, f'column {label_col!r}'
+        print(f'Label column {label_col!r} has a single class; labeling with the rule engine instead')
+    elif labels == 'column':
+        raise SystemExit(f'{path} has no label column (looked for {", ".join(LABEL_COLUMNS)})')
+    if labels == 'keywords':
+        y = ['Spam' if any(k in t.lower() for k in FALLBACK_KEYWORDS) else 'Not Spam' for t in texts]
+        return texts, y, 'keyword heuristic'
+    import pattern_engine
+    y = [label for label, _, _ in pattern_engine.predict_batch(texts)]
+    return texts, y, 'rule engine'
+
+
+def tokenizer_key(texts, params):
+    h = hashlib.sha256()
+    h.update(json.dumps({'format': CACHE_FORMAT, 'params': params}, sort_keys=True).encode('utf-8'))
+    for t in texts:
+        h.update(t.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()[:16]
+
+
+def count_matrix(texts, params, cache_dir=FEATURE_CACHE_DIR):
+    """(CSR term counts, vocabulary terms, cache hit) for `texts` under tokenizer `params`."""
+    path = os.path.join(cache_dir, f'counts-{tokenizer_key(texts, params)}.npz') if cache_dir else None
+    if path and os.path.exists(path):
+        with np.load(path, allow_pickle=False) as f:
+            X = sp.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+            return X, f['terms'].tolist(), True
+    vec = CountVectorizer(**params)
+    X = vec.fit_transform(texts).tocsr()
+    terms = [None] * len(vec.vocabulary_)
+    for term, idx in vec.vocabulary_.items():
+        terms[idx] = term
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{path}.tmp.npz'
+        np.savez(tmp, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+                 terms=np.array(terms, dtype=str))
+        os.replace(tmp, path)
+    return X, terms, False
+
+
+def pipeline():
+    return Pipeline([('tfidf', TfidfTransformer()), ('clf', LogisticRegression(max_iter=1000))])
+
+
+def serving_vectorizer(tokenizer, terms, tfidf):
+    """TfidfVectorizer equivalent to the cached counts followed by the fitted TfidfTransformer."""
+    params = dict(tokenizer)
+    params.update(norm=tfidf.norm, use_idf=tfidf.use_idf, smooth_idf=tfidf.smooth_idf, sublinear_tf=tfidf.sublinear_tf)
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = dict(zip(terms, range(len(terms))))
+    vectorizer.fixed_vocabulary_ = False
+    if tfidf.use_idf:
+        vectorizer.idf_ = tfidf.idf_
+    return vectorizer
+
+
+def _grid(spec):
+    keys = list(spec)
+    return [dict(zip(keys, values)) for values in itertools.product(*(spec[k] for k in keys))]
+
+
+def describe(params):
+    return {k: (type(v).__name__ if k == 'clf' else list(v) if isinstance(v, tuple) else v) for k, v in params.items()}
+
+
+def train(texts, labels, search=True, folds=5, jobs=-1, scoring='f1_macro', cache_dir=FEATURE_CACHE_DIR, log=print):
+    """Fit the best (model, vectorizer) for `texts`/`labels` and return them with a report dict.
+
+    With `search` off only the default settings are fit; `folds` < 2 skips cross-validation.
+    """
+    y = np.asarray(labels)
+    min_class = min(np.unique(y, return_counts=True)[1]) if len(set(labels)) == 2 else 0
+    requested_folds = folds
+    folds = min(folds, min_class)
+    tokenizers = _grid(TOKENIZER_GRID) if search else [DEFAULT_TOKENIZER]
+    report = {'examples': len(texts), 'spam': int((y == 'Spam').sum()), 'scoring': scoring, 'folds': folds,
+              'candidates': []}
+    if min_class == 0:
+        raise ValueError('Training labels contain a single class')
+
+    best = None
+    for tokenizer in tokenizers:
+        t0 = time.perf_counter()
+        X, terms, hit = count_matrix(texts, tokenizer, cache_dir)
+        log(f"Counts {describe(tokenizer)}: {X.shape[1]} terms "
+            f"({'cached' if hit else 'tokenized'} in {time.perf_counter() - t0:.2f}s)")
+        if folds >= 2:
+            grid = MODEL_GRID if search else [{k: [v] for k, v in DEFAULT_MODEL.items()}]
+            cv = GridSearchCV(pipeline(), grid, scoring=scoring, n_jobs=jobs, refit=False,
+                              cv=StratifiedKFold(folds, shuffle=True, random_state=42))
+            cv.fit(X, y)
+            results = cv.cv_results_
+            for params, mean, std in zip(results['params'], results['mean_test_score'], results['std_test_score']):
+                report['candidates'].append({'tokenizer': describe(tokenizer), 'model': describe(params),
+                                             'score': float(mean), 'std': float(std)})
+                if best is None or mean > best[0]:
+                    best = (float(mean), tokenizer, params, X, terms)
+        elif best is None:
+            if requested_folds >= 2:
+                log(f'Too few examples of one class for {requested_folds}-fold CV; fitting the default settings')
+            best = (None, tokenizer, DEFAULT_MODEL, X, terms)
+
+    score, tokenizer, params, X, terms = best
+    params = dict(params, clf=clone(params['clf']))
+    final = pipeline().set_params(**params)
+    final.fit(X, y)
+    model = final.named_steps['clf']
+    vectorizer = serving_vectorizer(tokenizer, terms, final.named_steps['tfidf'])
+    report['best'] = {'tokenizer': describe(tokenizer), 'model': describe(params), 'score': score}
+    report['candidates'].sort(key=lambda c: c['score'], reverse=True)
+    return model, vectorizer, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the spam model and write the serving artifacts.')
+    parser.add_argument('--dataset', default=DEFAULT_DATASET)
+    parser.add_argument('--labels', choices=('auto', 'column', 'rules', 'keywords'), default='auto',
+                        help='Label source (auto: label column if it has both classes, else the rule engine)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=-1, help='Parallel CV jobs (-1: all cores)')
+    parser.add_argument('--scoring', default='f1_macro')
+    parser.add_argument('--quick', action='store_true', help='Default settings only, no grid search')
+    parser.add_argument('--cache-dir', default=FEATURE_CACHE_DIR, help="Count matrix cache ('' disables)")
+    parser.add_argument('--report', help='Also write the CV report as JSON here')
+    parser.add_argument('--dry-run', action='store_true', help='Search and report without writing artifacts')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    texts, labels, source = load_dataset(args.dataset, args.labels)
+    print(f"Loaded {len(texts)} messages from {args.dataset}; labels from {source} "
+          f"({labels.count('Spam')} spam)")
+    model, vectorizer, report = train(texts, labels, search=not args.quick, folds=args.folds, jobs=args.jobs,
+                                      scoring=args.scoring, cache_dir=args.cache_dir)
+    report.update(dataset=os.path.abspath(args.dataset), label_source=source)
+    print(f"\nTop candidates ({report['scoring']}, {report['folds']}-fold CV):")
+    for c in report['candidates'][:5]:
+        print(f"  {c['score']:.4f} ±{c['std']:.4f}  {c['tokenizer']}  {c['model']}")
+    print(f"Best: {report['best']}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    if not args.dry_run:
+        import artifact_store
+        model_file, vect_file = artifact_store.save_trained_artifacts(model, vectorizer, training={
+            k: report[k] for k in ('dataset', 'label_source', 'examples', 'spam', 'scoring', 'folds', 'best')
+        })
+        print(f'Saved model to {model_file} and vectorizer to {vect_file}')
+    print(f'Done in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
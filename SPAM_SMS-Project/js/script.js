@@ -17,7 +17,17 @@ function showResult(isSpam, prob, raw){
   labelEl.textContent = isSpam ? 'Spam' : 'Not Spam';
   labelEl.className = 'label ' + (isSpam ? 'spam' : 'ham');
   probEl.textContent = `Confidence: ${Math.round(prob*100)}%`;
-  explainEl.textContent = raw?.message ? raw.message : '';
+  explainEl.textContent = raw?.explanation ? describeExplanation(raw.explanation) : (raw?.message ? raw.message : '');
+}
+
+function describeExplanation(exp){
+  const terms = list => (list || []).map(t => t.token).join(', ');
+  const parts = [];
+  if(exp.spam?.length) parts.push('Spam signals: ' + terms(exp.spam));
+  if(exp.ham?.length) parts.push('Safe signals: ' + terms(exp.ham));
+  const rules = [...(exp.rules?.spam || []), ...(exp.rules?.safe || [])];
+  if(rules.length) parts.push('Rules: ' + rules.join(', '));
+  return parts.join(' | ');
 }
 
 async function checkSms(){
@@ -34,7 +44,7 @@ async function checkSms(){
     const res = await fetch('http://127.0.0.1:5000/predict', {
       method: 'POST',
       headers: {'Content-Type':'application/json'},
-      body: JSON.stringify({text})
+      body: JSON.stringify({text, explain: true})
     });
 
     if(!res.ok){